@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""Compares the parallel chunked sort with pandas' single-threaded mergesort.
+
+    python benchmarks/sort_benchmark.py                     # 10M and 100M rows of each dtype
+    python benchmarks/sort_benchmark.py --rows 10000000 --dtypes int,str --workers 8
+
+100M-row string columns need a lot of memory (tens of GB); pick dtypes and sizes to suit the machine.
+Every result is checked to be identical to sort_values(kind='mergesort').
+"""
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from dfbrowse.parallel_sort import stable_order # noqa: E402
+
+
+def make_column(dtype, rows, rng):
+    if dtype == 'int':
+        return pd.Series(rng.integers(0, rows // 10 + 1, rows))
+    if dtype == 'float':
+        values = rng.random(rows)
+        values[rng.random(rows) < 0.01] = np.nan
+        return pd.Series(values)
+    if dtype == 'str':
+        words = np.array(['w{:07d}'.format(i) for i in range(min(rows, 1_000_000))], dtype=object)
+        return pd.Series(words[rng.integers(0, len(words), rows)])
+    if dtype == 'datetime':
+        return pd.Series(pd.to_datetime(rng.integers(0, 10**9, rows), unit='s'))
+    raise ValueError('unknown dtype ' + dtype)
+
+
+def best_of(repeat, func):
+    times = list()
+    for _ in range(repeat):
+        start = timeit.default_timer()
+        result = func()
+        times.append(timeit.default_timer() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', default='10000000,100000000', help='comma-separated row counts')
+    parser.add_argument('--dtypes', default='int,float,str,datetime', help='comma-separated: int,float,str,datetime')
+    parser.add_argument('--workers', type=int, default=None, help='threads for the parallel sort (default: all cores)')
+    parser.add_argument('--repeat', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print('{:>12} {:>9} {:>11} {:>11} {:>8}'.format('rows', 'dtype', 'mergesort', 'parallel', 'speedup'))
+    for rows in [int(r) for r in args.rows.split(',')]:
+        for dtype in args.dtypes.split(','):
+            column = make_column(dtype, rows, rng)
+            serial_time, expected = best_of(args.repeat, lambda: column.reset_index(drop=True).sort_values(
+                kind='mergesort', na_position='last').index.to_numpy())
+            parallel_time, got = best_of(args.repeat, lambda: stable_order(column, max_workers=args.workers))
+            assert np.array_equal(expected, got), 'parallel sort differs from mergesort for ' + dtype
+            print('{:>12,} {:>9} {:>10.2f}s {:>10.2f}s {:>7.1f}x'.format(
+                rows, dtype, serial_time, parallel_time, serial_time / parallel_time))
+            del column, expected, got
+
+
+if __name__ == '__main__':
+    main()
@@ -1,2 +1,3 @@
 from dfbrowse.dataframe_browser import browse
 from dfbrowse.dataframe_browser import browse_dir
+from dfbrowse.dataframe_browser import browse_csv
@@ -0,0 +1,85 @@
+# long-running work that shouldn't freeze the UI.
+#
+# A BackgroundTask runs a function on a daemon thread. The function receives
+# the task and should call task.report_progress() every so often; that is
+# also where cancellation takes effect. Completion and progress callbacks are
+# handed to a dispatch function, which the UI uses to get them run on its own
+# thread.
+
+import threading
+import timeit
+
+from .gui_debug import print
+
+
+class Cancelled(Exception):
+    pass
+
+
+class BackgroundTask(object):
+    PROGRESS_INTERVAL = 0.1 # seconds between progress callbacks
+
+    def __init__(self, name, func, on_done, on_progress=None, on_error=None, dispatch=lambda f: f()):
+        self.name = name
+        self._func = func
+        self._on_done = on_done
+        self._on_progress = on_progress
+        self._on_error = on_error
+        self._dispatch = dispatch
+        self._cancel = threading.Event()
+        self.progress = 0
+        self.finished = False
+        self._start_time = None
+        self._last_progress_time = 0.0
+        self._thread = None
+
+    def start(self):
+        self._start_time = timeit.default_timer()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        """Requests cancellation. The function stops at its next report_progress, and no callbacks are made."""
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def elapsed(self):
+        return timeit.default_timer() - self._start_time if self._start_time else 0.0
+
+    @property
+    def rate(self):
+        """Progress units per second."""
+        return self.progress / self.elapsed if self.elapsed > 0 else 0.0
+
+    def report_progress(self, progress):
+        """Called by the running function. Raises Cancelled if the task has been cancelled."""
+        if self._cancel.is_set():
+            raise Cancelled()
+        self.progress = progress
+        now = timeit.default_timer()
+        if self._on_progress and now - self._last_progress_time >= BackgroundTask.PROGRESS_INTERVAL:
+            self._last_progress_time = now
+            self._dispatch(self._on_progress)
+
+    def _run(self):
+        if self.cancelled: # superseded before it even got going
+            return
+        try:
+            result = self._func(self)
+        except Cancelled:
+            print('task cancelled:', self.name)
+            return
+        except Exception as e:
+            print('task failed:', self.name, e)
+            self.finished = True
+            if self._on_error and not self.cancelled:
+                self._dispatch(lambda e=e: self._on_error(e)) # e is unbound once the except block ends
+            return
+        self.finished = True
+        if not self.cancelled:
+            self._dispatch(lambda: self._on_done(result))
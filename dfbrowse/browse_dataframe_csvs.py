@@ -6,8 +6,12 @@ import dfbrowse.dataframe_browser_functions
 import IPython
 
 if __name__ == '__main__':
+    import os
     import sys
-    browser = dfbrowse.browse_dir(sys.argv[1])
+    if os.path.isfile(sys.argv[1]):
+        browser = dfbrowse.browse_csv(sys.argv[1])
+    else:
+        browser = dfbrowse.browse_dir(sys.argv[1])
     print('')
     print('    ****** Thanks for using the dataframe browser! ******')
     print('    The browser has spawned an IPython shell that will allow you to interact freely')
@@ -0,0 +1,93 @@
+# one memory budget for the formatted strings that every browser caches for display.
+#
+# Each column a browser has shown keeps a DataframeColumnSegmentCache of its
+# formatted strings, and a session that tabs through hundreds of columns over
+# dozens of browsers would otherwise keep every one of them. The cache manager
+# knows every column cache in the process and when each was last rendered.
+# When the strings they hold go over its budget, it evicts the least recently
+# rendered: first whole caches that aren't on screen, then the segments that
+# on-screen columns keep besides the one they are showing. Which caches are on
+# screen is passed in by the view that shows them, and their current segments
+# are never evicted, however long ago they were drawn.
+#
+# Caches are held weakly, so a browser that goes away takes its caches with it.
+# Caches copied for a forked browser share their strings until one of them
+# changes, and shared strings are only counted once.
+
+import timeit
+import weakref
+
+from .gui_debug import print
+
+DEFAULT_MAX_BYTES = 256 * 1024**2
+
+
+class CacheManager(object):
+    """Tracks the bytes held by column segment caches, and evicts the least recently rendered to stay in budget.
+
+    Caches must provide segments_held(), a list of (strings, nbytes), and evict(keep_current), which drops
+    their strings - all but the current segment's, if keep_current - and returns how many bytes that freed.
+    Only used from the UI thread."""
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.evicted_bytes = 0
+        self._last_rendered = weakref.WeakKeyDictionary() # cache -> timeit time it was last rendered, or 0
+
+    def register(self, cache):
+        if cache not in self._last_rendered:
+            self._last_rendered[cache] = 0.0
+
+    def rendered(self, cache):
+        self._last_rendered[cache] = timeit.default_timer()
+
+    @staticmethod
+    def caches_nbytes(caches):
+        """The bytes held by caches, counting strings shared between them once."""
+        seen = set()
+        total = 0
+        for cache in caches:
+            for strings, nbytes in cache.segments_held():
+                if id(strings) not in seen:
+                    seen.add(id(strings))
+                    total += nbytes
+        return total
+
+    @property
+    def nbytes(self):
+        return self.caches_nbytes(list(self._last_rendered.keys()))
+
+    def _by_last_rendered(self):
+        """(cache, seconds since it was rendered) for every cache, least recently rendered first."""
+        now = timeit.default_timer()
+        return sorted(((cache, now - when) for cache, when in list(self._last_rendered.items())),
+                      key=lambda item: -item[1])
+
+    def available_bytes(self, cache, showing=()):
+        """How many bytes cache may hold - all but what the other caches on screen hold, since the rest can be evicted."""
+        return self.max_bytes - self.caches_nbytes([other for other in showing if other is not cache])
+
+    def enforce(self, keep=None, showing=()):
+        """Evicts the least recently rendered strings until the caches are within budget.
+
+        showing is the caches on screen, and keep the cache being filled, whose current segment is about to be
+        drawn. Their current segments are never evicted."""
+        total = self.nbytes
+        if total <= self.max_bytes:
+            return
+        start = total
+        on_screen = set(showing) | ({keep} if keep is not None else set())
+        caches = self._by_last_rendered()
+        for cache, idle in caches: # caches that aren't on screen go entirely
+            if total <= self.max_bytes:
+                break
+            if cache not in on_screen:
+                total -= cache.evict(keep_current=False)
+        for cache, idle in caches: # then the segments that on-screen columns keep for scrolling
+            if total <= self.max_bytes:
+                break
+            total -= cache.evict(keep_current=True)
+        self.evicted_bytes += start - total
+        print('evicted', start - total, 'bytes of cached strings, leaving', total, 'of', self.max_bytes)
+
+
+display_cache_manager = CacheManager()
@@ -1,29 +1,17 @@
 # chunk search utils
 
-# from gui_debug import *
-
-def not_at_end(lengthable, position, down):
-    return position < len(lengthable) if down else position > 0
+import numpy as np
+import pandas as pd
 
+from .column_formatting import is_numeric
 
-def get_next_chunk(sliceable, start_position, chunk_size, down):
-    """includes start_position, of size chunk_size"""
-    if not down:
-        chunk_beg = max(0, start_position - chunk_size + 1)
-        # print('yielding chunk upwards from ', chunk_beg, 'to', start_position + 1)
-        return sliceable[chunk_beg:start_position + 1], chunk_beg
-    else:
-        chunk_end = min(len(sliceable), start_position+chunk_size)
-        # print('yielding chunk downwards from', start_position, 'to', chunk_end)
-        return sliceable[start_position:chunk_end], start_position
-
-
-def search_chunk_yielder(sliceable, start_location, down=True, chunk_size=100):
-    start_of_next_chunk = start_location
-    while not_at_end(sliceable, start_of_next_chunk, down):
-        yield get_next_chunk(sliceable, start_of_next_chunk, chunk_size, down)
-        start_of_next_chunk = start_of_next_chunk + chunk_size if down else start_of_next_chunk - chunk_size
+try:
+    import pyarrow # noqa - only used to pick the faster string kernels
+    _STRING_DTYPE = 'string[pyarrow]'
+except ImportError:
+    _STRING_DTYPE = 'string'
 
+# from gui_debug import *
 
 def search_list_for_str(lst, search_string, starting_item, down, case_insensitive):
     """returns index into list representing string found, or None if not found"""
@@ -39,10 +27,113 @@ def search_list_for_str(lst, search_string, starting_item, down, case_insensitiv
     return None
 
 
-def search_sliceable_by_yielded_chunks_for_str(sliceable, search_string, starting_index, down, case_insensitive):
-    """This is the main entry point for everything in this module."""
-    for chunk, chunk_start_idx in search_chunk_yielder(sliceable, starting_index, down):
-        found_at_chunk_idx = search_list_for_str(chunk, search_string, 0 if down else len(chunk) - 1, down, case_insensitive)
-        if found_at_chunk_idx is not None:
-            return found_at_chunk_idx + chunk_start_idx
+# vectorized search over raw column values.
+#
+# Rather than formatting cells and comparing one Python string at a time,
+# these match large blocks of the column at once using pandas/pyarrow string
+# kernels, or plain numeric comparisons for numeric columns.
+
+SEARCH_BLOCK_ROWS = 1 << 18
+SEARCH_MODES = ('substring', 'regex')
+
+
+def _parse_number(text):
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def parse_numeric_query(query):
+    """'5' -> (5, 5); '1..10' -> (1, 10); '..10' and '1..' are open-ended. Anything else -> None."""
+    if '..' not in query:
+        value = _parse_number(query)
+        return None if value is None or np.isnan(value) else (value, value)
+    lo_text, _, hi_text = query.partition('..')
+    lo = _parse_number(lo_text) if lo_text.strip() else -np.inf
+    hi = _parse_number(hi_text) if hi_text.strip() else np.inf
+    if lo is None or hi is None or (np.isinf(lo) and np.isinf(hi)):
+        return None
+    return lo, hi
+
+
+def uses_numeric_match(dtype, query, mode='substring'):
+    """Whether a search for query in a column of this dtype compares numbers rather than strings."""
+    return mode == 'substring' and is_numeric(dtype) and parse_numeric_query(query) is not None
+
+
+def matches_displayed_strings(dtype, mode='substring'):
+    """Whether matching raw values of this dtype gives the same answers as matching their displayed strings.
+
+    When it does, the already-formatted strings on screen can be searched first, which is cheaper still."""
+    return mode == 'substring' and (dtype == object or isinstance(dtype, (pd.StringDtype, pd.CategoricalDtype)))
+
+
+def _string_match_mask(strs, query, mode, case_insensitive):
+    mask = strs.str.contains(query, case=not case_insensitive, regex=mode == 'regex', na=False)
+    return np.asarray(mask, dtype=bool)
+
+
+def match_mask(values, query, mode='substring', case_insensitive=False):
+    """Returns a boolean numpy array saying which of the values (a pandas Series) match the query.
+
+    Numeric columns are matched by value (equality, or an inclusive lo..hi range) when the query is a number.
+    Everything else is matched as strings, by substring or by regex."""
+    assert mode in SEARCH_MODES, 'unknown search mode ' + mode
+    if uses_numeric_match(values.dtype, query, mode):
+        lo, hi = parse_numeric_query(query)
+        return np.asarray(((values >= lo) & (values <= hi)).fillna(False), dtype=bool)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # match each category once, then look the answers up by code.
+        codes = values.cat.codes.to_numpy()
+        category_mask = _string_match_mask(pd.Series(values.cat.categories).astype(_STRING_DTYPE),
+                                           query, mode, case_insensitive)
+        return np.append(category_mask, False)[codes] # code -1 (missing) indexes the trailing False
+    return _string_match_mask(values.astype(_STRING_DTYPE), query, mode, case_insensitive)
+
+
+def search_column_values(column, query, starting_row, down=True, mode='substring', case_insensitive=False,
+                         block_rows=SEARCH_BLOCK_ROWS, on_progress=None):
+    """Returns the first row at or after starting_row (at or before, if not down) whose raw value matches, or None.
+
+    column is anything with a length and an .iloc that slices out a Series - a Series or a LazyColumn.
+    on_progress, if provided, is called with the number of rows scanned so far after every block.
+    It may raise to abandon the search."""
+    length = len(column)
+    scanned = 0
+    if down:
+        start = max(0, starting_row)
+        while start < length:
+            stop = min(length, start + block_rows)
+            hits = np.flatnonzero(match_mask(column.iloc[start:stop], query, mode, case_insensitive))
+            if len(hits):
+                return start + int(hits[0])
+            scanned += stop - start
+            if on_progress:
+                on_progress(scanned)
+            start = stop
+    else:
+        stop = min(length, starting_row + 1)
+        while stop > 0:
+            start = max(0, stop - block_rows)
+            hits = np.flatnonzero(match_mask(column.iloc[start:stop], query, mode, case_insensitive))
+            if len(hits):
+                return start + int(hits[-1])
+            scanned += stop - start
+            if on_progress:
+                on_progress(scanned)
+            stop = start
     return None
+
+
+def find_all_column_values(column, query, mode='substring', case_insensitive=False,
+                           block_rows=SEARCH_BLOCK_ROWS, on_progress=None):
+    """Returns the sorted positions of every row whose raw value matches, as an int64 numpy array."""
+    length = len(column)
+    found = list()
+    for start in range(0, length, block_rows):
+        stop = min(length, start + block_rows)
+        found.append(start + np.flatnonzero(match_mask(column.iloc[start:stop], query, mode, case_insensitive)))
+        if on_progress:
+            on_progress(stop)
+    return np.concatenate(found).astype(np.int64) if found else np.array([], dtype=np.int64)
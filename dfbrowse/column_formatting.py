@@ -0,0 +1,142 @@
+# per-dtype vectorized formatting of a single column into display strings.
+#
+# The old approach was df.iloc[slice].to_string(columns=[col]), which copies
+# every column of the slice just to format one of them. Everything here works
+# on the underlying array of a single column, so the cost of formatting
+# a segment does not depend on how wide the frame is.
+
+import numpy as np
+import pandas as pd
+from pandas.api import types as pdt
+
+FLOAT_PRECISION = 6 # matches pandas' default display.precision
+NA_REP = 'NaN'
+NAT_REP = 'NaT'
+
+
+def is_numeric(dtype):
+    """Numeric for display purposes (right-justified, NaN preserved). Bools are not numeric."""
+    return pdt.is_numeric_dtype(dtype) and not pdt.is_bool_dtype(dtype)
+
+
+def _format_ints(values):
+    return values.astype(str)
+
+
+def _format_bools(values):
+    return np.where(values, 'True', 'False')
+
+
+def _trim_common_zeros(strs, has_decimal):
+    """Trims trailing zeros equally from all decimal strings, leaving at least one digit after the point."""
+    if not has_decimal.any():
+        return strs
+    decimals = strs[has_decimal]
+    lengths = np.char.str_len(decimals)
+    digits_after_point = lengths - np.char.find(decimals, '.') - 1
+    common_zeros = (lengths - np.char.str_len(np.char.rstrip(decimals, '0'))).min()
+    trim = min(common_zeros, digits_after_point.min() - 1)
+    if trim > 0:
+        strs = strs.copy()
+        strs[has_decimal] = [s[:-trim] for s in decimals]
+    return strs
+
+
+def _format_floats(values, precision=FLOAT_PRECISION):
+    values = values.astype(np.float64, copy=False)
+    nans = np.isnan(values)
+    finite = np.isfinite(values)
+    abs_vals = np.abs(values[finite])
+    fixed = _trim_common_zeros(np.char.mod('%.{}f'.format(precision), values), finite)
+    # pandas' rule for switching to scientific notation: values that would print as zero, or large values
+    # that make the column too wide, measured after trimming zeros
+    too_long = finite.any() and np.char.str_len(fixed[finite]).max() > precision + 6
+    has_large_values = (abs_vals > 1e6).any()
+    has_small_values = ((abs_vals < 10 ** -precision) & (abs_vals > 0)).any()
+    if has_small_values or (too_long and has_large_values):
+        strs = np.char.mod('%.{}e'.format(precision), values)
+    else:
+        strs = fixed
+    strs = np.where(np.isposinf(values), 'inf', strs)
+    strs = np.where(np.isneginf(values), '-inf', strs)
+    return np.where(nans, NA_REP, strs)
+
+
+def _format_datetimes(values):
+    """Dates only when every value is at midnight; otherwise the coarsest sub-second unit that is exact."""
+    ns = values.astype('datetime64[ns]')
+    as_int = ns.view(np.int64)
+    valid = ~np.isnat(ns)
+    nanos_into_day = as_int[valid] % (24 * 3600 * 10**9)
+    if not nanos_into_day.any():
+        unit = 'D'
+    elif not (nanos_into_day % 10**9).any():
+        unit = 's'
+    elif not (nanos_into_day % 10**6).any():
+        unit = 'ms'
+    elif not (nanos_into_day % 10**3).any():
+        unit = 'us'
+    else:
+        unit = 'ns'
+    strs = np.char.replace(np.datetime_as_string(ns, unit=unit), 'T', ' ')
+    return np.where(valid, strs, NAT_REP)
+
+
+def _format_categoricals(series):
+    cat = series.array
+    category_strs = format_values(pd.Series(cat.categories), justify=None)
+    codes = cat.codes
+    strs = np.asarray(category_strs, dtype=object)[np.maximum(codes, 0)] if len(category_strs) \
+        else np.full(len(codes), NA_REP, dtype=object)
+    return np.where(codes < 0, NA_REP, strs).astype(str)
+
+
+def _format_objects(values):
+    """The generic path - one str() per cell, with pandas' representation of missing floats."""
+    out = np.empty(len(values), dtype=object)
+    for idx, v in enumerate(values):
+        out[idx] = NA_REP if isinstance(v, float) and v != v else str(v)
+    return out.astype(str)
+
+
+def _format_array(series):
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        return _format_categoricals(series)
+    if isinstance(dtype, np.dtype):
+        values = series.to_numpy()
+        if dtype.kind == 'b':
+            return _format_bools(values)
+        if dtype.kind in 'iu':
+            return _format_ints(values)
+        if dtype.kind == 'f':
+            return _format_floats(values)
+        if dtype.kind == 'M':
+            return _format_datetimes(values)
+    return _format_objects(series.to_numpy(dtype=object))
+
+
+def format_values(series, justify='right'):
+    """Returns a list of strings for the series, all padded to the same width.
+
+    justify may be 'right', 'left', or None for no padding at all."""
+    if len(series) == 0:
+        return list()
+    strs = np.asarray(_format_array(series), dtype=str)
+    if justify is not None:
+        width = int(np.char.str_len(strs).max())
+        strs = np.char.rjust(strs, width) if justify == 'right' else np.char.ljust(strs, width)
+    return strs.tolist()
+
+
+class ColumnSliceToStringList(object):
+    """Presents a single column as a sliceable list of formatted strings.
+
+    column may be anything with a length and an .iloc that slices into a pandas Series."""
+    def __init__(self, column, justify):
+        self.column = column
+        self.justify = justify
+    def __getitem__(self, val):
+        return format_values(self.column.iloc[val], self.justify)
+    def __len__(self):
+        return len(self.column)
@@ -0,0 +1,239 @@
+# a LazyFrame over a CSV too large to ever parse in full.
+#
+# We memory-map the file and build an index of the byte offset at which each
+# row starts, one large block at a time with numpy. After that, any window of
+# rows is a single seek plus a parse of just those rows, so jumping to the
+# middle of a multi-hundred-GB file costs the same as looking at the top.
+#
+# Every window is parsed with the dtypes inferred from the first rows, so
+# that windows agree with each other; a window that doesn't fit them (an int
+# column with a gap further down, say) widens the column's dtype for good.
+# Parsed windows are kept in an LRU bounded by their size in memory.
+#
+# The index can be saved next to the CSV and is reused as long as the CSV's
+# size and mtime haven't changed.
+#
+# Newlines inside quoted fields are not row boundaries; we tell them apart
+# by the parity of the number of quote characters before each newline, which
+# doubled (escaped) quotes don't change.
+#
+# Limitations: the file must have a single header line.
+
+from collections import OrderedDict
+import bisect
+import csv
+import io
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from .lazy_frame import LazyFrame
+from .gui_debug import print
+
+NEWLINE = ord('\n')
+
+
+def _sidecar_path(path):
+    return path + '.rowidx.npy'
+
+
+def _load_sidecar(path):
+    """Returns the saved row offsets (memory-mapped), or None if there is no valid saved index."""
+    try:
+        stat = os.stat(path)
+        saved = np.load(_sidecar_path(path), mmap_mode='r')
+        if saved[0] == stat.st_size and saved[1] == stat.st_mtime_ns:
+            return saved[2:]
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _save_sidecar(path, offsets):
+    """The first two entries record the size and mtime of the CSV the index belongs to."""
+    stat = os.stat(path)
+    tmp_path = _sidecar_path(path) + '.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.concatenate([[stat.st_size, stat.st_mtime_ns], offsets]).astype(np.int64))
+        os.replace(tmp_path, _sidecar_path(path))
+    except OSError as e:
+        print('could not save csv row index for', path, e)
+
+
+class IndexedCsvFrame(LazyFrame):
+    BLOCK_BYTES = 64 * 1024 * 1024
+    SAMPLE_ROWS = 1000
+    DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+
+    def __init__(self, path, save_index=True, block_bytes=BLOCK_BYTES, max_cache_bytes=DEFAULT_CACHE_BYTES,
+                 **read_csv_kwargs):
+        self.path = path
+        self._read_csv_kwargs = read_csv_kwargs
+        self._max_cache_bytes = max_cache_bytes
+        self._cache_bytes = 0
+        self._mm = np.memmap(path, dtype=np.uint8, mode='r')
+        self.total_bytes = len(self._mm)
+        self.done = False
+        self._indexed = threading.Event()
+        quote_none = read_csv_kwargs.get('quoting') == csv.QUOTE_NONE
+        self._quote = None if quote_none else ord(read_csv_kwargs.get('quotechar', '"'))
+        self._in_quotes = 0 # whether the bytes indexed so far end inside a quoted field
+        header_end = self._find_header_end()
+        self._header = self._mm[:header_end].tobytes()
+        self._lock = threading.Lock()
+        self._windows = OrderedDict() # (start, stop) -> (parsed DataFrame, its size in bytes)
+        # row i spans bytes [offsets[i], offsets[i+1]); the index is built as a list of blocks.
+        self._offset_blocks = [np.array([header_end], dtype=np.int64)]
+        self._block_ends = [1] # cumulative number of offsets in the blocks so far
+        self.bytes_indexed = header_end
+
+        saved = _load_sidecar(path)
+        if saved is not None:
+            print('reusing saved row index for', path)
+            self._finish_index(saved)
+        else:
+            self._index_block(block_bytes) # enough to show the first screen right away
+            while len(self) < self.SAMPLE_ROWS and not self.done: # and to infer dtypes from
+                self._index_block(block_bytes)
+            self._thread = threading.Thread(target=self._index_remaining, args=(block_bytes, save_index),
+                                            name='csv-index ' + path, daemon=True)
+
+        sample = pd.read_csv(io.BytesIO(self._header + self._row_bytes(0, min(len(self), self.SAMPLE_ROWS))),
+                             **read_csv_kwargs)
+        super().__init__(list(sample.columns), list(sample.dtypes))
+        if not self.done:
+            self._thread.start()
+
+    def _find_header_end(self):
+        pos = 0
+        while pos < self.total_bytes:
+            newlines = np.flatnonzero(self._mm[pos:pos + 1024 * 1024] == NEWLINE)
+            if len(newlines):
+                return pos + int(newlines[0]) + 1
+            pos += 1024 * 1024
+        return self.total_bytes
+
+    def _index_block(self, block_bytes):
+        start = self.bytes_indexed
+        end = min(self.total_bytes, start + block_bytes)
+        block = self._mm[start:end]
+        newlines = block == NEWLINE
+        if self._quote is not None:
+            quotes = block == self._quote
+            if self._in_quotes or quotes.any():
+                # uint8 wraps around at 256, which keeps the parity
+                inside = (np.cumsum(quotes, dtype=np.uint8) + np.uint8(self._in_quotes)) & 1
+                newlines &= inside == 0
+                self._in_quotes = int(inside[-1]) if len(inside) else self._in_quotes
+        row_starts = np.flatnonzero(newlines).astype(np.int64) + start + 1
+        if end == self.total_bytes and end > start and (not len(row_starts) or row_starts[-1] != end):
+            row_starts = np.append(row_starts, end) # the last row has no trailing newline
+        with self._lock:
+            self._offset_blocks.append(row_starts)
+            self._block_ends.append(self._block_ends[-1] + len(row_starts))
+            self.bytes_indexed = end
+        if end == self.total_bytes:
+            self.done = True
+            self._indexed.set()
+
+    def _index_remaining(self, block_bytes, save_index):
+        while not self.done:
+            self._index_block(block_bytes)
+            self._notify()
+        offsets = np.concatenate(self._offset_blocks)
+        self._finish_index(offsets)
+        if save_index:
+            _save_sidecar(self.path, offsets)
+        self._notify()
+
+    def _finish_index(self, offsets):
+        with self._lock:
+            self._offset_blocks = [offsets]
+            self._block_ends = [len(offsets)]
+            self.bytes_indexed = self.total_bytes
+            self.done = True
+        self._indexed.set()
+
+    def wait(self, timeout=None):
+        return self._indexed.wait(timeout)
+
+    def _offset(self, row):
+        with self._lock:
+            block = bisect.bisect_right(self._block_ends, row)
+            block_start = self._block_ends[block - 1] if block > 0 else 0
+            return int(self._offset_blocks[block][row - block_start])
+
+    def _row_bytes(self, start, stop):
+        if stop <= start:
+            return b''
+        return self._mm[self._offset(start):self._offset(stop)].tobytes()
+
+    def __len__(self):
+        return self._block_ends[-1] - 1
+
+    def _parse_dtypes(self):
+        """The dtypes every window is parsed with. Date columns, and any dtype the caller gave, are left to read_csv."""
+        given = self._read_csv_kwargs.get('dtype')
+        if given is not None and not isinstance(given, dict):
+            return given
+        return dict({col: dtype for col, dtype in self.dtypes.items() if isinstance(dtype, np.dtype)
+                     and dtype.kind in 'biufcO'}, **(given or dict()))
+
+    def _widen(self, window):
+        """Widens our dtypes to fit a window parsed without them, and returns the window converted to them."""
+        widened = False
+        for col in self.columns:
+            ours, theirs = self.dtypes[col], window[col].dtype
+            if ours == theirs:
+                continue
+            numbers = [isinstance(dtype, np.dtype) and dtype.kind in 'iufc' for dtype in (ours, theirs)]
+            common = np.result_type(ours, theirs) if all(numbers) else np.dtype(object)
+            if common != ours:
+                print('widening csv column', col, 'from', ours, 'to', common)
+                self.dtypes[col] = common
+                widened = True
+        if widened:
+            with self._lock:
+                self._windows.clear() # parsed with the old dtypes
+                self._cache_bytes = 0
+        return window.astype(dict(self.dtypes)) if list(window.dtypes) != list(self.dtypes) else window
+
+    def _parse_window(self, start, stop):
+        key = (start, stop)
+        with self._lock:
+            if key in self._windows:
+                self._windows.move_to_end(key)
+                return self._windows[key][0]
+        kwargs = dict(self._read_csv_kwargs, names=list(self.columns), header=0, skip_blank_lines=False)
+        data = self._header + self._row_bytes(start, stop)
+        try:
+            window = pd.read_csv(io.BytesIO(data), **dict(kwargs, dtype=self._parse_dtypes()))
+        except (ValueError, TypeError, OverflowError):
+            window = self._widen(pd.read_csv(io.BytesIO(data), **kwargs))
+            self._notify()
+        nbytes = int(window.memory_usage(index=False, deep=True).sum())
+        with self._lock:
+            if key not in self._windows:
+                self._windows[key] = (window, nbytes)
+                self._cache_bytes += nbytes
+            while self._cache_bytes > self._max_cache_bytes and len(self._windows) > 1:
+                _, (_, evicted_nbytes) = self._windows.popitem(last=False)
+                self._cache_bytes -= evicted_nbytes
+        return window
+
+    def read(self, start, stop, columns=None):
+        columns = list(self.columns) if columns is None else columns
+        stop = min(stop, len(self))
+        if stop <= start:
+            return pd.DataFrame({col: pd.Series([], dtype=self.dtypes[col]) for col in columns})
+        return self._parse_window(start, stop)[columns]
+
+    @property
+    def status(self):
+        if self.done:
+            return ''
+        return 'indexing... {:,} rows, {:.0f}/{:.0f}MB'.format(
+            len(self), self.bytes_indexed / 1024**2, self.total_bytes / 1024**2)
@@ -0,0 +1,102 @@
+# a LazyFrame that parses a CSV in chunks on a background thread.
+#
+# The first (small) chunk is parsed before the constructor returns, so there
+# is something to draw immediately; the rest of the file is appended as it
+# is parsed. Length, jumps, searches, etc. all see whatever has loaded so far.
+
+import bisect
+import os
+import threading
+
+import pandas as pd
+
+from .lazy_frame import LazyFrame
+from .gui_debug import print
+
+
+class StreamingCsvFrame(LazyFrame):
+    FIRST_CHUNK_ROWS = 5000
+    CHUNK_ROWS = 200000
+
+    def __init__(self, path, chunk_rows=CHUNK_ROWS, first_chunk_rows=FIRST_CHUNK_ROWS, **read_csv_kwargs):
+        self.path = path
+        self.total_bytes = os.path.getsize(path)
+        self.bytes_read = 0
+        self.done = False
+        self.error = None
+        self._file = open(path, 'rb')
+        self._reader = pd.read_csv(self._file, chunksize=chunk_rows, **read_csv_kwargs)
+        try:
+            first = self._reader.get_chunk(first_chunk_rows)
+        except StopIteration: # header only
+            first = pd.read_csv(path, nrows=0, **read_csv_kwargs)
+        super().__init__(list(first.columns), list(first.dtypes))
+        self._chunks = list()
+        self._chunk_starts = list()
+        self._num_rows = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._loaded = threading.Event()
+        self._append(first)
+        self._thread = threading.Thread(target=self._load_remaining, name='csv-stream ' + path, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops loading after the chunk currently being parsed. Rows already loaded remain browsable."""
+        self._stop.set()
+
+    def _append(self, chunk):
+        chunk = chunk.reset_index(drop=True)
+        with self._lock:
+            self._chunk_starts.append(self._num_rows)
+            self._chunks.append(chunk)
+            self._num_rows += len(chunk)
+        self.bytes_read = self._file.tell() if not self._file.closed else self.total_bytes
+
+    def _load_remaining(self):
+        try:
+            for chunk in self._reader:
+                self._append(chunk)
+                self._notify()
+                if self._stop.is_set():
+                    break
+        except Exception as e:
+            print('failed while streaming csv', self.path, e)
+            self.error = e
+        finally:
+            self._reader.close()
+            self._file.close()
+            self.done = True
+            self._loaded.set()
+            self._notify()
+
+    def wait(self, timeout=None):
+        return self._loaded.wait(timeout)
+
+    def __len__(self):
+        return self._num_rows
+
+    def read(self, start, stop, columns=None):
+        columns = list(self.columns) if columns is None else columns
+        with self._lock:
+            chunks = self._chunks[:]
+            chunk_starts = self._chunk_starts[:]
+            stop = min(stop, self._num_rows)
+        pieces = list()
+        idx = max(0, bisect.bisect_right(chunk_starts, start) - 1)
+        while idx < len(chunks) and chunk_starts[idx] < stop:
+            chunk_start = chunk_starts[idx]
+            pieces.append(chunks[idx].iloc[max(0, start - chunk_start):stop - chunk_start][columns])
+            idx += 1
+        if not pieces:
+            return pd.DataFrame({col: pd.Series([], dtype=self.dtypes[col]) for col in columns})
+        return pd.concat(pieces, ignore_index=True) if len(pieces) > 1 else pieces[0].reset_index(drop=True)
+
+    @property
+    def status(self):
+        if self.error is not None:
+            return 'load failed after {:,} rows: {}'.format(len(self), self.error)
+        if self.done:
+            return ''
+        return 'loading... {:,} rows, {:.0f}/{:.0f}MB'.format(
+            len(self), self.bytes_read / 1024**2, self.total_bytes / 1024**2)
@@ -4,6 +4,8 @@ import os
 import sys
 import copy
 import functools
+import timeit
+from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
 import numpy as np
@@ -11,20 +13,55 @@ import numpy as np
 
 from . import urwid_table_browser, dataframe_browser_functions
 
-from dfbrowse.chunk_search_utils import search_list_for_str, search_sliceable_by_yielded_chunks_for_str
+from dfbrowse.chunk_search_utils import (search_list_for_str, search_column_values, find_all_column_values,
+                                         matches_displayed_strings)
+from dfbrowse.search_index import IncrementalSearch, MatchSet, ColumnMatchIndex
+from dfbrowse.column_formatting import ColumnSliceToStringList, is_numeric
+from dfbrowse.lazy_frame import LazyFrame, materialize, wait_until_loaded
+from dfbrowse.indexed_frame import IndexedFrame
+from dfbrowse.lazy_plan import PlanFrame
+from dfbrowse.csv_stream_frame import StreamingCsvFrame
+from dfbrowse.csv_index_frame import IndexedCsvFrame
+from dfbrowse.history_store import FrameRef, HistoryStore
+from dfbrowse.sort_cache import SortPermutationCache
+from dfbrowse.predicates import MaskCache
+from dfbrowse.sorted_index import first_row_at_least
+from dfbrowse.shared_frames import run_row_wise
+from dfbrowse.cache_manager import display_cache_manager
 from dfbrowse.gui_debug import print, debug_print
 from .func_core import BROWSER_FUNCS
 
 _global_urwid_browser_frame = None
 
+# CSVs at least this large are browsed through a row offset index rather than parsed into memory.
+INDEXED_CSV_MIN_BYTES = 2 * 1024**3
 
-def browse(df, name=None):
+
+def browse(df, name=None, lazy=False):
+    """lazy records filters and sorts as plans that only run when their rows are needed (see lazy_plan)."""
     print('Creating a browser...  call fg() on this object to open it.')
     mb = MultipleDataframeBrowser()
-    mb.browse(mb.add_df(df, name))
+    mb.browse(mb.add_df(df, name, lazy=lazy))
+
+
+def open_csv(path, **read_csv_kwargs):
+    """Returns a lazily-loaded table for the CSV, choosing a backend suited to its size."""
+    if os.path.getsize(path) >= INDEXED_CSV_MIN_BYTES:
+        return IndexedCsvFrame(path, **read_csv_kwargs)
+    return StreamingCsvFrame(path, **read_csv_kwargs)
+
+
+def browse_csv(path, name=None, lazy=False):
+    mb = MultipleDataframeBrowser()
+    return mb.browse(mb.add_df(open_csv(path, index_col=False), name or os.path.basename(path)[:-4], lazy=lazy))
 
 
-def browse_dir(directory_of_csvs, ipython_session=None):
+def browse_dir(directory_of_csvs, ipython_session=None, preload=False, max_preload_workers=4, lazy=False):
+    """Browse every CSV in a directory. Each file is loaded the first time you look at it.
+
+    If preload is True, all files are also read in the background on a pool of
+    max_preload_workers threads, so that switching to them later is instant.
+    Files too large to fit in memory are never preloaded. lazy is as for browse."""
     try:
         import IPython
         ipython_session = IPython.core.getipython.get_ipython()
@@ -33,11 +70,16 @@ def browse_dir(directory_of_csvs, ipython_session=None):
         print('*** failed to get ipython global session')
         pass
     mdb = MultipleDataframeBrowser(ipython_session=ipython_session)
-    dataframes_and_names = list()
+    executor = ThreadPoolExecutor(max_preload_workers) if preload else None
     for fn in os.listdir(directory_of_csvs):
-        df = pd.read_csv(directory_of_csvs + os.sep + fn, index_col=False)
+        path = directory_of_csvs + os.sep + fn
         name = fn[:-4]
-        mdb.add_df(df, name)
+        preloaded = None
+        if executor and os.path.getsize(path) < INDEXED_CSV_MIN_BYTES:
+            preloaded = executor.submit(pd.read_csv, path, index_col=False)
+        mdb.add_df_loader(functools.partial(open_csv, path, index_col=False), name, preloaded, lazy=lazy)
+    if executor:
+        executor.shutdown(wait=False)
     return mdb.browse()
 
 
@@ -45,6 +87,22 @@ class InnerObjects(object):
     pass
 
 
+class _PendingBrowser(object):
+    """Stands in for a browser whose table has not been loaded yet."""
+    def __init__(self, load_df, preloaded=None, lazy=False):
+        self.load_df = load_df
+        self.preloaded = preloaded # a Future that may already be loading the table
+        self.lazy = lazy
+
+    def load(self):
+        # don't wait behind the rest of the preload queue - we want this one now. But once the preload
+        # is running, it can't be cancelled, and finishing it is quicker than reading the file again.
+        if self.preloaded is not None and not self.preloaded.cancel():
+            if self.preloaded.exception() is None:
+                return self.preloaded.result()
+        return self.load_df()
+
+
 class MultipleDataframeBrowser(object):
     _settable_class_attributes = ['_MultipleDataframeBrowser__inner',
                                   'active_browser_name']
@@ -64,20 +122,44 @@ class MultipleDataframeBrowser(object):
         for df in dfs:
             self.add_df(df)
 
-    def add_df(self, df, name=None) -> str:
+    def add_df(self, df, name=None, lazy=False) -> str:
         """Direct interface to adding a dataframe. Returns name.
 
         Preferably provide your own name here, but if you don't, we'll assign one...
+        lazy starts the browser in lazy mode (see DataframeTableBrowser).
         """
         assert df is not None
         name = self._make_unique_name(name)
         print('wrapping dataframe in new table browser with name', name)
-        self.__inner.browsers[name] = DataframeTableBrowser(df)
-        self.__inner.browsers[name].add_change_callback(self.__inner.urwid_frame.table_view.update_view)
+        self._set_browser(name, DataframeTableBrowser(df, lazy=lazy))
+        if not self.__inner.active_browser_name:
+            self.__inner.active_browser_name = name
+        return name
+
+    def add_df_loader(self, load_df, name=None, preloaded=None, lazy=False) -> str:
+        """Adds a dataframe that will be loaded by calling load_df() the first time it is needed. Returns name.
+
+        preloaded may be a Future for the same dataframe; if it has finished by the time
+        the dataframe is needed, its result is used instead of calling load_df."""
+        name = self._make_unique_name(name)
+        self.__inner.browsers[name] = _PendingBrowser(load_df, preloaded, lazy)
         if not self.__inner.active_browser_name:
             self.__inner.active_browser_name = name
         return name
 
+    def _set_browser(self, name, browser):
+        browser.ui_dispatch = self.__inner.urwid_frame.call_from_thread
+        browser.add_change_callback(self.__inner.urwid_frame.table_view.update_view)
+        self.__inner.browsers[name] = browser
+
+    def _browser(self, name):
+        browser = self.__inner.browsers[name]
+        if isinstance(browser, _PendingBrowser):
+            print('loading dataframe for', name)
+            browser = DataframeTableBrowser(browser.load(), lazy=browser.lazy)
+            self._set_browser(name, browser)
+        return browser
+
     def _make_unique_name(self, name):
         if name is None:
             name = ''
@@ -109,19 +191,42 @@ class MultipleDataframeBrowser(object):
             return False
         new_name = new_name if new_name else name + '_copy'
         new_name = self._make_unique_name(new_name)
-        self.__inner.browsers[new_name] = copy.deepcopy(self.__inner.browsers[name])
+        self.__inner.browsers[new_name] = self._browser(name).fork()
         return True
 
     def open_new_browser(self, **kwargs):
         pass
 
+    def cache_usage(self):
+        """A DataFrame of the memory each browser's display caches hold, one row per browser that has been opened.
+
+        Strings shared by a browser and its copy count towards both. The budget for all of them together is
+        dfbrowse.cache_manager.display_cache_manager.max_bytes."""
+        browsers = {name: browser for name, browser in self.__inner.browsers.items()
+                    if not isinstance(browser, _PendingBrowser)}
+        usage = list()
+        for browser in browsers.values():
+            stats = browser.view.cache_stats()
+            usage.append([len(stats), stats.cached_rows.sum(), browser.view.cache_nbytes])
+        return pd.DataFrame(usage, index=pd.Index(list(browsers), name='browser'),
+                            columns=['columns', 'cached_rows', 'nbytes'])
+
     def __getitem__(self, df_name):
         """This returns the actual backing dataframe."""
-        return self.__inner.browsers[df_name].df
+        return self._backing_df(df_name)
 
     def __getattr__(self, df_name):
         """This returns the actual backing dataframe."""
-        return self.__inner.browsers[df_name].df
+        return self._backing_df(df_name)
+
+    def _backing_df(self, df_name):
+        df = self._browser(df_name).df
+        # sorts and filters are kept as row views or plans over a table in memory, and a streamed CSV ends up
+        # in memory too, so those are given out as DataFrames. Files browsed lazily because they may not fit
+        # (huge CSVs, parquet), and streams still loading, are given out as they are - see materialize.
+        if isinstance(df, (IndexedFrame, PlanFrame)) or (isinstance(df, StreamingCsvFrame) and df.wait(0)):
+            return materialize(df)
+        return df
 
     def __dir__(self):
         """Tab completion of the dataframes for IPython"""
@@ -138,16 +243,16 @@ class MultipleDataframeBrowser(object):
 
     def __setitem__(self, key, value):
         if key in self.__inner.browsers:
-            self.__inner.browsers[self.active_browser_name]._change_df(value)
+            self._browser(self.active_browser_name)._change_df(value)
         else:
             self.add_df(value, name=key)
 
     def get_browser(self, name):
-        return self.__inner.browsers[name]
+        return self._browser(name)
 
     @property
     def active_browser(self):
-        return self.__inner.browsers[self.__inner.active_browser_name] if self.__inner.active_browser_name else None
+        return self._browser(self.__inner.active_browser_name) if self.__inner.active_browser_name else None
 
     def _set_active_browser(self, name):
         if name in self.__inner.browsers:
@@ -182,9 +287,12 @@ class MultipleDataframeBrowser(object):
 
 class DataframeBrowserHistory(object):
     # This object's members should never be modified.
-    def __init__(self, df, browse_columns):
-        self.df = df
+    def __init__(self, frame, browse_columns):
+        self.frame = frame # a FrameRef, which may be shared with neighbouring history entries
         self.browse_columns = browse_columns
+    @property
+    def df(self):
+        return self.frame.df
 
 
 class DataframeTableBrowser(object):
@@ -231,6 +339,10 @@ class DataframeTableBrowser(object):
     A redo history, comprised of actions that were undone without any intervening 'undoable'
     table modifications having been performed. Like 'undo', the interface must be provided, but
     the actual functionality need not necessarily be implemented.
+    This implementation keeps the tables in its history within history_budget_bytes of memory,
+    moving the ones farthest from the current position to disk until they are needed again.
+    In lazy mode, filters and sorts are recorded as plans (see lazy_plan) that only run when their rows
+    are needed, so a chain of them costs a single pass; each step is still its own history entry.
 
     A call_browser_func method that will take a string and a set of keyword arguments, will resolve
     that name to a function (this may be implementation-dependent), may optionally enhance the set of
@@ -243,22 +355,42 @@ class DataframeTableBrowser(object):
     the browser can actually resolve by name.
 
     """
-    def __init__(self, df):
-        self.history = [DataframeBrowserHistory(df, list(df.columns))]
+    def __init__(self, df, history_budget_bytes=HistoryStore.DEFAULT_BUDGET_BYTES, lazy=False):
+        # the original table isn't spilled; whoever gave it to us probably still holds it anyway.
+        self.history = [DataframeBrowserHistory(FrameRef(df, spillable=False), list(df.columns))]
+        self.history_store = HistoryStore(history_budget_bytes)
+        self.sort_cache = SortPermutationCache()
+        self.mask_cache = MaskCache()
+        self.lazy = lazy
         self.change_cbs = list()
         self._future = list()
         self.view = DataframeRowView(lambda: self.df)
         self._selected_column_index = 0 # TODO change this to be name-based.
         self.add_change_callback(self.view._df_changed)
-
-    def __deepcopy__(self, memodict):
-        dfb = DataframeTableBrowser(self.original_df)
-        dfb.history = self.df_hist[:]
+        # lazy tables may grow from other threads; the UI replaces this
+        # with something that runs the given function on its own thread.
+        self.ui_dispatch = lambda func: func()
+        if isinstance(df, LazyFrame):
+            df.add_listener(lambda: self.ui_dispatch(self._lazy_table_updated))
+
+    def fork(self):
+        """Returns an independent copy of this browser, without copying any tables.
+
+        History entries are immutable, so the copy shares them (and the history budget), as well as
+        the formatted column strings, until either browser changes them. Only the lists of entries are copied."""
+        dfb = copy.copy(self)
+        dfb.history = self.history[:]
         dfb._future = self._future[:]
-        dfb.change_cbs += [cb for cb in self.change_cbs if cb is not self.view._df_changed]
-        dfb._selected_column_index = self._selected_column_index
+        dfb.view = self.view.fork(lambda: dfb.df)
+        dfb.change_cbs = [cb for cb in self.change_cbs if cb is not self.view._df_changed]
+        dfb.add_change_callback(dfb.view._df_changed)
+        if isinstance(self.original_df, LazyFrame):
+            self.original_df.add_listener(lambda: dfb.ui_dispatch(dfb._lazy_table_updated))
         return dfb
 
+    def __deepcopy__(self, memodict):
+        return self.fork()
+
     # TODO separate out code that is a generic browser vs the dataframe-specific code.
     # TODO support displaying index as column. could use -1 as special value to indicate index in place of column name
 
@@ -299,17 +431,32 @@ class DataframeTableBrowser(object):
         assert new_focus_col < len(self.browse_columns) and new_focus_col >= 0
         self._selected_column_index = new_focus_col
     @property
+    def selected_column_index(self):
+        """The index of the selected column within browse_columns."""
+        return self._selected_column_index
+    @property
     def all_columns(self):
         return list(self.original_df.columns)
 
     def content(self, column_name=None, row_index=None):
         column_name = column_name if column_name else self.selected_column
         row_index = row_index if row_index is not None else self.selected_row
-        return self.df.iloc[row_index, self.df.columns.get_loc(column_name)]
+        return self.df[column_name].iloc[row_index]
 
     def __len__(self):
         return len(self.df)
 
+    def cache_stats(self):
+        """A DataFrame of display cache counters, one row per column that has been shown."""
+        return self.view.cache_stats()
+
+    @property
+    def status(self):
+        """Extra state worth showing to the user, e.g. how much of a lazily-loaded table has been read."""
+        table_status = self.df.status if isinstance(self.df, LazyFrame) else ''
+        history_status = self.history_store.status if len(set(map(id, self._history_frames()))) > 1 else ''
+        return ' | '.join(text for text in (table_status, history_status, 'lazy' if self.lazy else '') if text)
+
     def undo(self, n=1):
         """Reverses the most recent change to the browser - either the column ordering or a change to the underlying table itself."""
         if len(self.history) == 1:
@@ -318,9 +465,10 @@ class DataframeTableBrowser(object):
         while n > 0 and len(self.history) > 1:
             print('undo', n)
             self._future.append(self.history.pop())
-            table_changed = table_changed or self._future[-1].df is not self.history[-1].df
+            table_changed = table_changed or self._future[-1].frame is not self.history[-1].frame
             n -= 1
         assert len(self.history) > 0
+        self._balance_history()
         self._msg_cbs(table_changed)
 
     def redo(self, n=1):
@@ -330,19 +478,41 @@ class DataframeTableBrowser(object):
         while n > 0 and len(self._future) > 0:
             print('redo', n)
             self.history.append(self._future.pop())
-            table_changed = table_changed or self.history[-2].df is not self.history[-1].df
+            table_changed = table_changed or self.history[-2].frame is not self.history[-1].frame
             n -= 1
+        self._balance_history()
         self._msg_cbs(table_changed)
 
-    def search_column(self, column, search_string, down=True, skip_current=False):
+    def search_column(self, column, search_string, down=True, skip_current=False, mode='substring'):
         """Searches a column (identified by its name) for a given search string.
 
+        mode is 'substring' or 'regex'. Numeric columns searched for a number (or a lo..hi range) match by value.
         This is delegated to the view because it maintains a convenient string cache."""
-        found = self.view.search(column, search_string, down, skip_current)
+        found = self.view.search(column, search_string, down, skip_current, mode=mode)
         if found:
-            self._msg_cbs(table_changed=True)
+            self._msg_cbs(table_changed=False)
         return found
 
+    def next_match(self, down=True):
+        """Moves to the next (or previous) row found by the last find-all. Returns False if there isn't one."""
+        found = self.view.next_match(down)
+        if found is None:
+            return False
+        self.selected_row = found
+        return True
+
+    def jump_to_value(self, value, column=None):
+        """Selects the first row whose value in the column (default: the selected column) is at least value.
+
+        Numeric and datetime columns only. Returns False if there is no such row."""
+        column = column if column else self.selected_column
+        df = self.df.result if isinstance(self.df, PlanFrame) else self.df
+        found = first_row_at_least(df, column, value, self.sort_cache)
+        if found is None:
+            return False
+        self.selected_row = found
+        return True
+
     def add_change_callback(self, cb):
         if cb not in self.change_cbs:
             self.change_cbs.append(cb)
@@ -352,6 +522,10 @@ class DataframeTableBrowser(object):
             cb(self, table_changed)
 
     def call_browser_func(self, function_name, **kwargs):
+        self._call_df_func(self.browser_func(function_name), **kwargs)
+
+    def browser_func(self, function_name):
+        """Resolves a browser function by name. Raises if there isn't one."""
         print('looking up browser function by name', function_name)
         global BROWSER_FUNCS
         if function_name in BROWSER_FUNCS:
@@ -366,9 +540,22 @@ class DataframeTableBrowser(object):
             msg = 'Failed to find DF function {}'.format(function_name)
             debug_print(msg)
             raise Exception(msg)
-        else:
-            print('found browser function', func)
-            self._call_df_func(func, **kwargs)
+        print('found browser function', func)
+        return func
+
+    def prepare_browser_func(self, function_name, **kwargs):
+        """Splits calling a browser function in two, so that the slow part can run on another thread.
+
+        Returns compute, which calls the function on the current table without changing the browser, and may be
+        called from any thread. Its result is then given to finish_browser_func, back on the browser's thread.
+        A table still loading in the background is waited for first, calling compute's on_progress with the rows
+        loaded so far every so often - which may raise to stop waiting."""
+        return self._prepare_df_func(self.browser_func(function_name), **kwargs)
+
+    def finish_browser_func(self, new_df):
+        """Makes the table computed by prepare_browser_func's compute (if any) the current one."""
+        if new_df is not None:
+            self._change_df(new_df)
 
     @property
     def browser_func_names(self):
@@ -385,6 +572,17 @@ class DataframeTableBrowser(object):
         return self.history[0].df
 
     # internal methods and properties
+    def _history_frames(self):
+        """Every FrameRef in the history and the redo list, in order, with the current one at len(history) - 1."""
+        return [entry.frame for entry in self.history] + [entry.frame for entry in reversed(self._future)]
+
+    def _balance_history(self):
+        self.history_store.balance(self._history_frames(), len(self.history) - 1)
+
+    def _lazy_table_updated(self):
+        if isinstance(self.df, LazyFrame):
+            self._msg_cbs(table_changed=False)
+
     @property
     def _real_column_index(self):
         """The actual index of the selected column in the backing dataframe."""
@@ -402,14 +600,14 @@ class DataframeTableBrowser(object):
                     raise Exception('Column {} not found in backing dataframe.'.format(col))
             print('changing browse columns')
             self._cap_selected_column_index(new_cols)
-            self.history.append(DataframeBrowserHistory(self.history[-1].df, new_cols))
+            self.history.append(DataframeBrowserHistory(self.history[-1].frame, new_cols))
             self._future.clear() # can't keep future once we're making user-specified changes.
             self._msg_cbs(table_changed=False)
             return True
         return False
 
     def _change_df(self, new_df):
-        assert isinstance(new_df, type(self.df))
+        assert isinstance(new_df, (pd.DataFrame, LazyFrame))
         print('changing dataframe...')
         new_cols = list()
         for col in new_df.columns:
@@ -424,22 +622,45 @@ class DataframeTableBrowser(object):
             browse_columns += new_cols
             self._cap_selected_column_index(browse_columns)
             print('using new browse columns', browse_columns)
-            self.history.append(DataframeBrowserHistory(new_df, browse_columns))
+            self.history.append(DataframeBrowserHistory(FrameRef(new_df), browse_columns))
         else:
-            self.history.append(DataframeBrowserHistory(new_df, self.history[-1].browse_columns))
+            self.history.append(DataframeBrowserHistory(FrameRef(new_df), self.history[-1].browse_columns))
         self._future.clear()
+        self._balance_history()
         self._msg_cbs(table_changed=True)
 
     def _call_df_func(self, func, **kwargs):
+        self.finish_browser_func(self._prepare_df_func(func, **kwargs)())
+
+    def _prepare_df_func(self, func, **kwargs):
         assert func is not None
-        new_df = func(self.df,
-                      c=self._real_column_index,
-                      r=self.selected_row,
+        df = self.df
+        kwargs = dict(c=self._real_column_index,
+                      r=self.view.last_selected_row,
                       cn=self.selected_column,
                       bcols=self.browse_columns,
+                      sort_cache=self.sort_cache,
+                      mask_cache=self.mask_cache,
                       **kwargs)
-        if new_df is not None:
-            self._change_df(new_df)
+        planner = getattr(func, 'planner', None) if self.lazy else None
+
+        def compute(on_progress=None):
+            while not wait_until_loaded(df, 0.1): # functions must see every row, not just those loaded so far
+                if on_progress is not None:
+                    on_progress(len(df))
+            step = planner(df, **kwargs) if planner is not None else None
+            if step is not None:
+                return PlanFrame.of(df, self.sort_cache).then(step)
+            # most browser functions are written against real DataFrames, so a lazily-loaded table
+            # or a row view gets read in full at this point. Functions that understand views get them as-is.
+            table = df.result if isinstance(df, PlanFrame) else df
+            if getattr(func, 'executor', None) == 'process':
+                picklable = {k: v for k, v in kwargs.items() if k not in ('sort_cache', 'mask_cache')}
+                return run_row_wise(table, func, **picklable)
+            if not (getattr(func, 'understands_views', False) and isinstance(table, (pd.DataFrame, IndexedFrame))):
+                table = materialize(table)
+            return func(table, **kwargs)
+        return compute
 
 
 class defaultdict_of_DataframeColumnSegmentCache(defaultdict):
@@ -469,18 +690,58 @@ class DataframeRowView(object):
         self._get_df = get_df
         self._top_row = 0 # the top row in the dataframe that's in view
         self._selected_row = 0
+        self._rows_checked = True # False while the rows above may be out of range for a table that changed
         self._column_cache = defaultdict_of_DataframeColumnSegmentCache(lambda: self.df)
+        self._shared_caches = set() # columns whose caches are shared with a fork, so must be copied before changing
+        self._showing = set() # columns on screen, whose current segments the cache manager must not evict
+        self._incremental_searches = defaultdict(IncrementalSearch)
+        self.match_index = None # the results of the last find-all, if the table hasn't changed since
         self.view_height = DataframeRowView.DEFAULT_VIEW_HEIGHT
         self.scroll_margin_up = 10 # TODO these are very arbitrary and honestly it might be better
         self.scroll_margin_down = 30 # if they didn't exist inside this class at all.
+        self.scroll_direction = 1 # which way the selected row last moved: 1 is down, -1 up
+        self.scroll_rate = 0.0 # rows per second, averaged over the last few moves
+        self._last_move_time = 0.0
 
     @property
     def df(self):
         return self._get_df()
     def __len__(self):
         return len(self.df)
+
+    def fork(self, get_df):
+        """Returns a view for a copy of the browser, sharing this view's column caches until either view changes one.
+
+        Copying a cache only copies a handful of attributes - the formatted strings themselves stay shared
+        until one of the views reformats them."""
+        view = copy.copy(self)
+        view._get_df = get_df
+        view._column_cache = defaultdict_of_DataframeColumnSegmentCache(lambda: view.df)
+        view._column_cache.update(self._column_cache)
+        view._incremental_searches = defaultdict(IncrementalSearch)
+        view._showing = set(self._showing)
+        self._shared_caches = set(self._column_cache)
+        view._shared_caches = set(self._column_cache)
+        return view
+
+    def _own_cache(self, column_name):
+        """The column's cache, copied first if it is shared with a fork, so that it is safe to change."""
+        cache = self._column_cache[column_name]
+        if column_name in self._shared_caches:
+            self._shared_caches.discard(column_name)
+            cache = copy.copy(cache)
+            cache.get_src_df = lambda: self.df
+            self._column_cache[column_name] = cache
+        return cache
+
+    def _check_rows(self):
+        if not self._rows_checked:
+            self._rows_checked = True
+            self.selected_row = max(0, min(self._selected_row, len(self.df) - 1))
+
     @property
     def top_row(self):
+        self._check_rows()
         assert self._top_row >= 0 and self._top_row < len(self)
         return self._top_row
     @property
@@ -495,58 +756,236 @@ class DataframeRowView(object):
         assert new_row >= 0 and new_row < len(self)
         old_row = self._selected_row
         self._selected_row = new_row
-        if new_row > old_row:
-            while self._selected_row > self._top_row + self.scroll_margin_down:
-                self._top_row += 1 # TODO this could be faster
-        elif new_row < old_row: # scroll up
-            while self._selected_row < self._top_row + self.scroll_margin_up and self._top_row > 0:
-                self._top_row -= 1
+        if new_row != old_row:
+            self.scroll_direction = 1 if new_row > old_row else -1
+            self._track_scroll_rate(abs(new_row - old_row))
+        if new_row > old_row: # scroll down just far enough to keep the selected row above the bottom margin
+            self._top_row = max(self._top_row, new_row - self.scroll_margin_down)
+        elif new_row < old_row: # scroll up just far enough to keep it below the top margin
+            self._top_row = max(0, min(self._top_row, new_row - self.scroll_margin_up))
         assert self._selected_row >= self._top_row and self._selected_row <= self._top_row + self.view_height
+    @property
+    def last_selected_row(self):
+        """The selected row as last set, without running a pending plan to check that it is still in range."""
+        return self._selected_row
+
+    SCROLL_RATE_MEMORY = 1.0 # seconds without moving after which scrolling is considered to have stopped
+    CACHE_LOOKAHEAD_SECONDS = 2.0 # how far ahead columns cache, in seconds of scrolling at the current rate
+    MAX_CACHE_MARGIN = 10000
+
+    def _track_scroll_rate(self, rows_moved):
+        now = timeit.default_timer()
+        elapsed = max(now - self._last_move_time, 1e-3)
+        self._last_move_time = now
+        rate = min(rows_moved, self.view_height) / elapsed # a jump is not a scroll, however far it goes
+        if elapsed > DataframeRowView.SCROLL_RATE_MEMORY:
+            self.scroll_rate = rate
+        else:
+            self.scroll_rate = 0.5 * self.scroll_rate + 0.5 * rate
+
+    def _cache_margins(self):
+        """(rows before, rows after) the view for columns to cache - the margin in the scroll direction grows
+        with the speed of scrolling, while the one behind stays at the minimum."""
+        behind = DataframeColumnSegmentCache.MIN_CACHE_MARGIN
+        ahead = int(min(DataframeRowView.MAX_CACHE_MARGIN,
+                        max(behind, self.scroll_rate * DataframeRowView.CACHE_LOOKAHEAD_SECONDS)))
+        return (ahead, behind) if self.scroll_direction < 0 else (behind, ahead)
 
     def header(self, column_name):
         return self._column_cache[column_name].header
     def width(self, column_name):
         return self._column_cache[column_name].width
+    def estimated_width(self, column_name):
+        """The width if the column has been rendered; otherwise a guess that doesn't require rendering it."""
+        if column_name in self._column_cache and self._column_cache[column_name].width:
+            return self._column_cache[column_name].width
+        return max(len(str(column_name)), DataframeColumnSegmentCache.MIN_WIDTH)
     def lines(self, column_name, top_row=None, bottom_row=None):
+        self._check_rows()
         top_row = top_row if top_row is not None else self._top_row
         bottom_row = bottom_row if bottom_row is not None else min(top_row + self.view_height, len(self.df))
-        return self._column_cache[column_name].rows(top_row, bottom_row)
+        cache = self._own_cache(column_name)
+        self._showing.add(column_name)
+        return cache.rows(top_row, bottom_row, *self._cache_margins(), showing=self.showing_caches())
+
+    def show_columns(self, column_names):
+        """Records which columns are on screen, once they have been drawn. Columns drawn since are added to them."""
+        self._showing = set(column_names)
+
+    def showing_caches(self):
+        return {self._column_cache[col] for col in self._showing if col in self._column_cache}
+
+    @property
+    def cache_nbytes(self):
+        return display_cache_manager.caches_nbytes(list(self._column_cache.values()))
+
+    def cache_stats(self):
+        """A DataFrame of display cache counters, one row per column that has been shown."""
+        stats = [cache.stats() for cache in self._column_cache.values()]
+        return pd.DataFrame(stats, index=pd.Index(list(self._column_cache), name='column'),
+                            columns=DataframeColumnSegmentCache.STATS)
+
+    def prepare_prefetch(self, column_names):
+        """Returns a function of on_progress that formats the rows the given columns will show next.
+
+        Like prepare_uncached_search, call this on the UI thread and run the result anywhere. The segments
+        ahead in the scroll direction are formatted first, and on_progress, called with the number formatted
+        so far, may raise to stop. Hand the result to finish_prefetch, back on the UI thread."""
+        self._check_rows()
+        df = self.df
+        top_row = self._top_row
+        bottom_row = min(top_row + self.view_height, len(df))
+        jobs = list()
+        rows_before, rows_after = self._cache_margins()
+        showing = self.showing_caches()
+        for column_name in column_names:
+            cache = self._own_cache(column_name)
+            for rank, (top, bottom) in enumerate(cache.segments_to_prefetch(top_row, bottom_row, len(df),
+                                                                             self.scroll_direction,
+                                                                             rows_before, rows_after, showing)):
+                jobs.append((rank, cache, cache.generation, top, bottom))
+        jobs.sort(key=lambda job: job[0]) # stable, so still in column order within each rank
+
+        def prefetch(on_progress=None):
+            segments = list()
+            for rank, cache, generation, top, bottom in jobs:
+                segments.append((cache, generation, top, cache.format_rows(df, top, bottom)))
+                if on_progress:
+                    on_progress(len(segments))
+            return segments
+        return prefetch
+
+    def finish_prefetch(self, segments):
+        showing = self.showing_caches()
+        for cache, generation, top, strings in segments:
+            cache.add_prefetched(generation, top, strings, showing)
 
     def change_column_width(self, column_name, n):
-        self._column_cache[column_name].change_width(n)
+        self._own_cache(column_name).change_width(n)
 
-    def search(self, column_name, search_string, down=True, skip_current=False, case_insensitive=False):
+    def search(self, column_name, search_string, down=True, skip_current=False, case_insensitive=False,
+               mode='substring'):
         """search downward or upward in the current column for a string match.
         Can exclude the current row in order to search 'farther' in the dataframe."""
-        case_insensitive = case_insensitive if case_insensitive is not None else search_string.islower()
-        starting_row = self.selected_row + int(skip_current) if down else self.selected_row - int(skip_current)
-        df_index = self._column_cache[column_name].search_cache(search_string, starting_row, down, case_insensitive)
-        if df_index is not None:
-            self.selected_row = df_index
+        found, resume_row = self.search_cached(column_name, search_string, down, skip_current, case_insensitive, mode)
+        if found is None and resume_row is not None:
+            found = self.search_uncached(column_name, search_string, resume_row, down, case_insensitive, mode=mode)
+        if found is not None:
+            self.selected_row = found
             return True
         return False
 
+    def search_cached(self, column_name, search_string, down=True, skip_current=False, case_insensitive=False,
+                      mode='substring'):
+        """The cheap first half of a search: looks only through the already-formatted strings for the column.
+
+        Returns (row where found or None, row from which search_uncached should continue).
+        The resume row is None if there is no need to continue, because the answer came from the find-all index.
+        Searches that match something other than the displayed strings skip straight to search_uncached."""
+        case_insensitive = case_insensitive if case_insensitive is not None else search_string.islower()
+        if self.match_index is not None and self.match_index.same_search(column_name, search_string, mode,
+                                                                         case_insensitive):
+            return self.match_index.next(self.selected_row, down, skip_current), None
+        starting_row = self.selected_row + int(skip_current) if down else self.selected_row - int(skip_current)
+        if not matches_displayed_strings(self.df[column_name].dtype, mode):
+            return None, starting_row
+        return self._column_cache[column_name].search_cache(search_string, starting_row, down, case_insensitive)
+
+    def search_uncached(self, column_name, search_string, starting_row, down=True, case_insensitive=False,
+                        on_progress=None, mode='substring'):
+        """The expensive second half of a search, through the whole column from starting_row.
+
+        on_progress is called with the number of rows scanned so far, and may raise to stop the search."""
+        return self.prepare_uncached_search(column_name, search_string, starting_row, down, case_insensitive,
+                                            mode)(on_progress)
+
+    def prepare_uncached_search(self, column_name, search_string, starting_row, down=True, case_insensitive=False,
+                                mode='substring'):
+        """Returns a function of on_progress that runs search_uncached.
+
+        This must be called on the UI thread, but the function it returns only reads the table,
+        so it is safe to run off the UI thread. Raw column values are matched a block at a time;
+        substring searches reuse the rows matched by the query they extend, if that was searched for last."""
+        case_insensitive = case_insensitive if case_insensitive is not None else search_string.islower()
+        column = self.df[column_name]
+        if MatchSet.applies(column.dtype, search_string, mode):
+            match_set = self._incremental_searches[column_name].match_set(search_string, case_insensitive,
+                                                                          len(column))
+            return lambda on_progress=None: match_set.find(column, starting_row, down, on_progress)
+        return lambda on_progress=None: search_column_values(column, search_string, starting_row, down, mode,
+                                                             case_insensitive, on_progress=on_progress)
+
+    def prepare_find_all(self, column_name, search_string, case_insensitive=False, mode='substring'):
+        """Returns a function of on_progress that finds every match in the column, as a ColumnMatchIndex.
+
+        Like prepare_uncached_search, call this on the UI thread and run the result anywhere."""
+        case_insensitive = case_insensitive if case_insensitive is not None else search_string.islower()
+        column = self.df[column_name]
+        if MatchSet.applies(column.dtype, search_string, mode):
+            match_set = self._incremental_searches[column_name].match_set(search_string, case_insensitive,
+                                                                          len(column))
+            find_all = lambda on_progress: match_set.all_positions(column, on_progress)
+        else:
+            find_all = lambda on_progress: find_all_column_values(column, search_string, mode, case_insensitive,
+                                                                  on_progress=on_progress)
+        return lambda on_progress=None: ColumnMatchIndex(column_name, search_string, mode, case_insensitive,
+                                                         find_all(on_progress))
+
+    def next_match(self, down=True):
+        """The next (or previous) row in the find-all results, or None."""
+        if self.match_index is None:
+            return None
+        return self.match_index.next(self.selected_row, down)
+
     def _df_changed(self, browser, table_changed):
         if table_changed:
-            for col_name, cache in self._column_cache.items():
-                cache.clear_cache()
-            self.selected_row = max(0, min(self.selected_row, len(self.df) - 1))
+            for col_name in list(self._column_cache):
+                self._own_cache(col_name).clear_cache()
+            self._incremental_searches.clear()
+            self.match_index = None
+            self._rows_checked = False
+            if not (isinstance(self.df, PlanFrame) and not self.df.executed):
+                self._check_rows() # otherwise, not until the rows are needed - that would run the plan
+
+
+def _strings_nbytes(strings):
+    return sys.getsizeof(strings) + sum(map(sys.getsizeof, strings))
 
 
 class DataframeColumnSegmentCache(object):
     MIN_WIDTH = 2
     MAX_WIDTH = 50
     DEFAULT_CACHE_SIZE = 200
-    def __init__(self, src_df_func, column_name, std_cache_size=200, min_cache_on_either_side=50):
+    MIN_CACHE_MARGIN = 50
+    PREFETCHED_SEGMENTS = 2 # segments kept besides the current one - prefetched, or recently scrolled away from
+    DEFAULT_BYTES_PER_ROW = 64 # a guess at the size of a formatted string, until some have been formatted
+    STATS = ['hits', 'misses', 'hit_rate', 'refill_rows', 'refill_seconds', 'prefetched_rows', 'cached_rows',
+             'nbytes']
+    def __init__(self, src_df_func, column_name, std_cache_size=200, min_cache_on_either_side=MIN_CACHE_MARGIN):
         self.get_src_df = src_df_func
         self.column_name = column_name
-        self.is_numeric = np.issubdtype(self.get_src_df()[self.column_name].dtype, np.number)
+        self.is_numeric = is_numeric(self.get_src_df()[self.column_name].dtype)
         self.native_width = None
         self.assigned_width = None
         self.top_of_cache = 0
         self.row_strings = list()
+        self._segment_nbytes = _strings_nbytes(self.row_strings)
+        # (top row, strings, native width or None if not yet cleaned up, nbytes) per segment
+        self._prefetched = tuple()
+        self._generation = 0 # changes whenever the table does, so that late prefetches can be told apart
         self._min_cache_on_either_side = min_cache_on_either_side
         self._std_cache_size = std_cache_size
+        self.hits = 0 # calls to rows() answered from cached strings, whether current or prefetched
+        self.misses = 0 # calls to rows() that had to format strings then and there
+        self.refill_rows = 0
+        self.refill_seconds = 0.0
+        self.prefetched_rows = 0
+        display_cache_manager.register(self)
+    def __copy__(self):
+        cache = DataframeColumnSegmentCache.__new__(DataframeColumnSegmentCache)
+        cache.__dict__.update(self.__dict__)
+        display_cache_manager.register(cache)
+        return cache
     def _update_native_width(self):
         self.native_width = max(len(self.column_name), DataframeColumnSegmentCache.MIN_WIDTH)
         for idx, s in enumerate(self.row_strings):
@@ -575,52 +1014,157 @@ class DataframeColumnSegmentCache(object):
     @property
     def bottom_of_cache(self):
         return self.top_of_cache + len(self.row_strings)
-
-    def rows(self, top_row, bottom_row):
-        df = self.get_src_df()
-        new_top_of_cache = max(top_row - self._min_cache_on_either_side, 0)
-        new_bottom_of_cache = min(len(df), max(bottom_row + self._min_cache_on_either_side,
-                                               new_top_of_cache + self._std_cache_size))
-        new_cache = None
-        if self.top_of_cache > top_row or self.bottom_of_cache < bottom_row:
-            sliceable_df = DataframeColumnSliceToStringList(df, self.column_name, self.justify)
-            new_cache = sliceable_df[new_top_of_cache:new_bottom_of_cache]
-            assert len(new_cache) == new_bottom_of_cache - new_top_of_cache
+    @property
+    def generation(self):
+        return self._generation
+    @property
+    def cached_rows(self):
+        return len(self.row_strings) + sum(len(segment[1]) for segment in self._prefetched)
+    @property
+    def nbytes(self):
+        return self._segment_nbytes + sum(segment[3] for segment in self._prefetched)
+
+    def stats(self):
+        """The counters in STATS, as a list in that order."""
+        lookups = self.hits + self.misses
+        return [self.hits, self.misses, self.hits / lookups if lookups else float('nan'), self.refill_rows,
+                self.refill_seconds, self.prefetched_rows, self.cached_rows, self.nbytes]
+
+    def segments_held(self):
+        """(strings, nbytes) for each segment, current and kept, as the cache manager counts them."""
+        return [(self.row_strings, self._segment_nbytes)] + [(seg[1], seg[3]) for seg in self._prefetched]
+
+    def evict(self, keep_current=True):
+        """Drops the kept segments, and unless keep_current the current one too. Returns the bytes freed."""
+        freed = sum(segment[3] for segment in self._prefetched)
+        self._prefetched = tuple()
+        if not keep_current and self.row_strings:
+            freed += self._segment_nbytes
+            self.top_of_cache = 0
+            self.row_strings = list()
+            self._segment_nbytes = _strings_nbytes(self.row_strings)
+        return freed
+
+    def _budget_rows(self, showing=()):
+        """How many rows a new segment may have without going over the display cache budget."""
+        held = self.cached_rows
+        bytes_per_row = self.nbytes / held if held else DataframeColumnSegmentCache.DEFAULT_BYTES_PER_ROW
+        headroom = display_cache_manager.available_bytes(self, showing)
+        return int(max(0, headroom) // max(bytes_per_row, 1))
+
+    def _segment_bounds(self, top_row, bottom_row, num_rows, rows_before=None, rows_after=None, showing=()):
+        """The rows that get cached in order to show top_row up to bottom_row.
+
+        The margins default to min_cache_on_either_side. Wider ones shrink as needed to stay within the memory
+        budget left by the caches in showing, though never below the default, so that a full budget slows
+        scrolling down rather than stopping it."""
+        rows_before = self._min_cache_on_either_side if rows_before is None else rows_before
+        rows_after = self._min_cache_on_either_side if rows_after is None else rows_after
+        budget = max(self._budget_rows(showing) - (bottom_row - top_row), 2 * self._min_cache_on_either_side)
+        if rows_before + rows_after > budget:
+            rows_before, rows_after = (rows_before * budget // (rows_before + rows_after),
+                                       rows_after * budget // (rows_before + rows_after))
+        top = max(top_row - rows_before, 0)
+        return top, min(num_rows, max(bottom_row + rows_after, top + self._std_cache_size))
+
+    def format_rows(self, df, top, bottom):
+        """The column's strings for rows top to bottom of df. Only reads df, so may run off the UI thread."""
+        strings = ColumnSliceToStringList(df[self.column_name], self.justify)[top:bottom]
+        assert len(strings) == bottom - top
+        return strings
+
+    def rows(self, top_row, bottom_row, rows_before=None, rows_after=None, showing=()):
+        """The strings for rows top_row up to bottom_row, caching rows_before and rows_after around them.
+
+        showing is the caches on screen (see CacheManager.enforce)."""
+        display_cache_manager.rendered(self)
+        if self.top_of_cache <= top_row and bottom_row <= self.bottom_of_cache:
+            self.hits += 1
+        elif self._swap_in_prefetched(top_row, bottom_row):
+            self.hits += 1
+        else:
+            start = timeit.default_timer()
+            df = self.get_src_df()
+            new_top_of_cache, new_bottom_of_cache = self._segment_bounds(top_row, bottom_row, len(df),
+                                                                         rows_before, rows_after, showing)
+            new_cache = self.format_rows(df, new_top_of_cache, new_bottom_of_cache)
             print('new cache from', new_top_of_cache, 'to', new_bottom_of_cache,
                   len(self.row_strings), len(new_cache))
-            self.top_of_cache = new_top_of_cache
-            self.row_strings = new_cache
-            self._update_native_width()
+            self._set_segment(new_top_of_cache, new_cache)
+            self.misses += 1
+            self.refill_rows += len(new_cache)
+            self.refill_seconds += timeit.default_timer() - start
+            display_cache_manager.enforce(keep=self, showing=showing)
         return self.row_strings[top_row-self.top_of_cache : bottom_row-self.top_of_cache]
 
+    def _set_segment(self, top, strings, native_width=None, nbytes=None):
+        """Makes strings, for the rows from top on, the current segment. The old one is kept, in case we scroll back."""
+        if self.row_strings:
+            retired = (self.top_of_cache, self.row_strings, self.native_width, self._segment_nbytes)
+            self._prefetched = (retired,) + self._prefetched[:self.PREFETCHED_SEGMENTS - 1]
+        self.top_of_cache = top
+        self.row_strings = strings
+        if native_width is None:
+            self._update_native_width()
+        else:
+            self.native_width = native_width
+        self._segment_nbytes = _strings_nbytes(strings) if nbytes is None else nbytes
+
+    def _swap_in_prefetched(self, top_row, bottom_row):
+        for segment in self._prefetched:
+            top, strings, native_width, nbytes = segment
+            if top <= top_row and bottom_row <= top + len(strings):
+                print('swapping in prefetched cache from', top, 'to', top + len(strings))
+                self._prefetched = tuple(other for other in self._prefetched if other is not segment)
+                self._set_segment(top, strings, native_width, nbytes if native_width is not None else None)
+                return True
+        return False
+
+    def segments_to_prefetch(self, top_row, bottom_row, num_rows, direction=1, rows_before=None, rows_after=None,
+                             showing=()):
+        """(top, bottom) of the segments rows() will need when the view scrolls past either end of this one.
+
+        The segment in the direction of scrolling comes first. Segments already on hand are left out."""
+        if not self.row_strings:
+            return list()
+        height = bottom_row - top_row
+        wanted = list()
+        if self.bottom_of_cache < num_rows:
+            wanted.append(self._segment_bounds(self.bottom_of_cache + 1 - height, self.bottom_of_cache + 1, num_rows,
+                                               rows_before, rows_after, showing))
+        if self.top_of_cache > 0:
+            behind = self._segment_bounds(self.top_of_cache - 1, self.top_of_cache - 1 + height, num_rows,
+                                          rows_before, rows_after, showing)
+            wanted.insert(0 if direction < 0 else len(wanted), behind)
+        return [(top, bottom) for top, bottom in wanted
+                if not any(seg[0] <= top and bottom <= seg[0] + len(seg[1]) for seg in self._prefetched)]
+
+    def add_prefetched(self, generation, top, strings, showing=()):
+        """Keeps strings formatted by format_rows for later, unless the table has changed since they were asked for."""
+        if generation == self._generation:
+            segment = (top, strings, None, _strings_nbytes(strings))
+            self._prefetched = (segment,) + self._prefetched[:self.PREFETCHED_SEGMENTS - 1]
+            self.prefetched_rows += len(strings)
+            display_cache_manager.enforce(keep=self, showing=showing)
+
     def clear_cache(self):
         self.top_of_cache = 0
         self.row_strings = list()
+        self._segment_nbytes = _strings_nbytes(self.row_strings)
+        self._prefetched = tuple()
+        self._generation += 1
 
     def search_cache(self, search_string, starting_row, down, case_insensitive):
-        """Returns absolute index where search_string was found; otherwise -1"""
+        """Returns (absolute index where search_string was found or None, row at which the cache search ended)"""
         print('***** NEW SEARCH', self.column_name, search_string, starting_row, down, case_insensitive)
+        if not (self.top_of_cache <= starting_row < self.bottom_of_cache):
+            return None, starting_row # nothing cached here
         starting_row_in_cache = starting_row - self.top_of_cache
         print('running search on current cache, starting at row ', starting_row_in_cache)
         row_idx = search_list_for_str(self.row_strings, search_string, starting_row_in_cache, down, case_insensitive)
         if row_idx is not None:
             print('found item at row_idx', row_idx + self.top_of_cache)
-            return row_idx + self.top_of_cache
-        else:
-            print('failed local cache search - moving on to iterate through dataframe')
-            # search by chunk through dataframe starting from current search position in cache
-            end_of_cache_search = self.top_of_cache + len(self.row_strings) if down else self.top_of_cache
-            sliceable = DataframeColumnSliceToStringList(self.get_src_df(), self.column_name, self.justify)
-            return search_sliceable_by_yielded_chunks_for_str(sliceable, search_string, end_of_cache_search, down, case_insensitive)
-
-
-class DataframeColumnSliceToStringList(object):
-    def __init__(self, df, column, justify):
-        self.df = df
-        self.column = column
-        self.justify = justify
-    def __getitem__(self, val):
-        return self.df.iloc[val].to_string(index=False, index_names=False, header=False,
-                                           columns=[self.column], justify=self.justify).split('\n')
-    def __len__(self):
-        return len(self.df)
+            return row_idx + self.top_of_cache, None
+        print('failed local cache search - the rest of the column will need to be searched')
+        return None, self.bottom_of_cache if down else self.top_of_cache - 1
+
@@ -1,42 +1,171 @@
-from .func_core import df_func
+import numpy as np
+
+from .func_core import df_func, BROWSER_FUNCS
+from .indexed_frame import row_view, key_columns
+from .lazy_frame import materialize
+from .lazy_plan import Filter, Sort, run_plan
+from .predicates import compile_predicate
+from .shared_frames import row_wise_mask
+from .sort_cache import uses_sort_cache
+from .parallel_sort import sort_keys
+from .keybindings import set_keybindings_for_command
 from .gui_debug import print
 
 # keyword arguments provided to dataframe mutator functions include:
 # args_str, cn, c, r (where cn is column name, c is column index, and r is row index),
-# bcols (the browser's visible columns, ordered)
+# bcols (the browser's visible columns, ordered),
+# sort_cache (the browser's SortPermutationCache, for functions that sort),
+# mask_cache (the browser's predicates.MaskCache, for functions that filter on comparisons)
+# Filters and sorts also have planners (see func_core.df_func and lazy_plan), taking the same arguments.
 
 @df_func
 def eval_df(df, args_str, cn, c=0, r=0, **kwargs):
     return eval(args_str)
 
-@df_func
+@df_func(executor='process')
+def eval_rows(df, args_str, cn, c=0, r=0, **kwargs):
+    """Like eval_df, for row-wise expressions - filters like df[df.x > 0], or df.assign(y=...) - which large tables
+    run on every core. df is then one partition of the table, indexed by row position (see shared_frames)."""
+    return eval(args_str)
+
+def _query_step(df, args_str, **kwargs):
+    return Filter('query ' + args_str, expr=args_str)
+
+@df_func(views=True, planner=_query_step)
 def query(df, args_str, **kwargs):
-    return df.query(args_str)
+    return row_view(df, np.flatnonzero(_query_step(df, args_str).mask(df)))
 
-@df_func
+def _where_step(df, args_str, mask_cache=None, **kwargs):
+    predicate = compile_predicate(args_str, df)
+    return Filter('where ' + args_str, mask=lambda df: predicate.mask(df, mask_cache))
+
+@df_func(views=True, planner=_where_step)
+def where(df, args_str, mask_cache=None, **kwargs):
+    """Keeps the rows matching a predicate, e.g. 'price >= 10 and not (sym == AAPL or sym =~ ^X)' (see predicates)."""
+    return row_view(df, np.flatnonzero(compile_predicate(args_str, df).mask(df, mask_cache)))
+
+set_keybindings_for_command('where', ['w'])
+
+def _sort_step(df, columns, ascending=True, algorithm='mergesort', na_position=None, **kwargs):
+    if algorithm not in ('mergesort', 'stable'):
+        return None # only stable sorts can be merged with others
+    return Sort(columns, ascending, na_position if na_position is not None else ('last' if ascending else 'first'))
+
+def _sort_ascending_step(df, args_str, **kwargs):
+    return _sort_step(df, [arg.strip() for arg in args_str.split(',')], ascending=True, **kwargs)
+
+def _sort_descending_step(df, args_str, **kwargs):
+    return _sort_step(df, [arg.strip() for arg in args_str.split(',')], ascending=False, **kwargs)
+
+@df_func(views=True, planner=_sort_ascending_step)
 def sort_ascending_on_columns(df, args_str, **kwargs):
     columns = [arg.strip() for arg in args_str.split(',')]
     return sort_on_columns(df, columns, ascending=True, **kwargs)
 
-@df_func
+@df_func(views=True, planner=_sort_descending_step)
 def sort_descending_on_columns(df, args_str, **kwargs):
     columns = [arg.strip() for arg in args_str.split(',')]
     return sort_on_columns(df, columns, ascending=False, **kwargs)
 
-@df_func
-def sort_on_columns(df, columns, ascending=True, algorithm='mergesort', na_position=None, **kwargs):
+@df_func(views=True, planner=_sort_step)
+def sort_on_columns(df, columns, ascending=True, algorithm='mergesort', na_position=None, sort_cache=None, **kwargs):
     """args_str is expected to be a comma-separated list of column names"""
     print('sorting on columns', columns, ascending)
     na_position = na_position if na_position is not None else ('last' if ascending else 'first')
-    return df.sort_values(columns, ascending=ascending, kind=algorithm, na_position=na_position)
+    if sort_cache is not None and uses_sort_cache(df, algorithm):
+        return sort_cache.sort(df, columns, ascending, na_position)
+    keys = key_columns(df, columns)
+    order = keys.sort_values(columns, ascending=ascending, kind=algorithm, na_position=na_position).index
+    return row_view(df, order.to_numpy())
 
-@df_func
+def _select_extreme_rows(df, cn, n, largest):
+    """Positions of the n rows of df with the largest (or smallest) values in column cn, in sorted order.
+
+    The same rows, in the same order, as the first n of a stable sort with missing values last -
+    ties at the cutoff go to the rows that come first - but only the selected rows get sorted,
+    which is O(len(df) + n log n) rather than O(len(df) log len(df))."""
+    column = key_columns(df, [cn])[cn]
+    keyed = sort_keys(column)
+    if keyed is None: # can't be reduced to sortable keys, so fall back to a full sort
+        order = column.sort_values(ascending=not largest, kind='mergesort', na_position='last').index.to_numpy()
+        return order[:n]
+    keys, missing = keyed
+    valid = np.flatnonzero(~missing)
+    valid_keys = keys[valid]
+    if n < len(valid):
+        kth = len(valid) - n if largest else n - 1
+        threshold = np.partition(valid_keys, kth)[kth]
+        beyond = valid_keys > threshold if largest else valid_keys < threshold
+        at_threshold = np.flatnonzero(valid_keys == threshold)[:n - np.count_nonzero(beyond)]
+        chosen = np.sort(np.concatenate([np.flatnonzero(beyond), at_threshold]))
+        valid, valid_keys = valid[chosen], valid_keys[chosen]
+    if largest: # a stable descending sort, as pandas does it: sort the reversed rows, then reverse the result
+        order = np.argsort(valid_keys[::-1], kind='stable')[::-1]
+        order = len(valid_keys) - 1 - order
+    else:
+        order = np.argsort(valid_keys, kind='stable')
+    selected = valid[order]
+    if len(selected) < n: # fewer valid values than asked for; missing ones come last
+        selected = np.concatenate([selected, np.flatnonzero(missing)[:n - len(selected)]])
+    return selected
+
+@df_func(views=True)
+def top_n(df, args_str, cn, **kwargs):
+    """The N (default 100) rows with the largest values in the selected column, largest first."""
+    n = int(args_str) if args_str else 100
+    return row_view(df, _select_extreme_rows(df, cn, n, largest=True))
+
+@df_func(views=True)
+def bottom_n(df, args_str, cn, **kwargs):
+    """The N (default 100) rows with the smallest values in the selected column, smallest first."""
+    n = int(args_str) if args_str else 100
+    return row_view(df, _select_extreme_rows(df, cn, n, largest=False))
+
+set_keybindings_for_command('top_n', ['T'])
+set_keybindings_for_command('bottom_n', ['B'])
+
+def _str_kernel(df, method, args_str, cn):
+    return getattr(df[cn].str, method)(args_str, na=False).to_numpy(dtype=bool)
+
+def _str_mask(method, args_str, cn):
+    # matching Python strings holds the GIL, so large columns are matched in several processes
+    return lambda df: row_wise_mask(key_columns(df, [cn]), _str_kernel, method=method, args_str=args_str, cn=cn)
+
+def _str_match_step(df, args_str, cn, **kwargs):
+    return Filter('str_match {} {}'.format(cn, args_str), mask=_str_mask('match', args_str, cn))
+
+def _str_contains_step(df, args_str, cn, **kwargs):
+    return Filter('str_contains {} {}'.format(cn, args_str), mask=_str_mask('contains', args_str, cn))
+
+@df_func(views=True, planner=_str_match_step)
 def str_match(df, args_str, cn, **kwargs):
-    return df.loc[df[cn].str.match(args_str, na=False)]
+    return row_view(df, np.flatnonzero(_str_mask('match', args_str, cn)(df)))
 
-@df_func
+@df_func(views=True, planner=_str_contains_step)
 def str_contains(df, args_str, cn, **kwargs):
-    return df.loc[df[cn].str.contains(args_str, na=False)]
+    return row_view(df, np.flatnonzero(_str_mask('contains', args_str, cn)(df)))
+
+@df_func(views=True)
+def pipeline(df, args_str, sort_cache=None, **kwargs):
+    """Runs several browser functions as one table change.
+
+    args_str is a ';'-separated list of calls, each a function name followed by its arguments, e.g.
+    'query price > 10; str_contains foo; sort_descending_on_columns volume'. Filters and sorts are
+    run together as a single optimized plan (see lazy_plan); any other function runs on the result so far."""
+    steps = list()
+    for call in args_str.split(';'):
+        name, _, func_args = call.strip().partition(' ')
+        func = BROWSER_FUNCS[name]
+        step = func.planner(df, args_str=func_args.strip(), **kwargs) if func.planner else None
+        if step is not None:
+            steps.append(step)
+            continue
+        df = run_plan(df, steps, sort_cache)
+        steps = list()
+        new_df = func(df if func.understands_views else materialize(df),
+                      args_str=func_args.strip(), sort_cache=sort_cache, **kwargs)
+        df = new_df if new_df is not None else df
+    return run_plan(df, steps, sort_cache)
 
 def save_df(df, path):
     if path.endswith('.csv'):
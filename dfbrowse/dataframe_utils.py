@@ -1,32 +1,51 @@
 import operator as op
 import types
 import numpy as np
+import pandas as pd
 
 
 # this converts a string column into a datetime column
-# if a column cannot be found, it is simply skipped
-def convert_df_date_cols(df, date_cols):
+# if a column cannot be found, it is simply skipped.
+# Given the browser's sort_cache, each converted column's order is also detected right away, so that
+# date-range filters and jumps on a column already in date order are binary searches from the start.
+def convert_df_date_cols(df, date_cols, sort_cache=None):
     for col in date_cols:
         try:
             df[col] = pd.to_datetime(df[col])
         except:
             # this column can't be found
             pass # maybe log an error?
+        else:
+            if sort_cache is not None:
+                sort_cache.forget(df, col) # anything cached was for the strings
+                sort_cache.known_sorted_index(df, col)
 
 # KEN: this function filters by date range.
-def df_filter_date_range(df, date_col, date_start=None, date_end=None):
-    if date_start:
-        # here we simply ask for all rows where the date_col value is >= the provided date_start
-        df = df[ df[date_col] >= date_start ]
-    if date_end:
-        # and the same for date_end
-        df = df[ df[date_col] <= date_end ]
-
-    # IMPORTANT:
-    # in both of those filter statements, we assigned the result back to the original
-    # variable name in order to continue to narrow our set, since the filter
-    # operation does not happen in-place, but instead returns a filtered 'view' of the dataframe.
-    return df
+# Both ends are inclusive. A column already in date order, or one the browser's sort_cache has sorted,
+# finds the range by binary search of its SortedIndex; in date order, the result is then just a slice.
+# Otherwise one mask pass is cheaper than sorting the column for a single filter.
+def df_filter_date_range(df, date_col, date_start=None, date_end=None, sort_cache=None):
+    from .sorted_index import SortedIndex # sorted_index builds on predicates, which builds on this module
+    date_start = date_start if date_start else None
+    date_end = date_end if date_end else None
+    if date_start is None and date_end is None:
+        return df
+    if sort_cache is not None:
+        index = sort_cache.known_sorted_index(df, date_col)
+    elif not df[date_col].hasnans and df[date_col].is_monotonic_increasing:
+        index = SortedIndex(df[date_col]) # checking the order is one cheap pass, and needs no copies
+    else:
+        index = None
+    if index is None: # one pass over the column for both ends, rather than one for each
+        mask = pd.Series(True, index=df.index)
+        if date_start is not None:
+            mask &= df[date_col] >= date_start
+        if date_end is not None:
+            mask &= df[date_col] <= date_end
+        return df[mask]
+    if index.monotonic:
+        return df.iloc[slice(*index.bounds(date_start, date_end))]
+    return df.iloc[index.rows_between(date_start, date_end)]
 
 
 comparison_ops_dict = {
@@ -55,21 +74,7 @@ def operator_lookup(operator):
 
 # all sorts of things can make this raise.
 # the caller should be aware that invalid queries will be violently rejected.
-def where(df, col_name, operator, val):
-    col = df[col_name]
-    operator = operator_lookup(operator)
-
-    if op.contains in operator and col.dtype.type == np.object_:
-        # this is a special case, because op.contains does not work with Series
-        if op.not_ in operator:
-            df = df[~col.str.contains(val, na=False)]
-        else:
-            df = df[col.str.contains(val, na=False)]
-        return df
-
-    try:
-        # try converting the operator to the type of the column
-        return df[operator(col, col.dtype.type(val))]
-    except:
-        # if that doesn't work, fail over to naive comparison
-        return df[operator(col, val)]
+# For compound conditions, and to reuse masks between calls, see predicates.
+def where(df, col_name, operator, val, mask_cache=None):
+    from .predicates import comparison_predicate # predicates builds on this module's operators
+    return df[comparison_predicate(df, col_name, operator, val).mask(df, mask_cache)]
@@ -5,12 +5,27 @@ from .gui_debug import debug_print
 BROWSER_FUNCS = dict()
 
 
-# a decorator that adds a function to a set of functions exposed by the browser
-def df_func(f):
+# a decorator that adds a function to a set of functions exposed by the browser.
+# Use it bare, or as @df_func(views=True) for functions that can take a row view (see indexed_frame)
+# instead of a full DataFrame, which saves the browser from copying the table before calling them.
+# A planner takes the same arguments as the function and returns a lazy_plan step (a Filter or Sort)
+# that does the same thing, or None if it can't; browsers in lazy mode record that step instead of calling f.
+# executor says where the UI runs f: 'thread' (the default) on a worker thread, so that the UI stays responsive,
+# or 'inline' on the UI thread itself, for functions that are instant or that need the UI thread.
+# 'process' is for row-wise functions that hold the GIL: f is called on partitions of the table in a pool of
+# worker processes, and the results put back together (see shared_frames).
+EXECUTORS = ('thread', 'inline', 'process')
+def df_func(f=None, views=False, planner=None, executor='thread'):
+    if f is None:
+        return functools.partial(df_func, views=views, planner=planner, executor=executor)
     debug_print('adding function to dataframe_browser module', f, f.__name__)
+    assert executor in EXECUTORS, 'unknown executor ' + executor
     global BROWSER_FUNCS
+    f.understands_views = views
+    f.planner = planner
+    f.executor = executor
     BROWSER_FUNCS[f.__name__] = f
-    return functools.wraps(f)
+    return f
 
 
 # eventually this should replace df_func, so that keybindings and help text are integrated.
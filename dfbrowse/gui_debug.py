@@ -1,10 +1,13 @@
 # UI debug printing
 
+import os
 import timeit
 import traceback
 
 DEBUG = True
 debug_filename = 'debug.log'
+# set by the process that starts the log, for the worker processes it starts (see shared_frames) to append to it
+_LOG_ENV_VAR = 'DFBROWSE_DEBUG_LOG'
 
 def debug_print(*args):
     try:
@@ -19,7 +22,11 @@ def nondebug_print(*args):
 
 if DEBUG:
     # print('opening debug file!')
-    debug_file = open('debug.log', 'w+')
+    if _LOG_ENV_VAR not in os.environ: # not a worker process, which must not wipe its parent's log
+        open(debug_filename, 'w').close()
+        os.environ[_LOG_ENV_VAR] = os.path.abspath(debug_filename)
+    # appending, every process writes at the end of the log, rather than over what the others wrote
+    debug_file = open(os.environ[_LOG_ENV_VAR], 'a')
     print = debug_print
 else:
     print = nondebug_print
@@ -0,0 +1,228 @@
+# keeping the undo history within a memory budget.
+#
+# Every table change pushes a new frame onto a browser's history, and undo
+# needs all of them. Once the frames in the history add up to more than the
+# budget, the ones farthest from the current position in the history are
+# written to a temporary directory and dropped from memory. They are read
+# back the next time undo or redo reaches them. Frames never change once they
+# are in the history, so a frame only ever has to be written out once.
+#
+# Sorts and filters are kept as row views, which keep their base DataFrame
+# alive. A base is counted once however many views share it. When a frame is
+# spilled, the history's views of it let go of it too, keeping only their row
+# positions, and are rebuilt over the one reloaded copy when next needed. A
+# frame that something else in memory still uses - the current table, or a
+# lazy plan - is never spilled, since that would free nothing.
+#
+# DataFrames are told apart by keys handed out from a counter rather than by
+# id(), which Python reuses as soon as a DataFrame is freed. A frame read
+# back from disk gets the key of the one that was spilled.
+
+import itertools
+import os
+import pickle
+import sys
+import tempfile
+import weakref
+
+import pandas as pd
+
+from .indexed_frame import IndexedFrame
+from .lazy_plan import PlanFrame
+from .gui_debug import print
+
+SAMPLE_OBJECTS = 1000 # object columns are sized from a sample of this many values
+
+
+def frame_nbytes(df):
+    """A cheap estimate of the memory a DataFrame holds, including the Python objects in object columns."""
+    if not isinstance(df, pd.DataFrame):
+        return getattr(df, 'nbytes', 0) # lazy frames and row views hold very little of their own
+    nbytes = int(df.memory_usage(index=True, deep=False).sum())
+    for col in df.columns[(df.dtypes == object).to_numpy()]:
+        values = df[col].iloc[:SAMPLE_OBJECTS] if len(df) > SAMPLE_OBJECTS else df[col]
+        if len(values):
+            nbytes += int(sum(sys.getsizeof(v) for v in values) / len(values) * len(df))
+    return nbytes
+
+
+_frame_keys = dict() # id() -> (weak reference, key) for each DataFrame that has been given a key
+_new_keys = itertools.count()
+
+
+def frame_key(df, key=None):
+    """A key for a DataFrame that, unlike its id(), no other DataFrame is given after this one is freed.
+
+    Passing key gives df that key instead, e.g. for a copy read back from disk."""
+    frame_id = id(df)
+    entry = _frame_keys.get(frame_id)
+    if entry is None or entry[0]() is not df or (key is not None and entry[1] != key):
+        def forget(ref):
+            if _frame_keys.get(frame_id, (None,))[0] is ref:
+                _frame_keys.pop(frame_id, None)
+        entry = (weakref.ref(df, forget), next(_new_keys) if key is None else key)
+        _frame_keys[frame_id] = entry
+    return entry[1]
+
+
+def kept_frames(df):
+    """The DataFrames that df keeps in memory: df itself, or the bases of a row view or plan."""
+    if isinstance(df, pd.DataFrame):
+        return [df]
+    if isinstance(df, IndexedFrame):
+        return [df.base]
+    if isinstance(df, PlanFrame):
+        return kept_frames(df.source) + (kept_frames(df._result) if df._result is not None else [])
+    return list()
+
+
+def _write_spill(df, directory):
+    """Writes the frame as parquet if it can, and pickles it otherwise. Returns the path written."""
+    fd, path = tempfile.mkstemp(dir=directory, suffix='.parquet')
+    os.close(fd)
+    try:
+        import pyarrow # noqa - optional dependency; pickling is the fallback
+        df.to_parquet(path)
+        return path
+    except Exception as e: # no pyarrow, or a frame parquet can't represent (e.g. mixed-type object columns)
+        print('pickling history frame instead of writing parquet:', e)
+    os.remove(path)
+    fd, path = tempfile.mkstemp(dir=directory, suffix='.pickle')
+    with os.fdopen(fd, 'wb') as f:
+        pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def _read_spill(path):
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class FrameRef(object):
+    """A frame in an undo history, which may be on disk rather than in memory."""
+    def __init__(self, df, spillable=True):
+        self._df = df
+        # (key, nbytes) of each DataFrame this frame keeps alive - itself, or the bases of a view - plus the
+        # bytes of its own that aren't in any of them
+        self.frames = [(frame_key(frame), frame_nbytes(frame)) for frame in kept_frames(df)]
+        self.own_nbytes = 0 if isinstance(df, pd.DataFrame) else frame_nbytes(df)
+        self.nbytes = self.own_nbytes + sum(nbytes for _, nbytes in self.frames)
+        self.spillable = spillable and isinstance(df, pd.DataFrame)
+        self.spill_path = None
+
+        self._positions = None # for a row view that has let go of its base,
+        self._base_ref = None # the view's rows, and the FrameRef of its base
+
+    @property
+    def in_memory(self):
+        return self._df is not None
+
+    @property
+    def df(self):
+        if self._df is None and self._base_ref is not None:
+            self._df = IndexedFrame(self._base_ref.df, self._positions)
+        elif self._df is None:
+            print('reloading history frame from', self.spill_path)
+            self._df = _read_spill(self.spill_path)
+            frame_key(self._df, self.frames[0][0])
+        return self._df
+
+    def follow(self, base_ref):
+        """Lets go of this row view's base, which base_ref is about to spill, keeping just the view's rows."""
+        assert isinstance(self._df, IndexedFrame) and self._df.base is base_ref._df
+        self._positions = self._df.positions
+        self._base_ref = base_ref
+        self._df = None
+
+    def spill(self, directory):
+        assert self.spillable
+        if self.spill_path is None:
+            self.spill_path = _write_spill(self._df, directory)
+            weakref.finalize(self, _remove_file, self.spill_path)
+        self._df = None
+
+
+def _resident_nbytes(refs):
+    """The memory refs hold between them, counting each DataFrame once however many of them keep it."""
+    frames = dict()
+    for ref in refs:
+        frames.update(ref.frames)
+    return sum(ref.own_nbytes for ref in refs) + sum(frames.values())
+
+
+def _views_of(ref, resident, current_ref):
+    """The row views in resident that keep ref's DataFrame alive - or None if anything else does, such as
+    the current table or a lazy plan, in which case spilling ref would free nothing."""
+    key = ref.frames[0][0]
+    views = list()
+    for other in resident:
+        if other is ref or not any(other_key == key for other_key, _ in other.frames):
+            continue
+        if other is current_ref or not isinstance(other._df, IndexedFrame):
+            return None
+        views.append(other)
+    return views
+
+
+class HistoryStore(object):
+    """Decides which frames in a history stay in memory. Shared by a browser and any copies of it."""
+    DEFAULT_BUDGET_BYTES = 2 * 1024**3
+
+    def __init__(self, budget_bytes=DEFAULT_BUDGET_BYTES, spill_dir=None):
+        self.budget_bytes = budget_bytes
+        self._spill_dir = spill_dir
+        self.bytes_in_memory = 0
+        self.bytes_spilled = 0
+
+    @property
+    def spill_dir(self):
+        if self._spill_dir is None:
+            self._spill_dir = tempfile.mkdtemp(prefix='dfbrowse-history-')
+        return self._spill_dir
+
+    def balance(self, refs, current):
+        """Spills frames until the history fits the budget, farthest from the current position first.
+
+        refs is every FrameRef in the history and redo list, in order, and current is the position of the
+        one in use, which always stays (or is about to be) in memory."""
+        distance = dict() # ref -> (distance from current, ref), for each distinct frame
+        for i, ref in enumerate(refs):
+            if ref not in distance or abs(i - current) < distance[ref][0]:
+                distance[ref] = (abs(i - current), ref)
+        current_ref = refs[current]
+        unique = [ref for _, ref in sorted(distance.values(), key=lambda d_ref: d_ref[0])]
+        resident = lambda: [ref for ref in unique if ref.in_memory or ref is current_ref]
+        in_memory = _resident_nbytes(resident())
+        for ref in reversed(unique):
+            if in_memory <= self.budget_bytes:
+                break
+            if not (ref.in_memory and ref.spillable and ref is not current_ref):
+                continue
+            views = _views_of(ref, resident(), current_ref)
+            if views is None:
+                continue
+            print('spilling history frame of {:,} bytes, and {} views of it'.format(ref.nbytes, len(views)))
+            for view in views:
+                view.follow(ref)
+            ref.spill(self.spill_dir)
+            in_memory = _resident_nbytes(resident())
+        self.bytes_in_memory = in_memory
+        needed = {key for ref in resident() for key, _ in ref.frames} # being reloaded for the current table
+        self.bytes_spilled = _resident_nbytes([ref for ref in unique if ref.spill_path and not ref.in_memory
+                                               and ref.frames[0][0] not in needed])
+
+    @property
+    def status(self):
+        if not self.bytes_spilled:
+            return 'history {:.0f}MB'.format(self.bytes_in_memory / 1024**2)
+        return 'history {:.0f}MB, {:.0f}MB on disk'.format(self.bytes_in_memory / 1024**2,
+                                                          self.bytes_spilled / 1024**2)
@@ -0,0 +1,84 @@
+# row views: sorted and filtered tables without copying them.
+#
+# Sorting or filtering a wide DataFrame copies every column, and each result
+# stays alive in the undo history. An IndexedFrame instead records the base
+# DataFrame and an array of row positions into it, so each derived table
+# costs 4 or 8 bytes per row. Views of views compose their position arrays
+# over the same base. Rows are only gathered for what is on screen, or in
+# full when something really needs a DataFrame (export, eval, etc.).
+
+import numpy as np
+import pandas as pd
+
+from .lazy_frame import LazyFrame, materialize
+
+
+def _positions_dtype(num_rows):
+    return np.int32 if num_rows < 2**31 else np.int64
+
+
+class IndexedFrame(LazyFrame):
+    """The rows of a base DataFrame at the given positions, in that order."""
+    def __init__(self, base, positions):
+        assert isinstance(base, pd.DataFrame)
+        self.base = base
+        self.positions = np.asarray(positions).astype(_positions_dtype(len(base)), copy=False)
+        self._increasing = None
+        super().__init__(list(base.columns), list(base.dtypes))
+
+    def __len__(self):
+        return len(self.positions)
+
+    @property
+    def nbytes(self):
+        """The memory this view holds of its own - not counting the base, which it shares."""
+        return self.positions.nbytes
+
+    @property
+    def increasing(self):
+        """Whether the rows are in base order, as they are for filters of the base. Checked the first time."""
+        if self._increasing is None:
+            self._increasing = bool(np.all(self.positions[1:] >= self.positions[:-1]))
+        return self._increasing
+
+    def column(self, column_name):
+        """The full column, in view order, as a Series indexed like the base."""
+        return self.base[column_name].take(self.positions)
+
+    def read(self, start, stop, columns=None):
+        columns = list(self.columns) if columns is None else columns
+        positions = self.positions[start:stop]
+        return pd.DataFrame({col: self.base[col].take(positions).reset_index(drop=True) for col in columns},
+                            columns=columns)
+
+    def to_pandas(self):
+        return self.base.take(self.positions)
+
+
+def row_view(df, positions):
+    """Returns a view of the rows of df at the given positions, without copying any columns.
+
+    df may be a DataFrame or a view already, in which case the result is a view of the same base."""
+    if isinstance(df, IndexedFrame):
+        return IndexedFrame(df.base, df.positions[positions])
+    return IndexedFrame(materialize(df), positions)
+
+
+def key_columns(df, columns):
+    """Returns a DataFrame of just the given columns of df (a DataFrame or a view), in df's row order.
+
+    The index is reset, so positions in the result are positions in df."""
+    if isinstance(df, IndexedFrame):
+        return pd.DataFrame({col: df.column(col).reset_index(drop=True) for col in columns}, columns=columns)
+    return df[columns].reset_index(drop=True)
+
+
+def view_mask(df, evaluate, columns):
+    """Calls evaluate with a DataFrame of df's rows, and returns its boolean result in df's row order.
+
+    For a view, evaluate gets just the given columns, gathered in view order with the index reset. Expressions
+    (eval, query) are evaluated over the view's rows rather than the whole base, so that aggregates like
+    b > b.mean() see only those rows, and a small view is not paid for at the size of its base."""
+    if isinstance(df, IndexedFrame):
+        return np.asarray(evaluate(key_columns(df, columns)))
+    return np.asarray(evaluate(df))
@@ -6,6 +6,8 @@ from IPython.core import getipython
 import pandas as pd
 
 from .dataframe_browser import MultipleDataframeBrowser
+from .parquet_frame import ParquetFrame
+from .csv_stream_frame import StreamingCsvFrame
 
 
 def _parse_and_file_load(browser, load_func, line: str):
@@ -50,13 +52,13 @@ class IpythonCli(Magics):
 
     @line_magic
     def pq(self, line):
-        """Loads a parquet file into the browser"""
-        self.browser.browse(_parse_and_file_load(self.browser, pd.read_parquet, line))
+        """Opens a parquet file in the browser, reading only the rows and columns in view"""
+        self.browser.browse(_parse_and_file_load(self.browser, ParquetFrame, line))
 
     @line_magic
     def csv(self, line):
-        """Loads a csv file into the browser"""
-        self.browser.browse(_parse_and_file_load(self.browser, pd.read_csv, line))
+        """Loads a csv file into the browser, which opens as soon as the first rows are parsed"""
+        self.browser.browse(_parse_and_file_load(self.browser, StreamingCsvFrame, line))
 
 
 def load_ipython_extension(ipython):
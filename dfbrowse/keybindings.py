@@ -21,6 +21,10 @@ _commands = { # these commands are specifically for use in the browser
     'hide-column': ['H'],
     'search': ['ctrl s', 'meta s'],  # ctrl s not working for... some reason?
     'search-backward': ['ctrl r', 'meta r'],
+    'toggle-search-regex': ['meta e'],  # while searching
+    'find-all': ['f'],
+    'next-match': ['meta n'],
+    'previous-match': ['meta p'],
     'sort-ascending': ['s'],
     'sort-descending': ['S'],
     'browse-right': ['right', 'l'],
@@ -31,6 +35,7 @@ _commands = { # these commands are specifically for use in the browser
     'redo': ['U'],
     'quit': ['q'],
     'query': ['y'],
+    'toggle-lazy': ['L'],
     'page-up': ['page up'],
     'page-down': ['page down'],
     'help': ['?'],
@@ -47,6 +52,7 @@ _commands = { # these commands are specifically for use in the browser
     'switch-to-browser': ['b'],
     'jump-to-column': ['c'],
     'jump-to-row': ['r'],
+    'jump-to-value': ['g'],
     'command': ['/'],
     'ipython': ['p'],
 }
@@ -55,6 +61,11 @@ _exception_hints = {
     'jump-to-column': 'Column "{}" not found in table browser.',
     'jump-to-row': 'Rows may only be indexed by integer or floating point number, and must not be out of range.',
     'insert-column': 'Column "{}" not found in table browser.',
+    'jump-to-value': '"{}" is not a value of the selected column, or the column is not numeric or datetime.',
+    'top_n': 'N must be a whole number, not "{}".',
+    'bottom_n': 'N must be a whole number, not "{}".',
+    'where': 'Expected comparisons like price >= 10, joined by and, or, not and parentheses.',
+    'pipeline': 'Separate the steps with ";", each a browser function name followed by its arguments.',
 }
 
 # on startup, verify no duplicate keybindings for developer (my) sanity
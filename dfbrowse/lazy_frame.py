@@ -0,0 +1,97 @@
+# lazy, frame-like tables for the browser.
+#
+# The browser, row view and column caches only need a small part of the
+# DataFrame interface: len(), .columns, and frame[column] giving something
+# with a .dtype and an .iloc that slices out a Series. A LazyFrame provides
+# exactly that much, and only reads rows when a slice is asked for, so a
+# browser over a very large file pays for what is on screen and no more.
+
+import pandas as pd
+
+
+class LazyFrame(object):
+    """Base class for tables that produce rows on demand.
+
+    Subclasses must set up columns and dtypes via this __init__ and implement __len__ and read."""
+    def __init__(self, columns, dtypes):
+        self.columns = pd.Index(columns)
+        self.dtypes = pd.Series(dtypes, index=self.columns, dtype=object)
+        self._listeners = list()
+
+    def __len__(self):
+        raise NotImplementedError()
+
+    def read(self, start, stop, columns=None):
+        """Returns a DataFrame of rows [start, stop) for the given columns (default all)."""
+        raise NotImplementedError()
+
+    def to_pandas(self):
+        """Materializes the full table, once it has finished loading. This may be very expensive!"""
+        self.wait()
+        return self.read(0, len(self))
+
+    def wait(self, timeout=None):
+        """Blocks until every row is available, or timeout seconds have passed. Returns whether they are.
+
+        Tables that load in the background override this; until it returns True, len() is a lower bound."""
+        return True
+
+    @property
+    def status(self):
+        """A short string describing the state of the table, for display in a modeline."""
+        return ''
+
+    def add_listener(self, cb):
+        """cb() is called whenever the table grows or its status changes - possibly from another thread."""
+        self._listeners.append(cb)
+
+    def _notify(self):
+        for cb in self._listeners:
+            cb()
+
+    def __getitem__(self, column_name):
+        if column_name not in self.columns:
+            raise KeyError(column_name)
+        return LazyColumn(self, column_name)
+
+
+class LazyColumn(object):
+    def __init__(self, frame, name):
+        self.frame = frame
+        self.name = name
+    @property
+    def dtype(self):
+        return self.frame.dtypes[self.name]
+    def __len__(self):
+        return len(self.frame)
+    @property
+    def iloc(self):
+        return _LazyColumnILoc(self)
+
+
+class _LazyColumnILoc(object):
+    def __init__(self, column):
+        self.column = column
+    def __getitem__(self, val):
+        length = len(self.column)
+        if isinstance(val, slice):
+            start, stop, step = val.indices(length)
+            assert step == 1, 'LazyColumn only supports contiguous slices'
+            stop = max(start, stop)
+            series = self.column.frame.read(start, stop, [self.column.name])[self.column.name]
+            series.index = pd.RangeIndex(start, stop)
+            return series
+        row = val if val >= 0 else length + val
+        if row < 0 or row >= length:
+            raise IndexError(val)
+        return self.column.frame.read(row, row + 1, [self.column.name])[self.column.name].iloc[0]
+
+
+def materialize(df):
+    """Returns a real pandas DataFrame for either a DataFrame or a LazyFrame."""
+    return df if isinstance(df, pd.DataFrame) else df.to_pandas()
+
+
+def wait_until_loaded(df, timeout=None):
+    """Like LazyFrame.wait, for either a DataFrame (always loaded) or a LazyFrame."""
+    return True if isinstance(df, pd.DataFrame) else df.wait(timeout)
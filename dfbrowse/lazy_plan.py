@@ -0,0 +1,218 @@
+# recording filters and sorts as a plan, and running the plan only when its rows are needed.
+#
+# Each eager browser function makes a new table, and a chain of them over a
+# big frame costs a pass over the frame per step. A PlanFrame instead records
+# the steps - filters and sorts, as described by the functions' planners (see
+# func_core.df_func) - over a source table, and only works out its rows when
+# something asks for them. Before running, the plan is rewritten:
+#
+#   - row-wise filters keep or drop each row on its own values, and a stable
+#     sort keeps the order of ties, so they can run before every sort;
+#   - row-wise query filters become one expression, evaluated in one pass, and
+#     the other filters then only look at the rows that are left;
+#   - consecutive sorts become a single multi-column sort, the latest sort's
+#     columns first, since sorting stably on A and then on B orders by B and
+#     then A. After a filter, that sort only sorts the rows that are left,
+#     unless the browser's sort cache already has orders for its columns.
+#
+# A query that isn't plainly row-wise - one that calls something, like
+# b > b.mean() or a > a.shift() - depends on which rows it sees and in what
+# order. It stays where it is in the plan: the steps before it are run first,
+# and it is never merged with anything.
+#
+# The result is a row view (see indexed_frame), so only the columns the
+# filters and sorts mention are read to run the plan, and only the visible
+# columns when drawing it. A plan extended after it has run builds on its
+# result rather than its source, so no step is ever run twice.
+
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+from .lazy_frame import LazyFrame, materialize
+from .indexed_frame import IndexedFrame, row_view, key_columns, view_mask
+from .sort_cache import SortPermutationCache
+from .gui_debug import print
+
+
+_NAME = re.compile(r'`([^`]*)`|([A-Za-z_]\w*)')
+_CALL_OR_INDEX = re.compile(r'([\w)\]`]+)\s*[(\[]')
+_ATTRIBUTE = re.compile(r'[A-Za-z_)\]`]\s*\.\s*[A-Za-z_]')
+_KEYWORDS = ('and', 'or', 'not', 'in')
+
+
+def expression_columns(df, expr):
+    """The columns of df that a pandas eval/query expression mentions, by name or in backticks."""
+    names = {quoted or name for quoted, name in _NAME.findall(expr)}
+    return [col for col in df.columns if col in names]
+
+
+def is_row_wise(expr):
+    """Whether a query expression only compares values within each row. Expressions with calls, attributes,
+    indexing or local variables might aggregate over rows, or depend on their order, so count as not row-wise."""
+    if '@' in expr or _ATTRIBUTE.search(expr):
+        return False
+    return all(m.group(1) in _KEYWORDS for m in _CALL_OR_INDEX.finditer(expr))
+
+
+class Filter(object):
+    """A plan step keeping the rows of a table for which mask(table) is True.
+
+    mask must decide each row on that row's values alone. A filter with an expr is a pandas query expression;
+    if it is row-wise, it may be merged with others into a single evaluation, and moved ahead of sorts."""
+    def __init__(self, description, mask=None, expr=None):
+        self.description = description
+        self.expr = expr
+        self._mask = mask
+        self.row_wise = expr is None or is_row_wise(expr)
+
+    def mask(self, df):
+        if self._mask is not None:
+            return np.asarray(self._mask(df), dtype=bool)
+        mask = view_mask(df, lambda rows: rows.eval(self.expr), expression_columns(df, self.expr))
+        if mask.dtype != bool:
+            raise ValueError('query must evaluate to a boolean for each row: ' + self.expr)
+        return mask
+
+
+class Sort(object):
+    """A plan step sorting stably on columns. ascending and na_position have one entry per column."""
+    def __init__(self, columns, ascending, na_position):
+        self.columns = list(columns)
+        self.ascending = list(ascending) if isinstance(ascending, (list, tuple)) else [ascending] * len(self.columns)
+        self.na_position = (list(na_position) if isinstance(na_position, (list, tuple))
+                            else [na_position] * len(self.columns))
+
+    @property
+    def description(self):
+        return 'sort ' + ', '.join('{} {}'.format(col, 'asc' if asc else 'desc')
+                                   for col, asc in zip(self.columns, self.ascending))
+
+
+def _merge_filters(filters):
+    """Row-wise filters merged into as few as possible: the query expressions into one, then the rest."""
+    exprs = [f.expr for f in filters if f.expr is not None]
+    merged = [Filter(' & '.join(exprs), expr=' & '.join('({})'.format(e) for e in exprs))] if exprs else []
+    return merged + [f for f in filters if f.expr is None]
+
+
+def _merge_sorts(sorts):
+    """One sort equivalent to applying sorts in order. A column's latest sort decides its ties, so earlier ones go."""
+    columns, ascending, na_position = list(), list(), list()
+    for sort in reversed(sorts):
+        for col, asc, na in zip(sort.columns, sort.ascending, sort.na_position):
+            if col not in columns:
+                columns.append(col)
+                ascending.append(asc)
+                na_position.append(na)
+    return Sort(columns, ascending, na_position)
+
+
+def _optimize_stage(steps):
+    filters = _merge_filters([step for step in steps if isinstance(step, Filter)])
+    sorts = [step for step in steps if isinstance(step, Sort)]
+    return filters + ([_merge_sorts(sorts)] if sorts else [])
+
+
+def optimize(steps):
+    """Rewrites a list of Filter and Sort steps, to be run in order, into as few as give the same result.
+
+    Between filters that aren't row-wise, that is at most one pass of filters followed by at most one sort."""
+    optimized, stage = list(), list()
+    for step in steps:
+        if isinstance(step, Filter) and not step.row_wise:
+            optimized += _optimize_stage(stage) + [step]
+            stage = list()
+        else:
+            stage.append(step)
+    return optimized + _optimize_stage(stage)
+
+
+def _sort_rows(df, sort):
+    """Sorts the rows of df (a DataFrame or row view) as a Sort step says, without using a SortPermutationCache."""
+    keys = key_columns(df, sort.columns)
+    order = np.arange(len(keys))
+    for col, asc, na in reversed(list(zip(sort.columns, sort.ascending, sort.na_position))):
+        column = keys[col].take(order).reset_index(drop=True)
+        order = order[column.sort_values(ascending=asc, kind='mergesort', na_position=na).index.to_numpy()]
+    return row_view(df, order)
+
+
+class PlanFrame(LazyFrame):
+    """A source table (a DataFrame or a row view) and the filters and sorts still to be applied to it."""
+    def __init__(self, source, steps, sort_cache=None):
+        assert isinstance(source, (pd.DataFrame, IndexedFrame))
+        self.source = source
+        self.steps = list(steps)
+        self.sort_cache = sort_cache if sort_cache is not None else SortPermutationCache()
+        self._result = None
+        self._lock = threading.Lock()
+        super().__init__(list(source.columns), list(source.dtypes))
+
+    @staticmethod
+    def of(df, sort_cache=None):
+        """A plan with no steps yet over df, or df itself if it is already a plan."""
+        if isinstance(df, PlanFrame):
+            return df
+        return PlanFrame(df if isinstance(df, (pd.DataFrame, IndexedFrame)) else materialize(df), [], sort_cache)
+
+    def then(self, step):
+        """A new plan, with step added to the end of this one."""
+        if self._result is not None:
+            return PlanFrame(self._result, [step], self.sort_cache)
+        return PlanFrame(self.source, self.steps + [step], self.sort_cache)
+
+    @property
+    def executed(self):
+        return self._result is not None
+
+    def explain(self):
+        """The steps that will actually be run, one description per step."""
+        return [step.description for step in optimize(self.steps)]
+
+    @property
+    def result(self):
+        """The table this plan describes, as a DataFrame or row view. Runs the plan the first time it is asked for."""
+        with self._lock:
+            if self._result is None:
+                self._result = self._execute()
+            return self._result
+
+    def _execute(self):
+        print('running plan:', '; '.join(self.explain()))
+        df = self.source
+        filtered = False
+        for step in optimize(self.steps):
+            if isinstance(step, Filter): # each filter sees only the rows the steps before it left
+                df = row_view(df, np.flatnonzero(step.mask(df)))
+                filtered = True
+            elif not filtered or all(self.sort_cache.has_order(df, col) for col in step.columns):
+                df = self.sort_cache.sort(df, step.columns, step.ascending, step.na_position)
+            else: # sorting just the filtered rows beats sorting the whole base for the cache
+                df = _sort_rows(df, step)
+        return df
+
+    @property
+    def nbytes(self):
+        return self._result.nbytes if isinstance(self._result, IndexedFrame) else 0
+
+    def __len__(self):
+        return len(self.result)
+
+    def read(self, start, stop, columns=None):
+        result = self.result
+        if isinstance(result, IndexedFrame):
+            return result.read(start, stop, columns)
+        columns = list(self.columns) if columns is None else columns
+        return result.iloc[start:stop][columns].reset_index(drop=True)
+
+    def to_pandas(self):
+        return materialize(self.result)
+
+
+def run_plan(df, steps, sort_cache=None):
+    """Applies steps to df in a single optimized pass, returning the result as a DataFrame or row view."""
+    source = df.result if isinstance(df, PlanFrame) else df
+    return PlanFrame(source if isinstance(source, IndexedFrame) else materialize(source), steps, sort_cache).result
@@ -0,0 +1,109 @@
+# sorting very large columns on several cores.
+#
+# The column is reduced to a numpy array of sort keys (the values themselves
+# for numbers and datetimes, sorted category codes for everything else). The
+# keys are cut into chunks that are argsorted at the same time on a thread
+# pool - numpy releases the GIL while it sorts - and the sorted chunks are
+# then merged pairwise, also in parallel, until one stable order remains.
+#
+# A stable sort has exactly one answer, so the result is identical to
+# sort_values(kind='mergesort', na_position='last'), just sooner.
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+import numpy as np
+import pandas as pd
+
+from .gui_debug import print
+
+PARALLEL_SORT_MIN_ROWS = 4_000_000 # below this, a single sort_values is quick enough
+CHUNK_ROWS = 1 << 21
+
+
+def sort_keys(column):
+    """Returns (keys, missing) for a Series: a numpy array of keys that sort like its values, and a mask of NAs.
+
+    Returns None for columns that can't be reduced to keys (e.g. objects of mixed types)."""
+    missing = column.isna().to_numpy(dtype=bool)
+    dtype = column.dtype
+    if isinstance(dtype, np.dtype) and dtype.kind in 'biuf':
+        return column.to_numpy(), missing
+    if isinstance(dtype, pd.DatetimeTZDtype) or (isinstance(dtype, np.dtype) and dtype.kind in 'mM'):
+        return column.array.asi8, missing
+    if isinstance(dtype, pd.CategoricalDtype):
+        return column.cat.codes.to_numpy(), missing # categoricals sort in category order, not by value
+    try:
+        codes, _ = pd.factorize(column, sort=True)
+    except TypeError:
+        return None
+    return codes, missing
+
+
+def _sorted_chunk(keys, start, stop):
+    order = np.argsort(keys[start:stop], kind='stable')
+    return start + order, keys[start:stop][order]
+
+
+def _merge(left, left_keys, right, right_keys):
+    """Stably merges two sorted runs of positions (and their keys), where every position in left precedes right's."""
+    merged = np.empty(len(left) + len(right), dtype=left.dtype)
+    merged_keys = np.empty(len(left) + len(right), dtype=left_keys.dtype)
+    # ties go to the left run, which keeps the merge stable.
+    left_to = np.arange(len(left)) + np.searchsorted(right_keys, left_keys, side='left')
+    right_to = np.arange(len(right)) + np.searchsorted(left_keys, right_keys, side='right')
+    merged[left_to], merged_keys[left_to] = left, left_keys
+    merged[right_to], merged_keys[right_to] = right, right_keys
+    return merged, merged_keys
+
+
+def _merge_pieces(left, left_keys, right, right_keys, pieces):
+    """Cuts a merge into independent pieces, so that one big merge can still use several threads.
+
+    Each cut in left is moved back to the start of its run of ties, so that everything before it
+    in both runs has a smaller key than everything after it."""
+    if pieces == 1:
+        return [(left, left_keys, right, right_keys)]
+    cuts = np.searchsorted(left_keys, left_keys[np.linspace(0, len(left), pieces, endpoint=False).astype(int)[1:]])
+    left_cuts = [0] + sorted(set(cuts.tolist())) + [len(left)]
+    right_cuts = [0] + np.searchsorted(right_keys, left_keys[left_cuts[1:-1]], side='left').tolist() + [len(right)]
+    return [(left[l0:l1], left_keys[l0:l1], right[r0:r1], right_keys[r0:r1])
+            for l0, l1, r0, r1 in zip(left_cuts, left_cuts[1:], right_cuts, right_cuts[1:])]
+
+
+def parallel_argsort(keys, chunk_rows=CHUNK_ROWS, max_workers=None):
+    """A stable argsort of a numpy array, computed on several threads."""
+    max_workers = max_workers or os.cpu_count() or 1
+    if max_workers == 1 or len(keys) <= chunk_rows:
+        return np.argsort(keys, kind='stable')
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        runs = list(pool.map(lambda start: _sorted_chunk(keys, start, min(len(keys), start + chunk_rows)),
+                             range(0, len(keys), chunk_rows)))
+        while len(runs) > 1:
+            pairs = [(runs[i], runs[i + 1]) for i in range(0, len(runs) - 1, 2)]
+            pieces = max(1, max_workers // len(pairs))
+            jobs = [(pair_idx, part) for pair_idx, ((left, left_keys), (right, right_keys)) in enumerate(pairs)
+                    for part in _merge_pieces(left, left_keys, right, right_keys, pieces)]
+            parts = list(pool.map(lambda job: _merge(*job[1]), jobs))
+            merged = list()
+            for pair_idx in range(len(pairs)):
+                pair_parts = [part for (idx, _), part in zip(jobs, parts) if idx == pair_idx]
+                merged.append((np.concatenate([part[0] for part in pair_parts]),
+                               np.concatenate([part[1] for part in pair_parts])))
+            runs = merged + ([runs[-1]] if len(runs) % 2 else [])
+    return runs[0][0]
+
+
+def stable_order(column, max_workers=None):
+    """Returns the positions of column's values in stable ascending order, with NAs last in position order.
+
+    Large columns are sorted on several threads; the rest (and anything that can't be keyed) by pandas."""
+    keyed = sort_keys(column) if len(column) >= PARALLEL_SORT_MIN_ROWS else None
+    if keyed is None:
+        return column.reset_index(drop=True).sort_values(kind='mergesort', na_position='last').index.to_numpy()
+    keys, missing = keyed
+    print('sorting', len(column), 'rows in parallel')
+    valid = np.flatnonzero(~missing)
+    if len(valid) == len(keys):
+        return parallel_argsort(keys, max_workers=max_workers)
+    return np.concatenate([valid[parallel_argsort(keys[valid], max_workers=max_workers)], np.flatnonzero(missing)])
@@ -0,0 +1,82 @@
+# a LazyFrame over a Parquet file.
+#
+# Only the footer is read up front (row count, schema, row group layout).
+# Rows are decoded one (row group, column) at a time, only for the row groups
+# and columns that overlap what the browser asks for, and the decoded pieces
+# are kept in a bounded LRU.
+
+from collections import OrderedDict
+import threading
+
+import numpy as np
+import pandas as pd
+
+from .lazy_frame import LazyFrame
+from .gui_debug import print
+
+
+class ParquetFrame(LazyFrame):
+    DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+
+    def __init__(self, path, max_cache_bytes=DEFAULT_CACHE_BYTES):
+        import pyarrow.parquet as pq # optional dependency; only needed for parquet browsing
+        self.path = path
+        self._file = pq.ParquetFile(path)
+        metadata = self._file.metadata
+        schema = self._file.schema_arrow
+        pandas_metadata = schema.pandas_metadata or dict()
+        index_columns = [c for c in pandas_metadata.get('index_columns', list()) if isinstance(c, str)]
+        columns = [name for name in schema.names if name not in index_columns]
+        empty = schema.empty_table().to_pandas()
+        super().__init__(columns, [empty[col].dtype for col in columns])
+        self._num_rows = metadata.num_rows
+        self._row_group_starts = np.cumsum(
+            [0] + [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)])
+        self._max_cache_bytes = max_cache_bytes
+        self._cache = OrderedDict() # (row group, column) -> Series
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._num_rows
+
+    def _row_group_column(self, row_group, column_name):
+        key = (row_group, column_name)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        print('decoding parquet row group', row_group, 'column', column_name)
+        table = self._file.read_row_group(row_group, columns=[column_name])
+        series = table.to_pandas()[column_name].reset_index(drop=True)
+        with self._lock:
+            if key not in self._cache:
+                self._cache[key] = series
+                self._cache_bytes += series.memory_usage(index=False)
+            while self._cache_bytes > self._max_cache_bytes and len(self._cache) > 1:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_bytes -= evicted.memory_usage(index=False)
+        return series
+
+    def read(self, start, stop, columns=None):
+        columns = list(self.columns) if columns is None else columns
+        stop = min(stop, self._num_rows)
+        if stop <= start:
+            return pd.DataFrame({col: pd.Series([], dtype=self.dtypes[col]) for col in columns})
+        first = int(np.searchsorted(self._row_group_starts, start, side='right')) - 1
+        last = int(np.searchsorted(self._row_group_starts, stop - 1, side='right')) - 1
+        offset = start - self._row_group_starts[first]
+        data = dict()
+        for col in columns:
+            pieces = [self._row_group_column(rg, col) for rg in range(first, last + 1)]
+            series = pieces[0] if len(pieces) == 1 else pd.concat(pieces, ignore_index=True)
+            data[col] = series.iloc[offset:offset + stop - start].reset_index(drop=True)
+        return pd.DataFrame(data, columns=columns)
+
+    def to_pandas(self):
+        return pd.read_parquet(self.path)
+
+    @property
+    def status(self):
+        return 'parquet: {} row groups, {:.0f}MB decoded'.format(
+            len(self._row_group_starts) - 1, self._cache_bytes / 1024**2)
@@ -0,0 +1,301 @@
+# compound row filters, compiled once and evaluated a whole column at a time.
+#
+# A predicate is a boolean expression of comparisons, each a column name, one
+# of the operators in dataframe_utils.comparison_ops_dict, and a value, e.g.
+#
+#     price >= 10 and (sym == AAPL or sym == "BRK B") and not name =~ ^test
+#
+# Column names with spaces can be quoted with backticks. Values are parsed
+# into the column's type when the predicate is compiled, rather than on every
+# evaluation, so a bad value is reported before any rows are looked at.
+#
+# The mask of each comparison is cached per (base frame, column, operator,
+# value) as a packed bitmap - one bit per row - so a 100M-row table costs
+# 12.5MB per cached comparison. Compound predicates are ANDed, ORed and
+# negated as bitmaps, and only the final answer is unpacked. Repeating a
+# filter, or editing one term of it, only evaluates the terms that changed.
+#
+# Masks are of every row of a view's base, so that views of the same base share
+# them. A view much smaller than its base would pay for all of the base's rows
+# that way, so it is evaluated over its own rows instead, without caching.
+
+from collections import OrderedDict
+import operator as op
+import re
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from .dataframe_utils import comparison_ops_dict
+from .chunk_search_utils import match_mask
+from .indexed_frame import IndexedFrame, key_columns
+from .gui_debug import print
+
+_KEYWORDS = ('and', 'or', 'not')
+SMALL_VIEW_FRACTION = 0.1 # views with fewer rows than this fraction of their base are evaluated over their own rows
+_OPERATOR_PATTERN = '|'.join(re.escape(o) for o in sorted(comparison_ops_dict, key=len, reverse=True))
+_TOKEN = re.compile(r"""\s*(?:(?P<paren>[()])|(?P<op>{})|(?P<quoted>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')"""
+                    r"""|(?P<name>`[^`]*`)|(?P<word>[^\s()<>=!~"'`]+))""".format(_OPERATOR_PATTERN))
+
+
+def _tokenize(text):
+    tokens = list()
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        m = _TOKEN.match(text, pos)
+        if m is None or m.end() == pos:
+            raise ValueError('could not understand predicate at: ' + text[pos:])
+        kind = m.lastgroup
+        value = m.group(kind)
+        if kind == 'quoted':
+            value = re.sub(r'\\(.)', r'\1', value[1:-1])
+        elif kind == 'name':
+            kind, value = 'word', value[1:-1]
+        elif kind == 'word' and value.lower() in _KEYWORDS:
+            kind, value = 'keyword', value.lower()
+        tokens.append((kind, value))
+        pos = m.end()
+    return tokens
+
+
+class Comparison(object):
+    """One column compared to one value, e.g. price >= 10."""
+    def __init__(self, column, operator, value):
+        self.column = column
+        self.operator = operator
+        self.value = value
+
+    def __repr__(self):
+        return '{} {} {!r}'.format(self.column, self.operator, self.value)
+
+
+class BoolOp(object):
+    """'and' or 'or' of several predicates, or 'not' of one."""
+    def __init__(self, kind, operands):
+        self.kind = kind
+        self.operands = operands
+
+    def __repr__(self):
+        if self.kind == 'not':
+            return 'not ({!r})'.format(self.operands[0])
+        return '(' + ' {} '.format(self.kind).join(repr(operand) for operand in self.operands) + ')'
+
+
+class _Parser(object):
+    def __init__(self, text):
+        self.tokens = _tokenize(text)
+        self.pos = 0
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def _take(self, kind=None, value=None):
+        token = self._peek()
+        if token[0] is None or (kind and token[0] != kind) or (value and token[1] != value):
+            expected = value or {'op': 'a comparison operator', 'word': 'a column name'}.get(kind, kind)
+            raise ValueError('expected {} but found {}'.format(expected, token[1] or 'the end of the predicate'))
+        self.pos += 1
+        return token
+
+    def parse(self):
+        node = self._or()
+        if self.pos != len(self.tokens):
+            raise ValueError('unexpected ' + str(self._peek()[1]))
+        return node
+
+    def _or(self):
+        operands = [self._and()]
+        while self._peek() == ('keyword', 'or'):
+            self._take()
+            operands.append(self._and())
+        return operands[0] if len(operands) == 1 else BoolOp('or', operands)
+
+    def _and(self):
+        operands = [self._not()]
+        while self._peek() == ('keyword', 'and'):
+            self._take()
+            operands.append(self._not())
+        return operands[0] if len(operands) == 1 else BoolOp('and', operands)
+
+    def _not(self):
+        if self._peek() == ('keyword', 'not'):
+            self._take()
+            return BoolOp('not', [self._not()])
+        if self._peek() == ('paren', '('):
+            self._take()
+            node = self._or()
+            self._take('paren', ')')
+            return node
+        column = self._take('word')[1]
+        operator = self._take('op')[1]
+        kind, value = self._peek()
+        if kind not in ('word', 'quoted', 'keyword'):
+            raise ValueError('expected a value after {} {}'.format(column, operator))
+        self._take()
+        return Comparison(column, operator, value)
+
+
+def parse_predicate(text):
+    """Parses a predicate expression into a tree of Comparison and BoolOp nodes. Raises ValueError if it can't."""
+    return _Parser(text).parse()
+
+
+def coerce_value(dtype, text):
+    """Parses a value typed by the user into something comparable with a column of dtype."""
+    if not isinstance(text, str):
+        return text
+    if isinstance(dtype, pd.DatetimeTZDtype):
+        stamp = pd.Timestamp(text)
+        return stamp.tz_localize(dtype.tz) if stamp.tzinfo is None else stamp
+    if isinstance(dtype, pd.CategoricalDtype):
+        return coerce_value(dtype.categories.dtype, text)
+    kind = getattr(dtype, 'kind', 'O')
+    if kind == 'b':
+        if text.lower() not in ('true', 'false', '1', '0'):
+            raise ValueError('expected true or false, not ' + text)
+        return text.lower() in ('true', '1')
+    if kind in 'iu':
+        try:
+            return int(text)
+        except ValueError:
+            return float(text)
+    if kind == 'f':
+        return float(text)
+    if kind == 'M':
+        return pd.Timestamp(text)
+    if kind == 'm':
+        return pd.Timedelta(text)
+    return text
+
+
+def _compile(node, dtypes):
+    """Checks column names and converts each comparison's value to its column's type."""
+    if isinstance(node, BoolOp):
+        return BoolOp(node.kind, [_compile(operand, dtypes) for operand in node.operands])
+    if node.column not in dtypes:
+        raise KeyError(node.column)
+    if node.operator in ('=~', '!~'):
+        return node # patterns stay strings
+    try:
+        value = coerce_value(dtypes[node.column], node.value)
+    except ValueError:
+        raise ValueError('{!r} is not a valid value for column {} of type {}'.format(
+            node.value, node.column, dtypes[node.column]))
+    return Comparison(node.column, node.operator, value)
+
+
+def _comparison_mask(column, comparison):
+    """The boolean mask for a single comparison over a whole Series. Missing values never match, except for !~."""
+    operator = comparison_ops_dict[comparison.operator]
+    if isinstance(operator, list): # =~ and !~
+        mask = match_mask(column, comparison.value, 'regex')
+        return ~mask if op.not_ in operator else mask
+    result = operator(column, comparison.value)
+    return result.to_numpy(dtype=bool, na_value=False)
+
+
+class MaskCache(object):
+    """Per-browser cache of packed comparison masks, keyed by base frame identity, column, operator and value."""
+    DEFAULT_MAX_BYTES = 512 * 1024**2
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._masks = OrderedDict() # key -> (weakref to base, packed mask)
+        self._lock = threading.RLock() # filters may run on a worker thread
+
+    def packed_mask(self, base, comparison):
+        """The packed mask of comparison over every row of base."""
+        with self._lock:
+            return self._locked_packed_mask(base, comparison)
+
+    def _locked_packed_mask(self, base, comparison):
+        try:
+            key = (id(base), comparison.column, comparison.operator, comparison.value)
+            hash(key)
+        except TypeError: # an unhashable value - just don't cache it
+            key = None
+        entry = self._masks.get(key) if key is not None else None
+        if entry is not None and entry[0]() is base:
+            self.hits += 1
+            self._masks.move_to_end(key)
+            return entry[1]
+        self.misses += 1
+        print('evaluating', comparison, 'over', len(base), 'rows')
+        packed = np.packbits(_comparison_mask(base[comparison.column], comparison))
+        if key is not None:
+            self._drop(key)
+            self._masks[key] = (weakref.ref(base, lambda _: self._drop(key)), packed)
+            self.nbytes += packed.nbytes
+            while len(self._masks) > 1 and self.nbytes > self.max_bytes:
+                self._drop(next(iter(self._masks)))
+        return packed
+
+    def _drop(self, key):
+        with self._lock: # also called when a base frame is collected, on whatever thread that happens
+            entry = self._masks.pop(key, None)
+            if entry is not None:
+                self.nbytes -= entry[1].nbytes
+
+
+class Predicate(object):
+    """A compiled predicate, ready to be evaluated over tables with the columns it was compiled for."""
+    def __init__(self, text, tree):
+        self.text = text
+        self.tree = tree
+
+    def __repr__(self):
+        return repr(self.tree)
+
+    def _packed(self, node, base, cache):
+        if isinstance(node, Comparison):
+            return cache.packed_mask(base, node)
+        packed = [self._packed(operand, base, cache) for operand in node.operands]
+        if node.kind == 'not':
+            return np.invert(packed[0]) # the padding bits flip too, but are never unpacked
+        combine = np.bitwise_and if node.kind == 'and' else np.bitwise_or
+        return combine.reduce(packed)
+
+    def _columns(self, node):
+        if isinstance(node, Comparison):
+            return [node.column]
+        return [col for operand in node.operands for col in self._columns(operand)]
+
+    def _evaluate(self, node, table):
+        """Like _packed, but unpacked and uncached, over the rows of table."""
+        if isinstance(node, Comparison):
+            return _comparison_mask(table[node.column], node)
+        masks = [self._evaluate(operand, table) for operand in node.operands]
+        if node.kind == 'not':
+            return ~masks[0]
+        return (np.logical_and if node.kind == 'and' else np.logical_or).reduce(masks)
+
+    def mask(self, df, cache=None):
+        """A boolean numpy array saying which rows of df (a DataFrame or row view) match, in df's order.
+
+        Comparisons are evaluated over the base frame of a row view, where their masks can be reused - unless
+        the view is much smaller than its base (see SMALL_VIEW_FRACTION), when only its own rows are looked at."""
+        if isinstance(df, IndexedFrame) and len(df) < SMALL_VIEW_FRACTION * len(df.base):
+            return self._evaluate(self.tree, key_columns(df, list(dict.fromkeys(self._columns(self.tree)))))
+        cache = cache if cache is not None else MaskCache()
+        base = df.base if isinstance(df, IndexedFrame) else df
+        mask = np.unpackbits(self._packed(self.tree, base, cache), count=len(base)).view(bool)
+        return mask[df.positions] if isinstance(df, IndexedFrame) else mask
+
+
+def comparison_predicate(df, column, operator, value):
+    """Compiles a single comparison. operator is a key of comparison_ops_dict, or one of its operator functions."""
+    if operator not in comparison_ops_dict:
+        operator = next(symbol for symbol, func in comparison_ops_dict.items() if func is operator)
+    node = Comparison(column, operator, value)
+    return Predicate(repr(node), _compile(node, df.dtypes))
+
+
+def compile_predicate(text, df):
+    """Parses and compiles a predicate for df's columns. Raises ValueError (or KeyError for a column) if it can't."""
+    return Predicate(text, _compile(parse_predicate(text), df.dtypes))
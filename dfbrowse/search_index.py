@@ -0,0 +1,175 @@
+# remembering which rows matched, so that a search can build on the last one.
+#
+# When a search string is typed one character at a time, each new query
+# contains the previous one, so the rows it matches are a subset of the rows
+# the previous query matched. A MatchSet records the matching rows of each
+# block of the column that has been searched so far; narrowing it to a longer
+# query only re-checks those rows, and only blocks that no earlier query got
+# to have to be matched in full. A stack of MatchSets, one per query typed,
+# lets backspace go straight back to an earlier answer.
+#
+# A ColumnMatchIndex is the finished article: every matching row of a column,
+# sorted, so that stepping to the next or previous hit is a binary search.
+
+import threading
+
+import numpy as np
+
+from .chunk_search_utils import match_mask, uses_numeric_match, SEARCH_BLOCK_ROWS
+
+
+class MatchSet(object):
+    """The rows of a column matching a substring query, for whichever blocks of the column have been searched."""
+    def __init__(self, query, case_insensitive, num_rows, block_rows=SEARCH_BLOCK_ROWS, candidates=None):
+        self.query = query
+        self.case_insensitive = case_insensitive
+        self.num_rows = num_rows
+        self.block_rows = block_rows
+        self.num_blocks = -(-num_rows // block_rows)
+        self._lock = threading.Lock()
+        self._matches = dict() # block number -> sorted positions that match this query
+        self._candidates = candidates or dict() # block number -> sorted positions that matched a broader query
+
+    @staticmethod
+    def applies(dtype, query, mode):
+        """Only plain substring matches get narrower as the query gets longer."""
+        return mode == 'substring' and not uses_numeric_match(dtype, query, mode)
+
+    def same_search(self, query, case_insensitive, num_rows):
+        return (self.query == query and self.case_insensitive == case_insensitive
+                and self.num_rows == num_rows)
+
+    def narrows_to(self, query, case_insensitive, num_rows):
+        """Whether every row matching query also matches this set's query.
+
+        A case-sensitive match is also a case-insensitive one, but not the other way around."""
+        if num_rows != self.num_rows or (case_insensitive and not self.case_insensitive):
+            return False
+        if self.case_insensitive:
+            return self.query.lower() in query.lower()
+        return self.query in query
+
+    def narrow(self, query, case_insensitive):
+        """Returns a new MatchSet for a query that this one narrows_to."""
+        with self._lock:
+            candidates = dict(self._candidates)
+            candidates.update(self._matches)
+        return MatchSet(query, case_insensitive, self.num_rows, self.block_rows, candidates)
+
+    @property
+    def blocks_searched(self):
+        return len(self._matches)
+
+    def _block_matches(self, column, block):
+        with self._lock:
+            if block in self._matches:
+                return self._matches[block]
+            candidates = self._candidates.get(block)
+        start = block * self.block_rows
+        if candidates is None:
+            values = column.iloc[start:min(self.num_rows, start + self.block_rows)]
+            matches = start + np.flatnonzero(match_mask(values, self.query, 'substring', self.case_insensitive))
+        elif len(candidates) == 0:
+            matches = candidates
+        else:
+            # only the rows that matched the broader query need to be looked at again.
+            if hasattr(column, 'to_numpy'):
+                values = column.iloc[candidates]
+            else: # a lazy column can only be read in contiguous slices
+                values = column.iloc[int(candidates[0]):int(candidates[-1]) + 1].iloc[candidates - candidates[0]]
+            matches = candidates[match_mask(values, self.query, 'substring', self.case_insensitive)]
+        with self._lock:
+            self._matches[block] = matches
+            self._candidates.pop(block, None)
+        return matches
+
+    def find(self, column, starting_row, down=True, on_progress=None):
+        """Returns the first matching row at or after starting_row (at or before, if not down), or None.
+
+        Blocks searched along the way are remembered, even if on_progress raises to abandon the search."""
+        if starting_row < 0 or starting_row >= self.num_rows:
+            return None
+        block = starting_row // self.block_rows
+        scanned = 0
+        while 0 <= block < self.num_blocks:
+            matches = self._block_matches(column, block)
+            if down:
+                hits = matches[np.searchsorted(matches, starting_row, side='left'):]
+                if len(hits):
+                    return int(hits[0])
+            else:
+                hits = matches[:np.searchsorted(matches, starting_row, side='right')]
+                if len(hits):
+                    return int(hits[-1])
+            scanned += self.block_rows
+            if on_progress:
+                on_progress(scanned)
+            block += 1 if down else -1
+        return None
+
+    def all_positions(self, column, on_progress=None):
+        """Searches whatever blocks remain and returns every matching row, sorted."""
+        for block in range(self.num_blocks):
+            self._block_matches(column, block)
+            if on_progress:
+                on_progress(min(self.num_rows, (block + 1) * self.block_rows))
+        with self._lock:
+            blocks = [self._matches[block] for block in range(self.num_blocks)]
+        return np.concatenate(blocks).astype(np.int64) if blocks else np.array([], dtype=np.int64)
+
+
+class ColumnMatchIndex(object):
+    """The sorted positions of every row in a column matching a search."""
+    def __init__(self, column_name, query, mode, case_insensitive, positions):
+        self.column_name = column_name
+        self.query = query
+        self.mode = mode
+        self.case_insensitive = case_insensitive
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def same_search(self, column_name, query, mode, case_insensitive):
+        return (self.column_name == column_name and self.query == query and self.mode == mode
+                and self.case_insensitive == case_insensitive)
+
+    def next(self, row, down=True, skip_current=True):
+        """Returns the nearest hit below row (above, if not down), or None. Includes row itself unless skip_current."""
+        if down:
+            idx = np.searchsorted(self.positions, row, side='right' if skip_current else 'left')
+            return int(self.positions[idx]) if idx < len(self.positions) else None
+        idx = np.searchsorted(self.positions, row, side='left' if skip_current else 'right')
+        return int(self.positions[idx - 1]) if idx > 0 else None
+
+    def hit_number(self, row):
+        """Returns k if row is the k-th hit (counting from 1), or None if it isn't a hit."""
+        idx = np.searchsorted(self.positions, row)
+        return int(idx) + 1 if idx < len(self.positions) and self.positions[idx] == row else None
+
+
+class IncrementalSearch(object):
+    """A stack of MatchSets for a single column, one for each query in the search being typed."""
+    MAX_DEPTH = 64
+
+    def __init__(self):
+        self._stack = list()
+
+    def match_set(self, query, case_insensitive, num_rows):
+        """Returns the MatchSet to search for query with, reusing or narrowing an earlier one where possible.
+
+        Queries that don't extend the one before them (backspace, for instance) pop back down the stack."""
+        while self._stack and not self._stack[-1].narrows_to(query, case_insensitive, num_rows):
+            self._stack.pop()
+        if self._stack and self._stack[-1].same_search(query, case_insensitive, num_rows):
+            return self._stack[-1]
+        if self._stack:
+            match_set = self._stack[-1].narrow(query, case_insensitive)
+        else:
+            match_set = MatchSet(query, case_insensitive, num_rows)
+        self._stack.append(match_set)
+        del self._stack[:-IncrementalSearch.MAX_DEPTH]
+        return match_set
+
+    def clear(self):
+        self._stack = list()
@@ -0,0 +1,195 @@
+# running row-wise browser functions on every core.
+#
+# Pure-Python work on a frame - eval of arbitrary expressions, string
+# matching over object columns - holds the GIL, so threads don't help. Here
+# the frame is split into contiguous row partitions that worker processes
+# handle at the same time, and the answers are put back together in order.
+#
+# The frame is not pickled to each worker. It is written once into shared
+# memory, as an Arrow IPC stream if pyarrow is installed (which workers then
+# read without copying), or else as a single pickle that each worker loads
+# once per job. Workers send back as little as they can: for a filter, just
+# the positions of the rows it keeps.
+#
+# A function run this way must be row-wise: running it on each partition and
+# concatenating the results must give the same answer as running it on the
+# whole frame. Each partition is a DataFrame indexed by row position.
+
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from multiprocessing import shared_memory
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from .indexed_frame import row_view
+from .lazy_frame import materialize
+from .gui_debug import print
+
+PARALLEL_MIN_ROWS = 1_000_000 # below this, starting the workers costs more than it saves
+PARTITIONS_PER_WORKER = 2
+
+_pool = None
+_pool_workers = None
+
+
+def _get_pool(max_workers):
+    """A process pool shared by every browser. Workers are started by a fork server, since the UI has threads."""
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != max_workers:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        _pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+        _pool_workers = max_workers
+    return _pool
+
+
+class SharedFrame(object):
+    """A DataFrame written into a block of shared memory, for worker processes to read. Use it as a context manager."""
+    def __init__(self, df):
+        self.num_rows = len(df)
+        self.format, payload, size = self._serialize(df)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, size))
+        payload(self.shm.buf)
+        self.name = self.shm.name
+
+    @staticmethod
+    def _serialize(df):
+        """Returns (format, a function that writes the frame into a buffer, the number of bytes it needs)."""
+        try:
+            import pyarrow as pa
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            sink = pa.MockOutputStream()
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+
+            def write_arrow(buf):
+                with pa.ipc.new_stream(pa.FixedSizeBufferWriter(pa.py_buffer(buf)), table.schema) as writer:
+                    writer.write_table(table)
+            return 'arrow', write_arrow, sink.size()
+        except Exception as e: # no pyarrow, or columns Arrow can't represent (e.g. mixed-type objects)
+            print('sharing frame as a pickle instead of Arrow:', e)
+        data = pickle.dumps(df.reset_index(drop=True), protocol=pickle.HIGHEST_PROTOCOL)
+
+        def write_pickle(buf):
+            buf[:len(data)] = data
+        return 'pickle', write_pickle, len(data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shm.close()
+        self.shm.unlink()
+
+
+_attached = None # (shared memory name, SharedMemory, Arrow table or DataFrame) - the last frame this worker read
+
+
+def _attach(name, fmt):
+    global _attached
+    if _attached is not None and _attached[0] == name:
+        return _attached[2]
+    if _attached is not None:
+        _detach()
+    shm = shared_memory.SharedMemory(name=name) # workers share the parent's resource tracker, so it is unlinked once
+    if fmt == 'arrow':
+        import pyarrow as pa
+        with pa.ipc.open_stream(pa.py_buffer(shm.buf)) as reader:
+            frame = reader.read_all()
+    else:
+        frame = pickle.loads(shm.buf)
+    _attached = (name, shm, frame)
+    return frame
+
+
+def _detach():
+    global _attached
+    shm = _attached[1]
+    _attached = None
+    try:
+        shm.close()
+    except BufferError:
+        pass # something still points into it; the mapping goes when the worker does
+
+
+def _read_partition(frame, start, stop):
+    if isinstance(frame, pd.DataFrame):
+        part = frame.iloc[start:stop]
+    else:
+        part = frame.slice(start, stop - start).to_pandas()
+    part.index = pd.RangeIndex(start, stop)
+    return part
+
+
+def _shrink(result, part):
+    """What a worker sends back: ('rows', positions) if result picks out rows of the partition, else ('value', result)."""
+    if isinstance(result, (pd.Series, np.ndarray)) and result.dtype == bool and len(result) == len(part):
+        return 'rows', part.index.to_numpy()[np.asarray(result)]
+    if (isinstance(result, pd.DataFrame) and list(result.columns) == list(part.columns) and len(result) <= len(part)
+            and result.index.isin(part.index).all() and result.equals(part.loc[result.index])):
+        return 'rows', result.index.to_numpy() # a filter - no need to send the rows themselves back
+    return 'value', result
+
+
+def _run_partition(name, fmt, start, stop, func, kwargs):
+    part = _read_partition(_attach(name, fmt), start, stop)
+    return _shrink(func(part, **kwargs), part)
+
+
+def _combine(df, labels, pieces):
+    """Puts the partitions' answers back together, in row order, as a new table for df, whose rows have labels."""
+    if all(kind == 'rows' for kind, _ in pieces):
+        return row_view(df, np.concatenate([positions for _, positions in pieces]))
+    values = [value for kind, value in pieces]
+    if any(kind != 'value' for kind, _ in pieces) or not all(isinstance(v, (pd.DataFrame, pd.Series)) for v in values):
+        raise ValueError('a row-wise function must return rows, a boolean mask, or a frame, the same for every row')
+    combined = pd.concat(values)
+    if combined.index.isin(pd.RangeIndex(len(df))).all(): # give rows of df their original labels back
+        combined.index = labels.take(combined.index.to_numpy())
+    return combined
+
+
+def partitions(num_rows, num_parts):
+    bounds = np.linspace(0, num_rows, num_parts + 1).astype(int)
+    return [(int(start), int(stop)) for start, stop in zip(bounds, bounds[1:]) if stop > start]
+
+
+def _run_pieces(df, func, max_workers, min_rows, kwargs):
+    """Returns (the labels of df's rows, each partition's answer). df is only materialized once, here."""
+    max_workers = max_workers or os.cpu_count() or 1
+    table = materialize(df)
+    labels = table.index
+    table = table.reset_index(drop=True)
+    if max_workers == 1 or len(table) < min_rows:
+        return labels, [_shrink(func(table, **kwargs), table)]
+    parts = partitions(len(table), max_workers * PARTITIONS_PER_WORKER)
+    print('running', getattr(func, '__name__', func), 'on', len(parts), 'partitions across', max_workers, 'processes')
+    with SharedFrame(table) as shared:
+        pool = _get_pool(max_workers)
+        futures = [pool.submit(_run_partition, shared.name, shared.format, start, stop, func, kwargs)
+                   for start, stop in parts]
+        return labels, [future.result() for future in futures]
+
+
+def run_row_wise(df, func, max_workers=None, min_rows=PARALLEL_MIN_ROWS, **kwargs):
+    """Runs a row-wise function over df (a DataFrame or row view) on a pool of worker processes.
+
+    func(partition, **kwargs) may return a boolean mask, a subset of the partition's rows, or a frame or
+    Series of new values for them. Filters come back as a row view of df, and anything else concatenated.
+    func and kwargs must be picklable. Small tables, and machines with one core, just run func in this process."""
+    return _combine(df, *_run_pieces(df, func, max_workers, min_rows, kwargs))
+
+
+def row_wise_mask(df, func, max_workers=None, min_rows=PARALLEL_MIN_ROWS, **kwargs):
+    """Like run_row_wise for a func that returns a boolean mask, but returns the mask for all of df."""
+    mask = np.zeros(len(df), dtype=bool)
+    for kind, positions in _run_pieces(df, func, max_workers, min_rows, kwargs)[1]:
+        if kind != 'rows':
+            raise ValueError('{} did not return a boolean mask'.format(getattr(func, '__name__', func)))
+        mask[positions] = True
+    return mask
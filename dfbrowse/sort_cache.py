@@ -0,0 +1,234 @@
+# remembering sorts, so that sorting again is nearly free.
+#
+# For each (base frame, column) sorted, we keep the stable ascending order of
+# the column's rows and each row's dense rank (equal values get equal ranks,
+# missing values get -1). From those, without sorting again:
+#
+#   - the base frame, or any filter of it, sorts in O(n) by picking its rows
+#     out of the cached order;
+#   - a table already sorted on the column, in either direction, flips to the
+#     other direction in O(n) by reversing the order of its groups of ties;
+#   - anything else sorts on the integer ranks, which is much cheaper than
+#     sorting the values themselves, and multi-column sorts are a lexsort of
+#     the columns' ranks.
+#
+# Results match DataFrame.sort_values(kind='mergesort'): ties keep the order
+# they had in the table being sorted, in both directions.
+
+from collections import OrderedDict
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from .indexed_frame import IndexedFrame, _positions_dtype
+from .parallel_sort import stable_order
+from .sorted_index import SortedIndex, is_searchable
+from .gui_debug import print
+
+
+class _ColumnOrder(object):
+    def __init__(self, base, column_name):
+        self.base_ref = weakref.ref(base)
+        column = base[column_name].reset_index(drop=True)
+        int_type = _positions_dtype(len(column))
+        self.num_valid = len(column) - int(column.isna().sum())
+        # time series are usually in order already, which is much cheaper to check than to sort
+        self.monotonic = (self.num_valid == len(column) and is_searchable(column.dtype)
+                          and column.is_monotonic_increasing)
+        self.order = np.arange(len(column), dtype=int_type) if self.monotonic else stable_order(column).astype(int_type)
+        valid_order = self.order[:self.num_valid]
+        sorted_values = column.take(valid_order).reset_index(drop=True)
+        new_value = sorted_values.ne(sorted_values.shift()).to_numpy(dtype=bool)
+        self.sorted_ranks = (np.cumsum(new_value) - 1).astype(int_type) # the ranks of valid_order
+        self.ranks = np.full(len(column), -1, dtype=int_type)
+        self.ranks[valid_order] = self.sorted_ranks
+        self.max_rank = int(self.sorted_ranks[-1]) if self.num_valid else -1
+        self.sorted_index = None # built when first searched by value
+
+    @property
+    def nbytes(self):
+        return (self.order.nbytes + self.ranks.nbytes + self.sorted_ranks.nbytes
+                + getattr(self.sorted_index, 'nbytes', 0))
+
+    def sort_keys(self, positions, ascending, na_position):
+        """Integer keys that sort positions (None meaning all rows) the way the column's values would."""
+        keys = (self.ranks if positions is None else self.ranks[positions]).astype(np.int64)
+        missing = keys < 0
+        if not ascending:
+            keys = self.max_rank - keys
+        keys[missing] = -1 if na_position == 'first' else self.max_rank + 1
+        return keys
+
+
+class _SortedInfo(object):
+    """What we know about a sort result we produced: enough to reverse it without looking at any values."""
+    def __init__(self, column_order, ascending, na_position, num_missing, run_starts):
+        self.column_order = column_order
+        self.ascending = ascending
+        self.na_position = na_position
+        self.num_missing = num_missing
+        self.run_starts = run_starts # where each run of ties starts among the valid rows; None if there are no ties
+
+
+def _is_nondecreasing(values):
+    return len(values) < 2 or bool(np.all(values[1:] >= values[:-1]))
+
+
+def _run_starts(sorted_ranks):
+    """Where each run of equal ranks starts, or None if every rank is different."""
+    starts = np.flatnonzero(sorted_ranks[1:] != sorted_ranks[:-1]) + 1
+    if len(starts) == max(0, len(sorted_ranks) - 1):
+        return None
+    return np.concatenate([[0], starts])
+
+
+def _reverse_runs(items, run_starts):
+    """Reverses the order of the runs of ties in items, keeping the order within each run. O(n).
+
+    Returns the reversed items and where the runs now start."""
+    if run_starts is None:
+        return items[::-1], None
+    lengths = np.diff(np.append(run_starts, len(items)))
+    rev_starts, rev_lengths = run_starts[::-1], lengths[::-1]
+    out_starts = np.cumsum(rev_lengths) - rev_lengths
+    return items[np.arange(len(items)) + np.repeat(rev_starts - out_starts, rev_lengths)], out_starts
+
+
+class SortPermutationCache(object):
+    """Per-browser cache of column sort orders, keyed by base frame identity and column name."""
+    DEFAULT_MAX_BYTES = 2 * 1024**3
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._orders = OrderedDict() # (id(base), column name) -> _ColumnOrder
+        self._results = dict() # id(positions) -> (weakref to positions, _SortedInfo), for sorts we produced
+        self._lock = threading.RLock() # browser functions may sort on a worker thread while the UI searches
+
+    def _column_order(self, base, column_name):
+        with self._lock:
+            return self._locked_column_order(base, column_name)
+
+    def _locked_column_order(self, base, column_name):
+        key = (id(base), column_name)
+        column_order = self._orders.get(key)
+        if column_order is None or column_order.base_ref() is not base:
+            print('sorting column', column_name, 'from scratch')
+            column_order = _ColumnOrder(base, column_name)
+        self._orders[key] = column_order
+        self._orders.move_to_end(key)
+        while len(self._orders) > 1 and sum(o.nbytes for o in self._orders.values()) > self.max_bytes:
+            self._orders.popitem(last=False)
+        return column_order
+
+    def sorted_index(self, df, column_name):
+        """A SortedIndex over the column of df's base frame, for binary searching its values."""
+        base = df.base if isinstance(df, IndexedFrame) else df
+        column_order = self._column_order(base, column_name)
+        if column_order.sorted_index is None:
+            valid_order = None if column_order.monotonic else column_order.order[:column_order.num_valid]
+            column_order.sorted_index = SortedIndex(base[column_name], valid_order)
+        return column_order.sorted_index
+
+    def known_sorted_index(self, df, column_name):
+        """sorted_index, if it can be had without sorting: the column's order is cached already, or its values
+        are in ascending order with none missing. Otherwise None, since sorting the column just to search it
+        once costs more than scanning it."""
+        if not self.has_order(df, column_name):
+            column = (df.base if isinstance(df, IndexedFrame) else df)[column_name]
+            if not (is_searchable(column.dtype) and not column.hasnans and column.is_monotonic_increasing):
+                return None
+        return self.sorted_index(df, column_name)
+
+    def forget(self, df, column_name):
+        """Drops the cached order of the column of df's base frame, after the column has been replaced."""
+        base = df.base if isinstance(df, IndexedFrame) else df
+        with self._lock:
+            self._orders.pop((id(base), column_name), None)
+
+    def has_order(self, df, column_name):
+        """Whether sorting df on the column would start from a cached order rather than sorting its base first."""
+        base = df.base if isinstance(df, IndexedFrame) else df
+        column_order = self._orders.get((id(base), column_name))
+        return column_order is not None and column_order.base_ref() is base
+
+    def _sorted_info(self, positions):
+        if positions is None or id(positions) not in self._results:
+            return None
+        ref, info = self._results[id(positions)]
+        return info if ref() is positions else None
+
+    def _remember(self, positions, info):
+        key = id(positions)
+        with self._lock:
+            self._results[key] = (weakref.ref(positions, lambda _: self._results.pop(key, None)), info)
+
+    def sort(self, df, columns, ascending=True, na_position='last'):
+        """Returns df's rows sorted stably on columns, as a view over df's base frame.
+
+        df is a DataFrame or an IndexedFrame; ascending and na_position may each be a single value
+        or a list with one per column."""
+        base, positions = (df.base, df.positions) if isinstance(df, IndexedFrame) else (df, None)
+        ascending = list(ascending) if isinstance(ascending, (list, tuple)) else [ascending] * len(columns)
+        na_positions = list(na_position) if isinstance(na_position, (list, tuple)) else [na_position] * len(columns)
+        na_position = na_positions[0]
+        column_orders = [self._column_order(base, col) for col in columns]
+        if len(columns) > 1:
+            keys = [column_order.sort_keys(positions, asc, na)
+                    for column_order, asc, na in zip(column_orders, ascending, na_positions)]
+            order = np.lexsort(keys[::-1])
+            return IndexedFrame(base, order if positions is None else positions[order])
+        valid, run_starts, missing = self._ascending(column_orders[0], positions)
+        if not ascending[0]:
+            valid, run_starts = _reverse_runs(valid, run_starts)
+        sorted_positions = np.concatenate([missing, valid] if na_position == 'first' else [valid, missing])
+        result = IndexedFrame(base, sorted_positions)
+        self._remember(result.positions, _SortedInfo(column_orders[0], ascending[0], na_position,
+                                                     len(missing), run_starts))
+        return result
+
+    def _ascending(self, column_order, positions):
+        """Returns (the valid rows in stable ascending order, the run starts among them, the missing rows)."""
+        info = self._sorted_info(positions)
+        if info is not None and info.column_order is column_order:
+            # a sort we produced on this column - no need to look at ranks at all
+            if info.na_position == 'first':
+                missing, valid = positions[:info.num_missing], positions[info.num_missing:]
+            else:
+                num_valid = len(positions) - info.num_missing
+                valid, missing = positions[:num_valid], positions[num_valid:]
+            if info.ascending:
+                return valid, info.run_starts, missing
+            valid, run_starts = _reverse_runs(valid, info.run_starts)
+            return valid, run_starts, missing
+        if positions is None:
+            num_valid = column_order.num_valid
+            return (column_order.order[:num_valid], _run_starts(column_order.sorted_ranks),
+                    column_order.order[num_valid:])
+        if len(positions) > 1 and np.all(positions[1:] > positions[:-1]):
+            # a filter of the base, whose ties are in base order - pick its rows out of the cached order
+            in_table = np.zeros(len(column_order.ranks), dtype=bool)
+            in_table[positions] = True
+            num_valid = column_order.num_valid
+            keep = in_table[column_order.order]
+            keep_valid, keep_missing = keep[:num_valid], keep[num_valid:]
+            return (column_order.order[:num_valid][keep_valid], _run_starts(column_order.sorted_ranks[keep_valid]),
+                    column_order.order[num_valid:][keep_missing])
+        ranks = column_order.ranks[positions]
+        missing = ranks < 0
+        valid, valid_ranks = positions[~missing], ranks[~missing]
+        if _is_nondecreasing(valid_ranks):
+            pass # already sorted ascending on this column
+        elif _is_nondecreasing(valid_ranks[::-1]):
+            valid, _ = _reverse_runs(valid, _run_starts(valid_ranks)) # already sorted descending
+            valid_ranks = valid_ranks[::-1]
+        else:
+            order = np.argsort(valid_ranks, kind='stable')
+            valid, valid_ranks = valid[order], valid_ranks[order]
+        return valid, _run_starts(valid_ranks), positions[missing]
+
+
+def uses_sort_cache(df, algorithm):
+    """The cache only reproduces stable sorts, of tables it can find the base frame of."""
+    return algorithm in ('mergesort', 'stable') and isinstance(df, (pd.DataFrame, IndexedFrame))
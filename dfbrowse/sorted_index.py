@@ -0,0 +1,142 @@
+# binary search over the values of numeric and datetime columns.
+#
+# Time series tables are nearly always in time order already, and for those a
+# column's own values can be binary searched as they are. Otherwise the
+# browser's SortPermutationCache already keeps each sorted column's stable
+# order, and the values taken in that order can be binary searched instead.
+# Either way, a SortedIndex answers "which rows are between a and b" and
+# "which is the first row at or after x" in O(log n), rather than comparing
+# every row.
+#
+# Finding the first row with a value of at least x in an unsorted column also
+# needs, for each place in the sorted order, the smallest row from there on -
+# a suffix minimum of the order, built the first time it is asked for. Row
+# views search their base frame's index, and map what it finds through their
+# positions. An unsorted column that has never been sorted is scanned instead:
+# sorting it to answer one lookup would cost more than the scan.
+
+import numpy as np
+import pandas as pd
+
+from .chunk_search_utils import SEARCH_BLOCK_ROWS
+from .indexed_frame import IndexedFrame
+from .predicates import coerce_value
+
+
+def is_searchable(dtype):
+    """Whether columns of dtype can be binary searched: numbers, datetimes and timedeltas."""
+    return isinstance(dtype, pd.DatetimeTZDtype) or (isinstance(dtype, np.dtype) and dtype.kind in 'iufmM')
+
+
+def _search_values(column):
+    """The column's values as a numpy array that compares the way the values do (tz-aware datetimes as UTC)."""
+    if isinstance(column.dtype, pd.DatetimeTZDtype):
+        return column.dt.tz_convert(None).to_numpy()
+    return column.to_numpy()
+
+
+def search_key(dtype, value):
+    """Converts value (as typed by the user, or already a number or timestamp) into a key for columns of dtype."""
+    value = coerce_value(dtype, value)
+    if isinstance(value, pd.Timestamp):
+        return (value.tz_convert(None) if value.tzinfo is not None else value).to_datetime64()
+    if isinstance(value, pd.Timedelta):
+        return value.to_timedelta64()
+    return value
+
+
+class SortedIndex(object):
+    """The non-missing values of a column in ascending order, and the rows they came from.
+
+    valid_order is the stable ascending order of the non-missing rows, or None if the column
+    has no missing values and is already in ascending order."""
+    def __init__(self, column, valid_order=None):
+        self.dtype = column.dtype
+        values = _search_values(column)
+        self.num_rows = len(values)
+        self.order = valid_order
+        self.sorted_values = values if valid_order is None else values[valid_order]
+        self._suffix_min = None
+
+    @property
+    def monotonic(self):
+        return self.order is None
+
+    @property
+    def nbytes(self):
+        return (0 if self.order is None else self.sorted_values.nbytes) + getattr(self._suffix_min, 'nbytes', 0)
+
+    def bounds(self, lo=None, hi=None):
+        """Where the values in [lo, hi] start and stop in sorted order. Either end may be None for no limit."""
+        start = 0 if lo is None else int(np.searchsorted(self.sorted_values, search_key(self.dtype, lo), 'left'))
+        stop = (len(self.sorted_values) if hi is None
+                else int(np.searchsorted(self.sorted_values, search_key(self.dtype, hi), 'right')))
+        return start, max(start, stop)
+
+    def rows_between(self, lo=None, hi=None):
+        """The rows with values in [lo, hi], in row order."""
+        start, stop = self.bounds(lo, hi)
+        if self.monotonic:
+            return np.arange(start, stop)
+        return np.sort(self.order[start:stop])
+
+    def first_row_at_least(self, value):
+        """The first row, in row order, whose value is at least value - or None if there isn't one."""
+        start, stop = self.bounds(lo=value)
+        if start == stop:
+            return None
+        if self.monotonic:
+            return start
+        if self._suffix_min is None:
+            self._suffix_min = np.minimum.accumulate(self.order[::-1])[::-1]
+        return int(self._suffix_min[start])
+
+    def first_position_at_least(self, value, positions, increasing=False):
+        """Like first_row_at_least, for the rows at positions (a row view's): the first place in positions
+        whose row has a value of at least value, or None.
+
+        A binary search when both the column and positions are in order, as they are for a filter of a
+        time series; otherwise one pass over positions, which never reads the values themselves."""
+        start, stop = self.bounds(lo=value)
+        if start == stop or not len(positions):
+            return None
+        if self.monotonic: # the rows with a value of at least value are start onwards
+            if increasing:
+                found = int(np.searchsorted(positions, positions.dtype.type(start), 'left'))
+                return found if found < len(positions) else None
+            hits = positions >= start
+        else:
+            is_hit = np.zeros(self.num_rows, dtype=bool)
+            is_hit[self.order[start:stop]] = True
+            hits = is_hit[positions]
+        found = int(np.argmax(hits))
+        return found if hits[found] else None
+
+
+def _scan_first_at_least(column, key, block_rows=SEARCH_BLOCK_ROWS):
+    """The first row of column (a Series or LazyColumn) with a value of at least key, comparing a block at a time."""
+    for start in range(0, len(column), block_rows):
+        values = column.iloc[start:min(len(column), start + block_rows)]
+        hits = np.flatnonzero(_search_values(values) >= key)
+        if len(hits):
+            return start + int(hits[0])
+    return None
+
+
+def first_row_at_least(df, column_name, value, sort_cache=None):
+    """The first row of df with a value of at least value in the given column, or None.
+
+    With a sort_cache, DataFrames and row views whose base column is in order, or has been sorted already,
+    are binary searched (see SortPermutationCache.known_sorted_index). Anything else, including lazy tables,
+    is scanned a block of values at a time."""
+    dtype = df.dtypes[column_name]
+    if not is_searchable(dtype):
+        raise ValueError('column {} of type {} cannot be searched by value'.format(column_name, dtype))
+    if sort_cache is not None and isinstance(df, (pd.DataFrame, IndexedFrame)):
+        index = sort_cache.known_sorted_index(df, column_name)
+        if index is not None and isinstance(df, IndexedFrame):
+            return index.first_position_at_least(value, df.positions, df.increasing)
+        if index is not None:
+            return index.first_row_at_least(value)
+    column = df.column(column_name).reset_index(drop=True) if isinstance(df, IndexedFrame) else df[column_name]
+    return _scan_first_at_least(column, search_key(dtype, value))
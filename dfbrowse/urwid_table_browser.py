@@ -1,14 +1,22 @@
 import sys, re, os
+import shutil
+import threading
 
 import urwid
 
 from . import urwid_utils, browser_utils, ipython_utils
+from .background_tasks import BackgroundTask
+from .lazy_frame import wait_until_loaded
 
 from .list_utils import insert_item_if_not_present, find_and_remove_list_item, remove_list_index, shift_list_item
 from .keybindings import keybs, cmd_hint, rev_keybs
 from .gui_debug import debug_print, print
 
 PAGE_SIZE = 20
+SEARCH_COMMANDS = ('search', 'search-backward', 'find-all') # minibuffer commands that search a column
+SPINNER = '.oOo' # not the classic |/-\, since | separates modeline statuses
+SPINNER_INTERVAL = 0.1 # seconds between modeline updates while a browser function runs
+PREFETCH_IDLE_SECONDS = 0.2 # how long the view must sit still before the rows around it are formatted
 
 # this stuff captures Ctrl-C
 # ui = urwid.raw_display.RealTerminal()
@@ -31,6 +39,9 @@ def generate_strings_segments_for_column(view, col_name, is_focus_col):
     return pile_of_strs
 
 def set_attrib_on_col_pile(pile, is_focus_col, focus_pile):
+    if pile._attribs == (is_focus_col, focus_pile):
+        return # nothing to do, and set_attr_map would force a redraw
+    pile._attribs = (is_focus_col, focus_pile)
     for i in range(len(pile.contents)):
         if focus_pile == i:
             pile.contents[i][0].set_attr_map({None: 'active_element' if is_focus_col else 'active_row'})
@@ -44,12 +55,18 @@ class BrowserNamedColumnPile(urwid.Pile):
         self.table_view = table_view
         self._is_focus_col_cb = is_focus_col_cb
         self._focus_pile = 0
+        self._attribs = None
         self._create_pile()
         self.rebuild_from_view()
     def _create_pile(self, num_texts=5): # TODO this magic number is pretty dang hacky
         for i in range(num_texts):
             self.contents.append((urwid.AttrMap(urwid.Text('', wrap='clip'), 'def'),
                                   ('pack', None)))
+    def _set_segment_text(self, idx, text):
+        """Only touches the Text widget if its content actually changed."""
+        text_widget = self.contents[idx][0].original_widget
+        if text_widget.text != text:
+            text_widget.set_text(text)
     @property
     def is_focused(self):
         return self._is_focus_col_cb(self.column_name)
@@ -58,14 +75,14 @@ class BrowserNamedColumnPile(urwid.Pile):
     def rebuild_from_view(self):
         pile_strings = generate_strings_segments_for_column(
             self.table_view, self.column_name, self.is_focused)
-        for idx, pile_str in enumerate(pile_strings):
-            self.contents[idx][0].original_widget.set_text(pile_str)
+        for idx in range(len(self.contents)):
+            self._set_segment_text(idx, pile_strings[idx] if idx < len(pile_strings) else '')
         self._focus_pile = len(pile_strings) - 2
         self.reset_attribs()
     def _set_header_break(self):
         header = self.table_view.header(self.column_name)
         header += '\n...' if self.is_focused and self.table_view.top_row > 1 else '\n'
-        self.contents[0][0].original_widget.set_text(header)
+        self._set_segment_text(0, header)
     def reset_attribs(self):
         self._set_header_break()
         set_attrib_on_col_pile(self, self.is_focused, self._focus_pile)
@@ -73,16 +90,20 @@ class BrowserNamedColumnPile(urwid.Pile):
 
 class Modeline(urwid.WidgetWrap):
     doc_attrs = '{name} -- c{current_col}/{cols} - r{current_row}/{rows}({row_percent}%) -- {current_cell}'
+    status_attrs = ' -- {status}'
     def __init__(self):
         self.text = urwid.Text('Welcome to the Dataframe browser!')
         urwid.WidgetWrap.__init__(self, self.text)
     def set_text(self, text):
         self.text.set_text(text)
-    def update_doc_attrs(self, name, cols, rows, current_col, current_row, current_cell):
-        self.text.set_text(Modeline.doc_attrs.format(
+    def update_doc_attrs(self, name, cols, rows, current_col, current_row, current_cell, status=''):
+        text = Modeline.doc_attrs.format(
             name=name, cols=cols, rows=rows, current_col=current_col,
             current_row=current_row, row_percent=int(100*current_row/rows),
-            current_cell=current_cell))
+            current_cell=current_cell)
+        if status:
+            text += Modeline.status_attrs.format(status=status)
+        self.text.set_text(text)
     def show_basic_commands(self):
         # help text
         self.set_text(
@@ -107,8 +128,10 @@ class Minibuffer(urwid.WidgetWrap):
         urwid.WidgetWrap.__init__(self, self.edit_text)
         self.active_command = 'browsing'
         self.active_args = dict()
+        self.search_mode = 'substring'
     def focus_granted(self, command, **kwargs):
         self.edit_text.set_edit_text('')
+        self.search_mode = 'substring'
         self._set_command(command, **kwargs)
     def focus_removed(self):
         self._set_command('browsing')
@@ -124,7 +147,8 @@ class Minibuffer(urwid.WidgetWrap):
         self.active_args = kwargs
         # self.edit_text.set_edit_text('')
         if command:
-            self.edit_text.set_caption(command + ': ')
+            mode = ' [regex]' if command in SEARCH_COMMANDS and self.search_mode == 'regex' else ''
+            self.edit_text.set_caption(command + mode + ': ')
         if 'completer' in self.active_args:
             self.edit_text.setCompletionMethod(self.active_args['completer'])
         if 'default_text' in self.active_args:
@@ -150,7 +174,13 @@ class Minibuffer(urwid.WidgetWrap):
                 self._set_command('search')
             else:
                 self._set_command('search-backward')
-            self.browser_frame.table_view.search_current_col(search_str, down, skip_current)
+            self.browser_frame.table_view.search_current_col(search_str, down, skip_current, self.search_mode)
+
+    def _toggle_search_mode(self):
+        if self.active_command in SEARCH_COMMANDS:
+            self.search_mode = 'regex' if self.search_mode == 'substring' else 'substring'
+            self._set_command(self.active_command)
+            self._search(self.edit_text.get_edit_text(), self.active_command == 'search', False)
 
     def _submit_command(self, cmd_str):
         print('handling input string', cmd_str)
@@ -170,6 +200,12 @@ class Minibuffer(urwid.WidgetWrap):
         elif self.active_command == 'jump-to-column':
             browser_utils.jump(self.browser_frame.table_view.browser, cmd_str)
             self.give_away_focus()
+        elif self.active_command == 'jump-to-value':
+            self.browser_frame.table_view.jump_to_value(cmd_str)
+            self.give_away_focus()
+        elif self.active_command == 'find-all':
+            self.browser_frame.table_view.find_all_in_current_col(cmd_str, self.search_mode)
+            self.give_away_focus()
         elif self.active_command == None:
             # we've typed in the name of a custom function!
             print('setting up call to browser function ', cmd_str)
@@ -180,8 +216,7 @@ class Minibuffer(urwid.WidgetWrap):
             ipython_utils.execute_ipython_command(cmd_str)
             self.give_away_focus()
         else: # this is where we call a custom browser function
-            self.browser_frame.table_view.browser.call_browser_func(
-                self.active_command, args_str=cmd_str)
+            self.browser_frame.table_view.call_browser_func(self.active_command, args_str=cmd_str)
             self.give_away_focus()
 
     def keypress(self, size, key):
@@ -196,6 +231,7 @@ class Minibuffer(urwid.WidgetWrap):
                 print(e)
                 self.browser_frame.hint(cmd_hint(self.active_command).format(cmd_str))
         elif key in keybs('cancel'):
+            self.browser_frame.table_view.cancel_search()
             self.give_away_focus()
         elif key == 'ctrl c':
             # raise urwid.ExitMainLoop()
@@ -204,6 +240,8 @@ class Minibuffer(urwid.WidgetWrap):
             self._search(self.edit_text.get_edit_text(), True, True)
         elif key in keybs('search-backward'):
             self._search(self.edit_text.get_edit_text(), False, True)
+        elif key in keybs('toggle-search-regex'):
+            self._toggle_search_mode()
         else: # active search - TODO maybe replace with 'active results' being fed directly to the command callback
             self.edit_text.keypress(size, key)
             if key != 'backspace':
@@ -222,6 +260,18 @@ class UrwidTableView(urwid.WidgetWrap):
         self.urwid_cols = urwid.Columns([], dividechars=self._col_gap)
         super().__init__(self.urwid_cols)
         self._size = None
+        # column piles are kept around and refreshed in place rather than rebuilt on every change.
+        self._piles = dict() # column name -> BrowserNamedColumnPile
+        self._piles_view = None # the browser view that the piles were built for
+        # only the columns that fit on screen get piles. These track which ones those are.
+        self._left_col = 0 # index into browse_columns of the column at the left edge of the screen
+        self._maxcol = shutil.get_terminal_size().columns # until urwid tells us otherwise
+        self._width_index = None
+        self._width_index_columns = None # the browse_columns list that _width_index describes
+        self._search_task = None
+        self._func_task = None # the browser function running in the background, if any
+        self._prefetch_task = None
+        self._prefetch_requests = 0 # counts update_view calls, so that only the last one's prefetch runs
 
     # TODO display help in modeline or something, generated by defined commands/keybindings
     # TODO figure out how to get frame height so that we can feed that information to the browser
@@ -235,7 +285,7 @@ class UrwidTableView(urwid.WidgetWrap):
         return self.browser.selected_column
     @property
     def _selected_col_idx(self):
-        return self.browser.browse_columns.index(self.browser.selected_column)
+        return self.browser.selected_column_index
 
     def _col_by_index(self, idx):
         return self.browser.browse_columns[idx]
@@ -262,41 +312,158 @@ class UrwidTableView(urwid.WidgetWrap):
     def rename_active_browser(self, new_name):
         self.multibrowser.rename_browser(self.multibrowser.active_browser_name, new_name)
 
+    def _pile_for_column(self, col_name):
+        """Returns an up-to-date pile for the column, creating it only if we don't already have one."""
+        pile = self._piles.get(col_name)
+        if pile is None:
+            pile = BrowserNamedColumnPile(col_name, self.browser.view, lambda colname: self._is_focus_column(colname))
+            self._piles[col_name] = pile
+        else:
+            pile.rebuild_from_view()
+        return pile
+
+    def _column_width_index(self):
+        browse_columns = self.browser.browse_columns
+        if self._width_index_columns is not browse_columns:
+            view = self.browser.view
+            self._width_index = urwid_utils.ColumnWidthIndex(
+                [view.estimated_width(col) for col in browse_columns], self._col_gap)
+            self._width_index_columns = browse_columns
+        return self._width_index
+
+    def _visible_span(self, widths, selected):
+        """The first and last browse column indices that fit on screen, keeping the selected column in view."""
+        left = min(self._left_col, selected)
+        right = widths.rightmost_visible(left, self._maxcol)
+        if selected > right:
+            left = widths.leftmost_for(selected, self._maxcol)
+            right = widths.rightmost_visible(left, self._maxcol)
+        return left, right
+
+    def _set_maxcol(self, maxcol):
+        if maxcol != self._maxcol:
+            self._maxcol = maxcol
+            if hasattr(self, 'multibrowser'):
+                self.update_view()
+
+    def render(self, size, focus=False):
+        self._set_maxcol(size[0])
+        return super().render(size, focus)
+
+    def rows(self, size, focus=False):
+        self._set_maxcol(size[0])
+        return super().rows(size, focus)
+
     def update_view(self, browser=None, table_changed=True):
+        # the only function allowed to directly modify urwid_cols.contents or urwid_cols.focus_position
         print('updating view')
-        try:
-            old_col = self.urwid_cols.focus_position
-        except:
-            old_col = self._selected_col_idx
-        del self.urwid_cols.contents[:]
-        if len(self.browser.browse_columns) > 0:
-            # TODO don't recreate these column piles - instead keep track of them
-            # and re-order/refresh them as necessary, only creating new ones when brand new columns are shown
-            for idx, col_name in enumerate(self.browser.browse_columns):
-                pile = BrowserNamedColumnPile(col_name, self.browser.view, lambda colname: self._is_focus_column(colname))
-                column_width = self.browser.view.width(col_name)
-                self.urwid_cols.contents.append((pile, _given(self.urwid_cols, column_width)))
-            try:
-                self.urwid_cols.focus_position = min(old_col, len(self.urwid_cols.contents))
-            except Exception as e:
-                print('exception in update_view when trying to set columns focus_position', e)
-                self.urwid_frame.hint(str(e))
-            self.update_modeline_text()
+        if self._piles_view is not self.browser.view:
+            self._piles.clear()
+            self._piles_view = self.browser.view
+            self._left_col = 0
+        browse_columns = self.browser.browse_columns
+        if len(browse_columns) == 0:
+            del self.urwid_cols.contents[:]
+            return
+        view = self.browser.view
+        widths = self._column_width_index()
+        selected = self._selected_col_idx
+        self._left_col = min(self._left_col, len(browse_columns) - 1)
+        refreshed = dict()
+        for attempt in range(3):
+            # a column's real width is only known once it has been rendered, which may change what fits.
+            left, right = self._visible_span(widths, selected)
+            widths_changed = False
+            for idx in range(left, right + 1):
+                col_name = browse_columns[idx]
+                if col_name not in refreshed:
+                    refreshed[col_name] = self._pile_for_column(col_name)
+                width = view.width(col_name)
+                if width != widths.width(idx):
+                    widths.set_width(idx, width)
+                    widths_changed = True
+            if not widths_changed:
+                break
+        self._left_col = left
+        visible = browse_columns[left:right + 1]
+        self._piles = {col_name: refreshed[col_name] for col_name in visible}
+        view.show_columns(visible)
+        new_contents = [(self._piles[col_name], _given(self.urwid_cols, widths.width(left + idx)))
+                        for idx, col_name in enumerate(visible)]
+        if new_contents != list(self.urwid_cols.contents):
+            # only columns that were scrolled in or out, reordered or resized change the layout.
+            del self.urwid_cols.contents[:]
+            self.urwid_cols.contents.extend(new_contents)
+        if self.urwid_cols.focus_position != selected - left:
+            self.urwid_cols.focus_position = selected - left
+        self.update_modeline_text()
+        self._schedule_prefetch(visible)
+
+    def _schedule_prefetch(self, column_names):
+        """Once the view has been still for a moment, formats the rows the visible columns will show next."""
+        if self._prefetch_task is not None:
+            self._prefetch_task.cancel()
+            self._prefetch_task = None
+        self._prefetch_requests += 1
+        request = self._prefetch_requests
+        self.urwid_frame.call_later(PREFETCH_IDLE_SECONDS, lambda: self._start_prefetch(request, column_names))
+
+    def _start_prefetch(self, request, column_names):
+        if request != self._prefetch_requests or self._func_task is not None:
+            return # the view has moved on since, or a browser function is busy with the table
+        view = self.browser.view
+        prefetch = view.prepare_prefetch(column_names)
+
+        def prefetch_done(segments):
+            if self._prefetch_task is task:
+                self._prefetch_task = None
+                view.finish_prefetch(segments)
+
+        task = BackgroundTask('prefetch', lambda task: prefetch(task.report_progress), prefetch_done,
+                              dispatch=self.urwid_frame.call_from_thread)
+        self._prefetch_task = task.start()
+
+    def _search_status(self):
+        task = self._search_task
+        if task is None:
+            return ''
+        return 'searching... {:,} rows ({:,.0f} rows/s) - esc to cancel'.format(task.progress, task.rate)
+
+    def _func_status(self):
+        task = self._func_task
+        if task is None:
+            return ''
+        spinner = SPINNER[int(task.elapsed / SPINNER_INTERVAL) % len(SPINNER)]
+        return '{} {} {:.1f}s - esc to cancel'.format(spinner, task.name, task.elapsed)
+
+    def _match_status(self):
+        match_index = self.browser.view.match_index
+        if match_index is None or match_index.column_name != self._selected_col:
+            return ''
+        hit = match_index.hit_number(self.browser.selected_row)
+        if hit is None:
+            return '{:,} hits for "{}"'.format(len(match_index), match_index.query)
+        return 'hit {:,} of {:,} for "{}"'.format(hit, len(match_index), match_index.query)
 
     def update_modeline_text(self):
+        status = ' | '.join(text for text in (self.browser.status, self._func_status(), self._search_status(),
+                                              self._match_status())
+                            if text)
         current_cell = str(self.browser.content())
         self.urwid_frame.modeline.update_doc_attrs(self.multibrowser.active_browser_name,
                                                    len(self.browser.browse_columns),
                                                    len(self.browser),
                                                    self._selected_col_idx + 1,
                                                    self.browser.selected_row + 1,
-                                                   current_cell)
+                                                   current_cell,
+                                                   status)
 
     def scroll(self, num_rows):
         browser_utils.scroll_rows(self.browser, num_rows)
 
     def mouse_event(self, size, event, button, col, row, focus):
         self._size = size
+        self._set_maxcol(size[0])
         if event == 'mouse press':
             if button == 4.0:
                 self.scroll(-1)
@@ -304,32 +471,18 @@ class UrwidTableView(urwid.WidgetWrap):
                 self.scroll(1)
             else:
                 print('moving to row', row)
-                col = urwid_utils.translate_urwid_col_to_browser_col(self.urwid_cols, col, self.browser,
-                                                                     self._col_gap, self._size)
+                col = self._column_width_index().column_at(self._left_col, col)
                 self.set_rowcol_focus(self._col_by_index(col), row - 2)
         return True
 
     def set_col_focus(self, col_num):
-        # the only function allowed to directly modify urwid_cols.focus_position
         col_num = max(0, min(col_num, len(self.browser.browse_columns) - 1))
-        print(self.urwid_cols.focus_position)
         try:
             current_selected_col_idx = self._selected_col_idx
             if current_selected_col_idx != col_num:
                 print('moving col focus from', current_selected_col_idx, col_num )
-                if col_num > urwid_utils.get_rightmost_visible_column(self.urwid_cols, self._size):
-                    print('going leftward far enough to change columns viewed')
-                    self.urwid_cols.focus_position = col_num
-                elif col_num < urwid_utils.get_leftmost_visible_column(self.urwid_cols, self._size):
-                    print('going rightward far enough...')
-                    while col_num < urwid_utils.get_leftmost_visible_column(self.urwid_cols, self._size):
-                        self.urwid_cols.focus_position -= 1
                 self.browser.selected_column = col_num
-                self.urwid_cols.contents[current_selected_col_idx][0].reset_attribs()
-                self.urwid_cols.contents[col_num][0].reset_attribs()
-                self.update_modeline_text()
-                print(self.urwid_cols.focus_position)
-
+                self.update_view() # scrolls the columns if necessary
             return True
         except Exception as e:
             print('exception in set focus', e)
@@ -342,10 +495,150 @@ class UrwidTableView(urwid.WidgetWrap):
         if row != self.browser.view.selected_row - self.browser.view.top_row:
             self.scroll(row - (self.browser.view.selected_row - self.browser.view.top_row))
 
-    def search_current_col(self, search_string, down=True, skip_current=False):
-        self.browser.search_column(self._selected_col, search_string, down, skip_current)
-        # TODO could print help text saying the search failed.
+    def search_current_col(self, search_string, down=True, skip_current=False, mode='substring'):
+        """Searches what's already formatted right away, and the rest of the column in the background.
+
+        Any search still running is cancelled first, so each keystroke of an incremental search replaces the last."""
         # TODO also, could potentially try wrapping the search just like emacs...
+        self.cancel_search()
+        browser = self.browser
+        column_name = self._selected_col
+        found, resume_row = browser.view.search_cached(column_name, search_string, down, skip_current, mode=mode)
+        if found is not None:
+            browser.selected_row = found
+            return
+        if resume_row is None: # the find-all results say there is nothing more
+            self.urwid_frame.hint('"{}" not found in column {}'.format(search_string, column_name))
+            return
+        table = browser.df
+
+        search_uncached = browser.view.prepare_uncached_search(column_name, search_string, resume_row, down,
+                                                               mode=mode)
+
+        def search_rest(task):
+            return search_uncached(task.report_progress)
+
+        def search_done(row):
+            if self._search_task is not task:
+                return # superseded by a newer search
+            self._search_task = None
+            if row is None:
+                self.urwid_frame.hint('"{}" not found in column {}'.format(search_string, column_name))
+            elif browser.df is table: # otherwise the table changed under us and the row means nothing
+                browser.selected_row = row
+                self.update_modeline_text()
+
+        def search_failed(e):
+            if self._search_task is task:
+                self._search_task = None
+                self.urwid_frame.hint('search failed: {}'.format(e))
+
+        task = BackgroundTask('search ' + str(column_name), search_rest, search_done,
+                              on_progress=self.update_modeline_text, on_error=search_failed,
+                              dispatch=self.urwid_frame.call_from_thread)
+        self._search_task = task.start()
+        self.update_modeline_text()
+
+    def find_all_in_current_col(self, search_string, mode='substring'):
+        """Finds every match in the current column in the background, then goes to the first one from here on.
+
+        Afterwards, next-match and previous-match step through them without searching again."""
+        self.cancel_search()
+        browser = self.browser
+        column_name = self._selected_col
+        find_all = browser.view.prepare_find_all(column_name, search_string, mode=mode)
+        table = browser.df
+
+        def found_all(match_index):
+            if self._search_task is not task:
+                return # superseded by a newer search
+            self._search_task = None
+            if browser.df is not table:
+                return # the table changed under us
+            browser.view.match_index = match_index
+            if not len(match_index):
+                self.urwid_frame.hint('"{}" not found in column {}'.format(search_string, column_name))
+            else:
+                found = match_index.next(browser.selected_row, skip_current=False)
+                found = found if found is not None else match_index.next(browser.selected_row, down=False)
+                browser.selected_row = found
+            self.update_modeline_text()
+
+        def find_failed(e):
+            if self._search_task is task:
+                self._search_task = None
+                self.urwid_frame.hint('search failed: {}'.format(e))
+
+        task = BackgroundTask('find all ' + str(column_name), lambda task: find_all(task.report_progress),
+                              found_all, on_progress=self.update_modeline_text, on_error=find_failed,
+                              dispatch=self.urwid_frame.call_from_thread)
+        self._search_task = task.start()
+        self.update_modeline_text()
+
+    def call_browser_func(self, function_name, **kwargs):
+        """Runs a browser function on a worker thread (unless it asks to run inline), keeping the UI responsive.
+
+        The modeline shows a spinner while it runs. Cancelling stops waiting for it: the function itself
+        can't be interrupted, so it runs to the end in the background, and its result is thrown away."""
+        if self._func_task is not None:
+            self.urwid_frame.hint('still running {} - esc to cancel it first'.format(self._func_task.name))
+            return
+        browser = self.browser
+        if browser.browser_func(function_name).executor == 'inline':
+            browser.call_browser_func(function_name, **kwargs)
+            return
+        compute = browser.prepare_browser_func(function_name, **kwargs)
+        table = browser.df
+        if not wait_until_loaded(table, 0):
+            self.urwid_frame.hint('{} will run once the table has finished loading - esc to cancel'.format(
+                function_name))
+
+        def func_done(new_df):
+            if self._func_task is not task:
+                return
+            self._func_task = None
+            if browser.df is not table: # undone or redone while we were running
+                self.urwid_frame.hint('the table changed while {} ran, so its result was discarded'.format(
+                    function_name))
+                return
+            browser.finish_browser_func(new_df)
+            self.update_view()
+
+        def func_failed(e):
+            if self._func_task is task:
+                self._func_task = None
+                self.urwid_frame.hint(cmd_hint(function_name).format(kwargs.get('args_str', '')) + ' ({})'.format(e))
+
+        def spin():
+            if self._func_task is task:
+                self.update_modeline_text()
+                self.urwid_frame.call_later(SPINNER_INTERVAL, spin)
+
+        task = BackgroundTask(function_name, lambda task: compute(task.report_progress), func_done, on_error=func_failed,
+                              dispatch=self.urwid_frame.call_from_thread)
+        self._func_task = task.start()
+        spin()
+
+    def cancel_browser_func(self):
+        if self._func_task is not None:
+            self.urwid_frame.hint('cancelled {}'.format(self._func_task.name))
+            self._func_task.cancel()
+            self._func_task = None
+
+    def step_match(self, down=True):
+        if self.browser.view.match_index is None:
+            self.urwid_frame.hint('nothing found yet - use find-all first')
+        elif not self.browser.next_match(down):
+            self.urwid_frame.hint('no more hits ' + ('below' if down else 'above'))
+
+    def cancel_search(self):
+        if self._search_task is not None:
+            self._search_task.cancel()
+            self._search_task = None
+
+    def jump_to_value(self, value):
+        if not self.browser.jump_to_value(value):
+            self.urwid_frame.hint('no value of at least {} in column {}'.format(value, self._selected_col))
 
     def shift_selected_column(self, shift_num_to_right):
         self.browser.browse_columns = shift_list_item(self.browser.browse_columns,
@@ -360,8 +653,7 @@ class UrwidTableView(urwid.WidgetWrap):
 
     def change_column_width(self, by_n):
         self.browser.view.change_column_width(self._selected_col, by_n)
-        self.urwid_cols.contents[self._selected_col_idx] = (self.urwid_cols.contents[self._selected_col_idx][0],
-                                                    _given(self.urwid_cols, self.browser.view.width(self._selected_col)))
+        self.update_view()
 
     def insert_column(self, col_name, idx=None):
         try:
@@ -378,6 +670,7 @@ class UrwidTableView(urwid.WidgetWrap):
     # BROWSE COMMANDS
     def keypress(self, size, key):
         self._size = size
+        self._set_maxcol(size[0])
 
         # TODO this should go away in favor of a dynamic lookup
         # where the key is found in a full set of dynamically-populated keybindings
@@ -386,7 +679,11 @@ class UrwidTableView(urwid.WidgetWrap):
         # registered as core functionality
         # vs the ones registered as browser functions.
 
-        if key in keybs('browse-right'):
+        if key in keybs('cancel'):
+            self.cancel_search()
+            self.cancel_browser_func()
+            self.update_modeline_text()
+        elif key in keybs('browse-right'):
             self.set_col_focus(self._selected_col_idx + 1)
         elif key in keybs('browse-left'):
             self.set_col_focus(self._selected_col_idx - 1)
@@ -398,6 +695,11 @@ class UrwidTableView(urwid.WidgetWrap):
             self.browser.undo()
         elif key in keybs('redo'):
             self.browser.redo()
+        elif key in keybs('toggle-lazy'):
+            self.browser.lazy = not self.browser.lazy
+            self.urwid_frame.hint('filters and sorts will be {}'.format(
+                'planned, and run once their rows are needed' if self.browser.lazy else 'run right away'))
+            self.update_modeline_text()
         elif key in keybs('quit'):
             raise urwid.ExitMainLoop()
         elif key in keybs('page-up'):
@@ -428,6 +730,8 @@ class UrwidTableView(urwid.WidgetWrap):
             self.jump_to_col(0)
         elif key in keybs('jump-to-row'):
             self.urwid_frame.focus_minibuffer('jump-to-row')
+        elif key in keybs('jump-to-value'):
+            self.urwid_frame.focus_minibuffer('jump-to-value')
         elif key in keybs('jump-to-column'):
             self.urwid_frame.focus_minibuffer('jump-to-column', completer=self._get_completer_with_hint(
                 self.browser.browse_columns))
@@ -438,6 +742,12 @@ class UrwidTableView(urwid.WidgetWrap):
             self.urwid_frame.focus_minibuffer('search')
         elif key in keybs('search-backward'):
             self.urwid_frame.focus_minibuffer('search-backward')
+        elif key in keybs('find-all'):
+            self.urwid_frame.focus_minibuffer('find-all')
+        elif key in keybs('next-match'):
+            self.step_match(True)
+        elif key in keybs('previous-match'):
+            self.step_match(False)
         elif key in keybs('rename-browser'):
             self.urwid_frame.focus_minibuffer('rename-browser',
                                               default_text=self.multibrowser.active_browser_name)
@@ -448,9 +758,9 @@ class UrwidTableView(urwid.WidgetWrap):
         elif key in keybs('query'):
             self.urwid_frame.focus_minibuffer('query', default_text=self._selected_col)
         elif key in keybs('sort-ascending'):
-            self.browser.call_browser_func('sort_on_columns', columns=[self.browser.selected_column], ascending=True)
+            self.call_browser_func('sort_on_columns', columns=[self.browser.selected_column], ascending=True)
         elif key in keybs('sort-descending'):
-            self.browser.call_browser_func('sort_on_columns', columns=[self.browser.selected_column], ascending=False)
+            self.call_browser_func('sort_on_columns', columns=[self.browser.selected_column], ascending=False)
         elif key in keybs('command'):
             self.urwid_frame.focus_minibuffer(None)
         elif rev_keybs(key):
@@ -483,11 +793,49 @@ class TableBrowserUrwidLoopFrame:
         self.inner_frame = urwid.Frame(urwid.Filler(self.table_view, valign='top'),
                                        footer=urwid.AttrMap(self.modeline, 'modeline'))
         self.frame = urwid.Frame(self.inner_frame, footer=self.minibuffer)
+        self._from_thread = list()
+        self._from_thread_lock = threading.Lock()
+        self._wake_pipe = None
+        self._loop = None
     def start(self, multibrowser):
         loop = urwid.MainLoop(self.frame, palette,
                               unhandled_input=self.unhandled_input)
+        self._loop = loop
         self.table_view.set_multibrowser(multibrowser)
-        loop.run()
+        self._wake_pipe = loop.watch_pipe(self._run_from_thread)
+        self._run_from_thread(b'') # anything that was posted while we weren't running
+        try:
+            loop.run()
+        finally:
+            wake_pipe, self._wake_pipe = self._wake_pipe, None
+            loop.remove_watch_pipe(wake_pipe)
+            os.close(wake_pipe)
+            self._loop = None
+    def call_from_thread(self, func):
+        """Runs func() on the UI thread. Safe to call from any thread.
+
+        If the browser isn't currently running, func will run the next time it starts.
+        A func that is already waiting to run is not queued a second time."""
+        with self._from_thread_lock:
+            if func in self._from_thread:
+                return
+            self._from_thread.append(func)
+        wake_pipe = self._wake_pipe
+        if wake_pipe is not None:
+            try:
+                os.write(wake_pipe, b'!')
+            except OSError:
+                pass # the loop is shutting down; func will run at the next start.
+    def call_later(self, seconds, func):
+        """Runs func() on the UI thread after the given delay, if the browser is still running then."""
+        if self._loop is not None:
+            self._loop.set_alarm_in(seconds, lambda _loop, _data: func())
+    def _run_from_thread(self, _data):
+        with self._from_thread_lock:
+            funcs, self._from_thread = self._from_thread, list()
+        for func in funcs:
+            func()
+        return True
     def focus_minibuffer(self, command, **kwargs):
         self.frame.focus_position = 'footer'
         self.minibuffer.focus_granted(command, **kwargs)
@@ -2,6 +2,8 @@ import urwid
 import sys
 import os
 
+import numpy as np
+
 
 # It appears that I found this here: https://wiki.goffi.org/wiki/Urwid-satext/en
 class AdvancedEdit(urwid.Edit):
@@ -106,25 +108,40 @@ class ListCompleter:
         return prefix
 
 
-def get_leftmost_visible_column(urwid_cols, current_size):
-    cols = urwid_cols.column_widths(current_size)
-    for idx, col in enumerate(cols):
-        if col != 0:
-            return idx
-    return 0
-
-def get_rightmost_visible_column(urwid_cols, current_size):
-    cols = urwid_cols.column_widths(current_size)
-    start = get_leftmost_visible_column(urwid_cols, current_size)
-    for idx, col in enumerate(cols[start:]):
-        if col == 0:
-            return idx + start - 1
-    return idx + start - 1
-
-def translate_urwid_col_to_browser_col(urwid_cols, ucol, browser, col_gap, current_size):
-    col = get_leftmost_visible_column(urwid_cols, current_size)
-    next_col_start = browser.view.width(browser.browse_columns[col])
-    while ucol > next_col_start:
-        col += 1
-        next_col_start += browser.view.width(browser.browse_columns[col]) + col_gap
-    return col
+class ColumnWidthIndex(object):
+    """Prefix sums over the widths of a row of columns (each followed by a gap).
+
+    Finding which columns fit on screen, or which column is under a given screen
+    x coordinate, is then a binary search rather than a walk over every column."""
+    def __init__(self, widths, gap):
+        self.gap = gap
+        # starts[i] is the x position of column i when column 0 is at x=0. starts[-1] is the total.
+        self.starts = np.zeros(len(widths) + 1, dtype=np.int64)
+        np.cumsum(np.asarray(widths, dtype=np.int64) + gap, out=self.starts[1:])
+
+    def __len__(self):
+        return len(self.starts) - 1
+
+    def width(self, idx):
+        return int(self.starts[idx + 1] - self.starts[idx]) - self.gap
+
+    def set_width(self, idx, width):
+        delta = width - self.width(idx)
+        if delta:
+            self.starts[idx + 1:] += delta
+
+    def rightmost_visible(self, left, maxcol):
+        """The last column that fits entirely within maxcol when column left is at the left edge."""
+        # column r fits if starts[r + 1] - gap - starts[left] <= maxcol
+        right = int(np.searchsorted(self.starts, self.starts[left] + maxcol + self.gap, side='right')) - 2
+        return max(left, min(right, len(self) - 1))
+
+    def leftmost_for(self, right, maxcol):
+        """The leftmost column that can be at the left edge while column right still fits."""
+        left = int(np.searchsorted(self.starts, self.starts[right + 1] - self.gap - maxcol, side='left'))
+        return max(0, min(left, right))
+
+    def column_at(self, left, x):
+        """The column under screen position x when column left is at the left edge. Gaps belong to the column on their left."""
+        idx = int(np.searchsorted(self.starts, self.starts[left] + x, side='right')) - 1
+        return max(left, min(idx, len(self) - 1))
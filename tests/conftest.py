@@ -0,0 +1,10 @@
+from types import SimpleNamespace
+
+import pytest
+
+
+@pytest.fixture
+def headless_frame():
+    """Enough of a TableBrowserUrwidLoopFrame for a MultipleDataframeBrowser that is never shown."""
+    return SimpleNamespace(call_from_thread=lambda cb: cb(),
+                           table_view=SimpleNamespace(update_view=lambda *args, **kwargs: None))
@@ -0,0 +1,23 @@
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from dfbrowse import cache_manager
+from dfbrowse.cache_manager import display_cache_manager
+from dfbrowse.dataframe_browser import DataframeTableBrowser
+
+
+def test_columns_on_screen_keep_their_rows_however_long_ago_they_were_drawn(monkeypatch):
+    df = pd.DataFrame({col: np.random.rand(100000) for col in 'abcd'})
+    view = DataframeTableBrowser(df).view
+    view.lines('d') # scrolled away from since
+    on_screen = {col: view.lines(col) for col in 'ab'}
+    view.show_columns(['a', 'b'])
+    now = timeit.default_timer()
+    monkeypatch.setattr(cache_manager.timeit, 'default_timer', lambda: now + 60.0)
+    monkeypatch.setattr(display_cache_manager, 'max_bytes', view.cache_nbytes)
+    view.lines('c') # scrolling one column right goes over budget
+    assert not view._column_cache['d'].row_strings
+    for col, lines in on_screen.items():
+        assert view._column_cache[col].row_strings[:len(lines)] == lines
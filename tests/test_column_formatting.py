@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dfbrowse.column_formatting import format_values
+
+
+def _pandas_strings(series):
+    return [line.strip() for line in series.to_string(index=False).split('\n')]
+
+
+@pytest.mark.parametrize('values', [
+    [1234567.5],
+    [99999999.0],
+    [0.1, 123456.789, 1e7],
+    [-1234567.5, 3.0],
+    [np.nan, 1.0, 12345678.9],
+    [3220405910.0],
+    [5170821953.8, 1.0],
+    [1e-7, 1.0],
+    [1e20, 1.0],
+    [0.5, np.inf, -np.inf],
+    [1.0, 2.0],
+])
+def test_floats_format_like_pandas(values):
+    series = pd.Series(values, dtype=float)
+    assert [s.strip() for s in format_values(series)] == _pandas_strings(series)
+
+
+def test_mixed_magnitude_floats_format_like_pandas():
+    rng = np.random.default_rng(0)
+    for _ in range(500):
+        n = rng.integers(1, 6)
+        values = np.round(rng.standard_normal(n) * 10.0 ** rng.integers(-8, 12, n), rng.integers(0, 8))
+        series = pd.Series(values)
+        assert [s.strip() for s in format_values(series)] == _pandas_strings(series), values
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+
+from dfbrowse.dataframe_browser import DataframeTableBrowser
+from dfbrowse.lazy_frame import materialize
+
+
+def _lines(browser, column):
+    return list(browser.view.lines(column, 0, 30))
+
+
+def test_a_fork_shares_tables_and_column_caches_until_it_changes_them():
+    df = pd.DataFrame({'a': np.arange(1000), 'b': np.arange(1000) * 0.5})
+    browser = DataframeTableBrowser(df)
+    original = {col: _lines(browser, col) for col in df.columns}
+    fork = browser.fork()
+    assert fork.df is browser.df and fork.history[0] is browser.history[0]
+    assert all(fork.view._column_cache[col] is browser.view._column_cache[col] for col in df.columns)
+
+    assert _lines(fork, 'a') == original['a']
+    assert fork.view._column_cache['a'] is not browser.view._column_cache['a'] # copied before it was used...
+    assert fork.view._column_cache['a'].row_strings is browser.view._column_cache['a'].row_strings # ...cheaply
+
+    fork.call_browser_func('query', args_str='a % 3 == 0')
+    assert len(browser.df) == len(df) and len(fork.df) == len(df.query('a % 3 == 0'))
+    assert _lines(fork, 'a')[:3] == ['0', '3', '6']
+    assert fork.view._column_cache['b'] is not browser.view._column_cache['b']
+    assert {col: _lines(browser, col) for col in df.columns} == original
+    assert len(browser.history) == 1
+
+    browser.call_browser_func('sort_descending_on_columns', args_str='a')
+    assert _lines(fork, 'a')[:3] == ['0', '3', '6']
+    fork.undo()
+    assert fork.df is df and {col: _lines(fork, col) for col in df.columns} == original
+    assert _lines(browser, 'a')[:3] == ['999', '998', '997']
+    pd.testing.assert_frame_equal(materialize(browser.df), df.sort_values('a', ascending=False))
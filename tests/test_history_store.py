@@ -0,0 +1,52 @@
+import gc
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from dfbrowse.dataframe_browser import DataframeTableBrowser
+from dfbrowse.history_store import FrameRef, _resident_nbytes, frame_key
+from dfbrowse.indexed_frame import IndexedFrame
+from dfbrowse.lazy_frame import materialize
+
+
+def test_spilling_a_frame_frees_it_from_views_too():
+    df = pd.DataFrame({'a': np.arange(100000), 'b': np.random.rand(100000)})
+    browser = DataframeTableBrowser(df, history_budget_bytes=4 * 1024**2)
+    browser.call_browser_func('eval_df', args_str='df.assign(c=df.b * 2)')
+    browser.call_browser_func('sort_descending_on_columns', args_str='b')
+    spilled = weakref.ref(browser.history[1].frame.df)
+    browser.call_browser_func('eval_df', args_str='df.assign(d=df.b * 3)')
+    browser.call_browser_func('sort_ascending_on_columns', args_str='a')
+    gc.collect()
+    assert spilled() is None
+    assert browser.history_store.bytes_spilled > 0
+
+    browser.undo(2)
+    view = browser.df
+    assert view.base is browser.history[1].frame.df # one reloaded copy, shared with the view
+    expected = df.assign(c=df.b * 2).sort_values('b', ascending=False, kind='mergesort')
+    pd.testing.assert_frame_equal(materialize(view), expected)
+
+
+def test_frame_keys_are_not_reused_when_ids_are():
+    keys, ids = set(), set()
+    for _ in range(200):
+        df = pd.DataFrame({'a': np.arange(10)})
+        assert frame_key(df) == frame_key(df)
+        keys.add(frame_key(df))
+        ids.add(id(df))
+        del df
+    assert len(keys) == 200 and len(ids) < 200 # ids were reused for new frames, keys weren't
+
+
+def test_a_frame_read_back_from_disk_keeps_its_key(tmp_path):
+    df = pd.DataFrame({'a': np.arange(100000), 'b': np.random.rand(100000)})
+    ref = FrameRef(df)
+    key = ref.frames[0][0]
+    del df
+    ref.spill(str(tmp_path))
+    gc.collect()
+    view_ref = FrameRef(IndexedFrame(ref.df, np.arange(0, 100000, 2)))
+    assert view_ref.frames[0][0] == key
+    assert _resident_nbytes([ref, view_ref]) == ref.nbytes + view_ref.own_nbytes # the base is counted once
@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dfbrowse.csv_index_frame import IndexedCsvFrame
+from dfbrowse.csv_stream_frame import StreamingCsvFrame
+from dfbrowse.dataframe_browser import DataframeTableBrowser, MultipleDataframeBrowser
+from dfbrowse.lazy_frame import materialize
+from dfbrowse.parquet_frame import ParquetFrame
+
+
+def test_functions_on_a_loading_stream_see_every_row(tmp_path):
+    path = str(tmp_path / 'rows.csv')
+    df = pd.DataFrame({'a': np.arange(300000), 'b': np.random.rand(300000)})
+    df.to_csv(path, index=False)
+    browser = DataframeTableBrowser(StreamingCsvFrame(path, chunk_rows=10000, first_chunk_rows=1000))
+    browser.call_browser_func('eval_df', args_str='df.assign(c=df.b * 2)')
+    assert len(browser.df) == len(df)
+    browser.call_browser_func('sort_descending_on_columns', args_str='b')
+    expected = df.assign(c=df.b * 2).sort_values('b', ascending=False, kind='mergesort')
+    np.testing.assert_array_equal(materialize(browser.df).a.to_numpy(), expected.a.to_numpy())
+
+
+def test_an_indexed_csv_is_given_out_without_reading_every_row(tmp_path, monkeypatch, headless_frame):
+    path = str(tmp_path / 'big.csv')
+    pd.DataFrame({'a': np.arange(100000), 'b': np.random.rand(100000)}).to_csv(path, index=False)
+    frame = IndexedCsvFrame(path, save_index=False)
+    frame.wait()
+    windows = list()
+    parse_window = frame._parse_window
+    monkeypatch.setattr(frame, '_parse_window', lambda start, stop: windows.append((start, stop)) or
+                        parse_window(start, stop))
+    mb = MultipleDataframeBrowser(table_browser_frame=headless_frame)
+    mb.add_df(frame, 'big')
+    assert mb.big is frame and mb['big'] is frame
+    assert all(stop - start < len(frame) for start, stop in windows)
+
+
+def test_a_streamed_csv_is_given_out_as_a_dataframe_once_loaded(tmp_path, headless_frame):
+    path = str(tmp_path / 'rows.csv')
+    df = pd.DataFrame({'a': np.arange(1000)})
+    df.to_csv(path, index=False)
+    frame = StreamingCsvFrame(path, chunk_rows=100, first_chunk_rows=10)
+    frame.wait()
+    mb = MultipleDataframeBrowser(table_browser_frame=headless_frame)
+    mb.add_df(frame, 'rows')
+    pd.testing.assert_frame_equal(mb.rows, df)
+
+
+def test_parquet_windows_decode_only_the_row_groups_they_overlap(tmp_path):
+    pytest.importorskip('pyarrow')
+    path = str(tmp_path / 'rows.parquet')
+    df = pd.DataFrame({'a': np.arange(10000), 'b': np.random.rand(10000), 'c': np.arange(10000).astype(str)})
+    df.to_parquet(path, row_group_size=1000, index=False)
+    frame = ParquetFrame(path)
+    assert len(frame) == len(df) and list(frame.columns) == list(df.columns)
+    for start, stop in [(0, 10), (990, 1010), (1000, 2000), (2500, 5500), (9995, 12000), (7, 7)]:
+        frame._cache.clear()
+        window = frame.read(start, stop, ['a', 'c'])
+        pd.testing.assert_frame_equal(window, df[['a', 'c']].iloc[start:stop].reset_index(drop=True))
+        groups = {row_group for row_group, _ in frame._cache}
+        assert groups == set(range(start // 1000, (min(stop, len(df)) - 1) // 1000 + 1)) if stop > start else not groups
+        assert {column for _, column in frame._cache} <= {'a', 'c'}
+    np.testing.assert_array_equal(frame['b'].iloc[4321:4330].to_numpy(), df.b.iloc[4321:4330].to_numpy())
+
+
+def test_parquet_decoded_pieces_stay_within_the_cache_budget(tmp_path):
+    pytest.importorskip('pyarrow')
+    path = str(tmp_path / 'rows.parquet')
+    df = pd.DataFrame({'a': np.arange(10000)})
+    df.to_parquet(path, row_group_size=1000, index=False)
+    frame = ParquetFrame(path, max_cache_bytes=3 * 1000 * 8)
+    for start in range(0, 10000, 1000):
+        assert frame.read(start, start + 1000).a.iloc[0] == start
+        assert frame._cache_bytes <= 3 * 1000 * 8
+    assert [row_group for row_group, _ in frame._cache] == [7, 8, 9] # least recently read go first
+
+
+@pytest.mark.parametrize('block_bytes', [7, 64, 1 << 20])
+@pytest.mark.parametrize('trailing_newline', [True, False])
+def test_csv_row_index_handles_quoted_newlines_and_a_missing_last_newline(tmp_path, block_bytes, trailing_newline):
+    path = str(tmp_path / 'rows.csv')
+    notes = ['plain', 'two\nlines', 'a "quoted"\nword', '', 'x\n\ny', 'comma, and\nnewline']
+    df = pd.DataFrame({'n': np.arange(600), 'note': [notes[i % len(notes)] for i in range(600)]})
+    text = df.to_csv(index=False)
+    with open(path, 'w') as f:
+        f.write(text if trailing_newline else text.rstrip('\n'))
+    expected = pd.read_csv(path)
+    assert len(expected) == len(df)
+    for _ in range(2): # the second time round, the saved index is reused
+        frame = IndexedCsvFrame(path, block_bytes=block_bytes)
+        assert frame.wait(10)
+        assert len(frame) == len(df)
+        for start, stop in [(0, 5), (1, 2), (250, 400), (595, 600), (0, 600)]:
+            pd.testing.assert_frame_equal(frame.read(start, stop), expected.iloc[start:stop].reset_index(drop=True))
+
+
+def test_csv_windows_share_dtypes_widened_to_fit_later_rows(tmp_path):
+    path = str(tmp_path / 'rows.csv')
+    df = pd.DataFrame({'n': np.arange(3000), 'gap': pd.array(np.arange(3000), dtype='Int64'),
+                       'code': np.arange(3000).astype(object)})
+    df.loc[2500, 'gap'] = pd.NA
+    df.loc[2700, 'code'] = 'X1'
+    df.to_csv(path, index=False)
+    frame = IndexedCsvFrame(path, save_index=False)
+    frame.wait()
+    assert list(frame.dtypes) == [np.int64, np.int64, np.int64] # all that the first rows show
+    early = frame.read(0, 100)
+    assert list(early.dtypes) == list(frame.dtypes)
+    late = frame.read(2400, 2800)
+    assert list(frame.dtypes) == [np.dtype(np.int64), np.dtype(np.float64), np.dtype(object)]
+    for start, stop in [(0, 100), (2400, 2800), (10, 20)]:
+        window = frame.read(start, stop)
+        assert list(window.dtypes) == list(frame.dtypes)
+    assert np.isnan(late.gap.iloc[100]) and late.code.iloc[300] == 'X1'
+    np.testing.assert_array_equal(frame.read(0, 3000).n.to_numpy(), df.n.to_numpy())
+
+
+def test_csv_window_cache_is_bounded_by_bytes(tmp_path):
+    path = str(tmp_path / 'rows.csv')
+    pd.DataFrame({'n': np.arange(10000), 'word': ['w' * 50] * 10000}).to_csv(path, index=False)
+    frame = IndexedCsvFrame(path, save_index=False, max_cache_bytes=200000)
+    frame.wait()
+    for start in range(0, 10000, 500):
+        assert frame.read(start, start + 500).n.iloc[0] == start
+        assert frame._cache_bytes <= 200000
+        assert frame._cache_bytes == sum(nbytes for _, nbytes in frame._windows.values())
+    assert 1 < len(frame._windows) < 20
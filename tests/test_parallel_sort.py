@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dfbrowse import parallel_sort
+from dfbrowse.parallel_sort import parallel_argsort, stable_order
+from dfbrowse.sort_cache import SortPermutationCache
+
+
+def _columns():
+    rng = np.random.default_rng(1)
+    floats = rng.integers(0, 100, 50000).astype(float) # plenty of ties
+    floats[rng.choice(len(floats), 5000, replace=False)] = np.nan
+    return {'ints': pd.Series(rng.integers(0, 30, 50000)), 'floats': pd.Series(floats),
+            'times': pd.Series(pd.to_datetime(rng.integers(0, 1000, 50000), unit='s')),
+            'strings': pd.Series(rng.choice(['a', 'b', 'c', None], 50000))}
+
+
+@pytest.mark.parametrize('name', ['ints', 'floats', 'times'])
+@pytest.mark.parametrize('ascending', [True, False])
+def test_parallel_argsort_equals_a_stable_argsort(name, ascending):
+    keys = _columns()[name].to_numpy()
+    keys = keys if ascending else -keys.view(np.int64) if keys.dtype.kind == 'M' else -keys
+    expected = np.argsort(keys, kind='stable')
+    for chunk_rows in (1000, 4096, 30000):
+        np.testing.assert_array_equal(parallel_argsort(keys, chunk_rows=chunk_rows, max_workers=4), expected)
+
+
+@pytest.mark.parametrize('name', ['ints', 'floats', 'times', 'strings'])
+@pytest.mark.parametrize('ascending', [True, False])
+def test_sorting_large_columns_in_parallel_equals_a_single_threaded_sort(name, ascending, monkeypatch):
+    monkeypatch.setattr(parallel_sort, 'PARALLEL_SORT_MIN_ROWS', 0)
+    monkeypatch.setattr(parallel_argsort, '__defaults__', (4096, None)) # several chunks, merged on 4 threads
+    column = _columns()[name]
+    if ascending:
+        expected = column.sort_values(kind='mergesort', na_position='last').index.to_numpy()
+        np.testing.assert_array_equal(stable_order(column, max_workers=4), expected)
+    df = pd.DataFrame({'x': column})
+    na_position = 'last' if ascending else 'first'
+    expected = df.sort_values('x', ascending=ascending, kind='mergesort', na_position=na_position)
+    sorted_view = SortPermutationCache().sort(df, ['x'], ascending, na_position)
+    pd.testing.assert_frame_equal(sorted_view.to_pandas(), expected)
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dfbrowse.indexed_frame import row_view
+from dfbrowse.predicates import MaskCache, compile_predicate
+
+
+def _frame():
+    rng = np.random.default_rng(4)
+    price = rng.random(4000) * 20
+    price[rng.choice(4000, 200, replace=False)] = np.nan
+    return pd.DataFrame({'price': price, 'sym': rng.choice(['AAPL', 'MSFT', 'XOM', 'BRK B'], 4000),
+                         'name': rng.choice(['test_a', 'prod_b', 'test_c', None], 4000),
+                         'when': pd.to_datetime('2024-01-01') + pd.to_timedelta(rng.integers(0, 1000, 4000), unit='h')})
+
+
+CASES = [
+    ('price >= 10', lambda df: df.price >= 10),
+    ('price < 5 or sym == AAPL', lambda df: (df.price < 5) | (df.sym == 'AAPL')),
+    ('price >= 10 and not (sym == AAPL or sym =~ ^X)',
+     lambda df: (df.price >= 10) & ~((df.sym == 'AAPL') | df.sym.str.contains('^X'))),
+    ('sym == "BRK B" and name !~ ^test', lambda df: (df.sym == 'BRK B') & ~df.name.str.contains('^test', na=False)),
+    ('when >= 2024-02-01 and when < 2024-02-10', lambda df: (df.when >= '2024-02-01') & (df.when < '2024-02-10')),
+]
+
+
+@pytest.mark.parametrize('text, expected', CASES)
+def test_compiled_masks_equal_pandas_masks(text, expected):
+    df = _frame()
+    predicate = compile_predicate(text, df)
+    cache = MaskCache()
+    np.testing.assert_array_equal(predicate.mask(df, cache), expected(df).to_numpy(dtype=bool))
+    for positions in (np.flatnonzero(df.price.to_numpy() > 3), np.arange(len(df))[::-7], np.arange(10, 30)):
+        view = row_view(df, positions) # the last is small enough to be evaluated over its own rows
+        np.testing.assert_array_equal(predicate.mask(view, cache), expected(view.to_pandas()).to_numpy(dtype=bool))
+
+
+def test_cached_comparison_bitmaps_are_reused():
+    df = _frame()
+    cache = MaskCache()
+    compile_predicate('price >= 10 and sym == AAPL', df).mask(df, cache)
+    assert (cache.hits, cache.misses) == (0, 2)
+    # a view of the same base, and an edit to one term, only evaluate what changed
+    compile_predicate('price >= 10 and sym == MSFT', df).mask(row_view(df, np.arange(0, len(df), 2)), cache)
+    assert (cache.hits, cache.misses) == (1, 3)
+    packed = cache.packed_mask(df, compile_predicate('price >= 10', df).tree)
+    assert cache.packed_mask(df, compile_predicate('price >= 10', df).tree) is packed
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+from dfbrowse.dataframe_browser import DataframeTableBrowser, MultipleDataframeBrowser
+from dfbrowse.lazy_frame import materialize
+
+
+def _frame():
+    return pd.DataFrame({'a': np.arange(10), 'b': [5, 1, 4, 2, 3, 0, 9, 7, 8, 6]})
+
+
+def _browse(df, *queries, lazy=False):
+    browser = DataframeTableBrowser(df, lazy=lazy)
+    for query in queries:
+        browser.call_browser_func('query', args_str=query)
+    return materialize(browser.df.result if hasattr(browser.df, 'result') else browser.df)
+
+
+def test_chained_query_aggregates_over_remaining_rows():
+    df = _frame()
+    expected = df.query('a >= 5').query('b > b.mean()')
+    pd.testing.assert_frame_equal(_browse(df, 'a >= 5', 'b > b.mean()'), expected)
+
+
+def test_chained_query_with_backticked_column():
+    df = _frame().rename(columns={'b': 'b b'})
+    expected = df.query('a >= 5').query('`b b` < `b b`.max()')
+    pd.testing.assert_frame_equal(_browse(df, 'a >= 5', '`b b` < `b b`.max()'), expected)
+
+
+def test_lazy_plan_keeps_aggregating_queries_in_order():
+    df = _frame()
+    expected = df.query('a >= 5').query('b > b.mean()')
+    pd.testing.assert_frame_equal(_browse(df, 'a >= 5', 'b > b.mean()', lazy=True), expected)
+
+
+def test_lazy_plan_filters_after_sort_that_precedes_them():
+    df = _frame()
+    browser = DataframeTableBrowser(df, lazy=True)
+    browser.call_browser_func('sort_descending_on_columns', args_str='b')
+    browser.call_browser_func('query', args_str='a > a.shift(1)')
+    expected = df.sort_values('b', ascending=False, kind='mergesort')
+    expected = expected[expected.a > expected.a.shift(1)]
+    pd.testing.assert_frame_equal(materialize(browser.df.result), expected)
+
+
+def test_lazy_plan_merges_row_wise_queries():
+    df = _frame()
+    browser = DataframeTableBrowser(df, lazy=True)
+    for query in ('a >= 2', 'b < 8', '(a < 9) and (b != 3)'):
+        browser.call_browser_func('query', args_str=query)
+    assert len(browser.df.explain()) == 1
+    pd.testing.assert_frame_equal(materialize(browser.df.result), df.query('a >= 2 and b < 8 and a < 9 and b != 3'))
+
+
+def test_lazy_mode_from_add_df_plans_query_then_sort_like_eager(headless_frame):
+    df = pd.DataFrame({'a': np.arange(1000) % 17, 'b': np.random.rand(1000)})
+    mb = MultipleDataframeBrowser(table_browser_frame=headless_frame)
+    results = list()
+    for lazy in (True, False):
+        browser = mb.get_browser(mb.add_df(df, lazy=lazy))
+        browser.call_browser_func('query', args_str='b > 0.25')
+        browser.call_browser_func('sort_descending_on_columns', args_str='a')
+        results.append(browser.df)
+    planned, eager = results
+    assert len(planned.explain()) == 2 and not planned.executed
+    pd.testing.assert_frame_equal(materialize(planned.result), materialize(eager))
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dfbrowse import search_index
+from dfbrowse.chunk_search_utils import search_column_values
+from dfbrowse.dataframe_browser import DataframeTableBrowser
+from dfbrowse.search_index import IncrementalSearch, MatchSet
+
+
+def _column(kind='strings'):
+    rng = np.random.default_rng(5)
+    words = np.array(['apple', 'Banana', 'cherry pie', 'grape', 'PineApple', 'fig'])
+    values = pd.Series(rng.choice(words, 5000), dtype=object)
+    values[rng.choice(5000, 300, replace=False)] = None
+    return values.astype('category') if kind == 'categories' else values
+
+
+def _naive_hits(column, query, case_insensitive=False, regex=False):
+    return np.flatnonzero(column.astype(object).str.contains(query, case=not case_insensitive, regex=regex,
+                                                             na=False).to_numpy(dtype=bool))
+
+
+@pytest.mark.parametrize('kind', ['strings', 'categories'])
+@pytest.mark.parametrize('query, case_insensitive, mode', [('apple', False, 'substring'), ('apple', True, 'substring'),
+                                                           ('e p', False, 'substring'), ('^[BP]', False, 'regex'),
+                                                           ('nothing', False, 'substring')])
+def test_block_search_finds_what_str_contains_does(kind, query, case_insensitive, mode):
+    column = _column(kind)
+    hits = _naive_hits(column, query, case_insensitive, regex=mode == 'regex')
+    for starting_row in (0, 17, 2500, 4999):
+        below, above = hits[hits >= starting_row], hits[hits <= starting_row]
+        assert search_column_values(column, query, starting_row, True, mode, case_insensitive, block_rows=256) == \
+            (int(below[0]) if len(below) else None)
+        assert search_column_values(column, query, starting_row, False, mode, case_insensitive, block_rows=256) == \
+            (int(above[-1]) if len(above) else None)
+
+
+def test_numeric_columns_match_numbers_and_ranges_by_value():
+    column = pd.Series(np.arange(5000) % 97, dtype=float)
+    assert search_column_values(column, '42', 100, block_rows=256) == 42 + 97
+    assert search_column_values(column, '90..', 0, block_rows=256) == 90
+
+
+def test_incremental_searches_narrow_to_what_str_contains_finds():
+    column = _column()
+    search = IncrementalSearch()
+    match_sets = list()
+    for query in ('p', 'pi', 'pie', 'pi', 'pin', 'Pin'): # typing, with a backspace and a change of case
+        case_insensitive = query.islower()
+        match_set = search.match_set(query, case_insensitive, len(column))
+        hits = _naive_hits(column, query, case_insensitive)
+        assert match_set.find(column, 0) == (int(hits[0]) if len(hits) else None)
+        np.testing.assert_array_equal(match_set.all_positions(column), hits)
+        match_sets.append(match_set)
+    assert match_sets[3] is match_sets[1] # backspace goes back to the answer for 'pi'
+
+
+def test_narrowing_only_looks_at_the_rows_that_matched_before(monkeypatch):
+    column = _column()
+    broad = MatchSet('p', True, len(column), block_rows=256)
+    broad.all_positions(column)
+    looked_at = list()
+    match_mask = search_index.match_mask
+    monkeypatch.setattr(search_index, 'match_mask', lambda values, *args: looked_at.append(len(values)) or
+                        match_mask(values, *args))
+    narrow = broad.narrow('pie', True)
+    np.testing.assert_array_equal(narrow.all_positions(column), _naive_hits(column, 'pie', True))
+    assert sum(looked_at) == len(_naive_hits(column, 'p', True))
+
+
+@pytest.mark.parametrize('query, mode', [('apple', 'substring'), ('APPLE', 'substring'), ('^[BP]', 'regex'),
+                                         ('nothing', 'substring')])
+def test_find_all_counts_and_steps_through_every_hit(query, mode):
+    df = pd.DataFrame({'fruit': _column(), 'n': np.arange(5000) % 97})
+    browser = DataframeTableBrowser(df)
+    hits = _naive_hits(df.fruit, query, query.islower(), regex=mode == 'regex')
+    match_index = browser.view.prepare_find_all('fruit', query, case_insensitive=None, mode=mode)()
+    assert len(match_index) == len(hits)
+    np.testing.assert_array_equal(match_index.positions, hits)
+    assert [match_index.hit_number(row) for row in hits] == list(range(1, len(hits) + 1))
+    browser.view.match_index = match_index
+    visited = list()
+    while browser.next_match():
+        visited.append(browser.selected_row)
+    np.testing.assert_array_equal(visited, hits[hits > 0]) # row 0 is selected to begin with, so it is skipped
+    numbers = browser.view.prepare_find_all('n', '10..12')()
+    np.testing.assert_array_equal(numbers.positions, np.flatnonzero(df.n.between(10, 12)))
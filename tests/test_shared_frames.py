@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from dfbrowse.dataframe_browser_functions import eval_rows
+from dfbrowse.indexed_frame import IndexedFrame, row_view
+from dfbrowse.shared_frames import run_row_wise
+
+
+def _view():
+    df = pd.DataFrame({'a': np.arange(1000), 'b': np.random.rand(1000)}, index=np.arange(1000) * 10 + 7)
+    return df, row_view(df, np.arange(1000)[::-3])
+
+
+@pytest.mark.parametrize('max_workers', [1, 2])
+def test_row_wise_results_keep_the_views_labels(max_workers):
+    df, view = _view()
+    expected = df.iloc[view.positions]
+    result = run_row_wise(view, eval_rows, max_workers=max_workers, min_rows=0, args_str='df.assign(c=df.a * 2)',
+                          cn='a')
+    pd.testing.assert_frame_equal(result, expected.assign(c=expected.a * 2))
+    kept = run_row_wise(view, eval_rows, max_workers=max_workers, min_rows=0, args_str='df[df.b > 0.5]', cn='a')
+    pd.testing.assert_frame_equal(kept.to_pandas(), expected[expected.b > 0.5])
+
+
+def test_a_view_is_only_materialized_once(monkeypatch):
+    df, view = _view()
+    calls = list()
+    to_pandas = IndexedFrame.to_pandas
+    monkeypatch.setattr(IndexedFrame, 'to_pandas', lambda self: calls.append(self) or to_pandas(self))
+    run_row_wise(view, eval_rows, max_workers=1, args_str='df.assign(c=df.a * 2)', cn='a')
+    assert len(calls) == 1
+
+
+def test_worker_processes_do_not_wipe_the_debug_log(tmp_path):
+    script = '''
+import multiprocessing
+from dfbrowse.gui_debug import print
+
+def work():
+    from dfbrowse.gui_debug import print
+    print('from the worker')
+
+if __name__ == '__main__':
+    print('before the worker')
+    worker = multiprocessing.get_context('spawn').Process(target=work)
+    worker.start()
+    worker.join()
+    print('after the worker')
+'''
+    (tmp_path / 'script.py').write_text(script)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([os.getcwd()] + sys.path))
+    env.pop('DFBROWSE_DEBUG_LOG', None)
+    subprocess.run([sys.executable, 'script.py'], cwd=tmp_path, env=env, check=True)
+    lines = (tmp_path / 'debug.log').read_text().split('\n')
+    assert [line for line in lines if 'worker' in line] == ['before the worker', 'from the worker', 'after the worker']
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dfbrowse.indexed_frame import row_view
+from dfbrowse.sort_cache import SortPermutationCache
+
+
+def _frame():
+    rng = np.random.default_rng(2)
+    b = rng.integers(0, 20, 5000).astype(float)
+    b[rng.choice(5000, 300, replace=False)] = np.nan
+    return pd.DataFrame({'a': rng.integers(0, 10, 5000), 'b': b, 'c': rng.choice(['x', 'y', 'z'], 5000)},
+                        index=np.arange(5000) * 3)
+
+
+def _views(sort_cache):
+    df = _frame()
+    by_a = sort_cache.sort(df, ['a'])
+    return [df,
+            row_view(df, np.flatnonzero(df.a.to_numpy() > 3)), # a filter, in base order
+            row_view(df, np.arange(len(df))[::-2]), # rows out of base order
+            by_a, # a sort we produced, which then sorts again in either direction
+            sort_cache.sort(df, ['b'], ascending=False, na_position='first'),
+            row_view(by_a, np.arange(0, len(by_a), 3))]
+
+
+@pytest.mark.parametrize('columns', [['a'], ['b'], ['c'], ['b', 'a'], ['c', 'b']])
+@pytest.mark.parametrize('ascending', [True, False])
+@pytest.mark.parametrize('na_position', ['first', 'last'])
+def test_cached_sorts_equal_sort_values(columns, ascending, na_position):
+    sort_cache = SortPermutationCache()
+    for view in _views(sort_cache):
+        table = view if isinstance(view, pd.DataFrame) else view.to_pandas()
+        expected = table.sort_values(columns, ascending=ascending, kind='mergesort', na_position=na_position)
+        result = sort_cache.sort(view, columns, ascending, na_position)
+        pd.testing.assert_frame_equal(result.to_pandas(), expected)
+
+
+def test_sorting_again_reuses_the_cached_order():
+    sort_cache = SortPermutationCache()
+    df = _frame()
+    sort_cache.sort(df, ['b'])
+    cached = sort_cache._column_order(df, 'b')
+    sort_cache.sort(row_view(df, np.arange(0, len(df), 2)), ['b'], ascending=False)
+    assert sort_cache._column_order(df, 'b') is cached
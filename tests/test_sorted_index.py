@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dfbrowse.dataframe_utils import convert_df_date_cols, df_filter_date_range
+from dfbrowse.indexed_frame import row_view
+from dfbrowse.lazy_frame import materialize
+from dfbrowse.sort_cache import SortPermutationCache
+from dfbrowse.sorted_index import first_row_at_least
+
+
+def _naive_first_at_least(df, column_name, value):
+    hits = np.flatnonzero((materialize(df)[column_name] >= value).to_numpy())
+    return int(hits[0]) if len(hits) else None
+
+
+def _tables():
+    rng = np.random.default_rng(0)
+    unsorted = pd.DataFrame({'x': rng.integers(0, 50, 2000).astype(float)})
+    unsorted.loc[rng.choice(2000, 100, replace=False), 'x'] = np.nan
+    in_order = pd.DataFrame({'x': np.sort(rng.integers(0, 50, 2000))})
+    return unsorted, in_order
+
+
+@pytest.mark.parametrize('value', [-1, 0, 17, 25.5, 49, 50])
+def test_first_row_at_least_matches_a_scan(value):
+    unsorted, in_order = _tables()
+    sort_cache = SortPermutationCache()
+    tables = [unsorted, in_order,
+              row_view(in_order, np.flatnonzero(in_order.x % 3 == 0)), # a filter of a column in order
+              row_view(unsorted, np.arange(len(unsorted))[::-3])] # rows out of base order
+    for df in tables:
+        assert first_row_at_least(df, 'x', value, sort_cache) == _naive_first_at_least(df, 'x', value)
+        assert first_row_at_least(df, 'x', value) == _naive_first_at_least(df, 'x', value)
+    sorted_view = sort_cache.sort(unsorted, ['x'], ascending=False)
+    assert first_row_at_least(sorted_view, 'x', value, sort_cache) == _naive_first_at_least(sorted_view, 'x', value)
+    assert first_row_at_least(unsorted, 'x', value, sort_cache) == _naive_first_at_least(unsorted, 'x', value)
+
+
+def test_an_unsorted_column_is_not_sorted_just_to_jump_once():
+    unsorted, in_order = _tables()
+    sort_cache = SortPermutationCache()
+    first_row_at_least(unsorted, 'x', 10, sort_cache)
+    assert not sort_cache.has_order(unsorted, 'x')
+    first_row_at_least(row_view(in_order, np.arange(0, 2000, 2)), 'x', 10, sort_cache)
+    assert sort_cache.has_order(in_order, 'x') # in order already, so its index costs no sort
+
+
+def test_converted_date_columns_filter_by_binary_search():
+    times = pd.date_range('2024-01-02 09:30', periods=1000, freq='min')
+    df = pd.DataFrame({'t': times.strftime('%Y-%m-%d %H:%M'), 'v': np.arange(1000)})
+    sort_cache = SortPermutationCache()
+    convert_df_date_cols(df, ['t'], sort_cache)
+    assert sort_cache.has_order(df, 't')
+    start, end = pd.Timestamp('2024-01-02 14:32'), pd.Timestamp('2024-01-02 15:00')
+    pd.testing.assert_frame_equal(df_filter_date_range(df, 't', start, end, sort_cache),
+                                  df[(df.t >= start) & (df.t <= end)])
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dfbrowse.dataframe_browser import DataframeTableBrowser
+from dfbrowse.lazy_frame import materialize
+
+
+def _frame():
+    rng = np.random.default_rng(3)
+    b = rng.integers(0, 40, 3000).astype(float) # many ties at any cutoff
+    b[rng.choice(3000, 200, replace=False)] = np.nan
+    return pd.DataFrame({'a': rng.integers(0, 15, 3000), 'b': b, 't': pd.to_datetime(rng.integers(0, 500, 3000),
+                                                                                       unit='D')})
+
+
+def _extreme(function_name, df, column, n, query=None):
+    browser = DataframeTableBrowser(df)
+    if query:
+        browser.call_browser_func('query', args_str=query)
+    browser.selected_column = column
+    browser.call_browser_func(function_name, args_str=str(n))
+    return materialize(browser.df)
+
+
+@pytest.mark.parametrize('column', ['a', 'b', 't'])
+@pytest.mark.parametrize('n', [1, 7, 100, 2799])
+def test_top_and_bottom_n_equal_nlargest_and_nsmallest(column, n):
+    df = _frame()
+    pd.testing.assert_frame_equal(_extreme('top_n', df, column, n), df.nlargest(n, column, keep='first'))
+    pd.testing.assert_frame_equal(_extreme('bottom_n', df, column, n), df.nsmallest(n, column, keep='first'))
+    filtered = df.query('a > 4')
+    pd.testing.assert_frame_equal(_extreme('top_n', df, column, n, query='a > 4'),
+                                  filtered.nlargest(n, column, keep='first'))
+
+
+def test_n_beyond_the_values_there_are_puts_missing_ones_last():
+    df = _frame()
+    expected = df.sort_values('b', ascending=False, kind='mergesort', na_position='last').head(2900)
+    pd.testing.assert_frame_equal(_extreme('top_n', df, 'b', 2900), expected)
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from dfbrowse.urwid_utils import ColumnWidthIndex
+
+
+def _span(widths, gap, left, right):
+    return sum(widths[left:right + 1]) + gap * (right - left)
+
+
+def _naive_rightmost_visible(widths, gap, left, maxcol):
+    right = left
+    while right + 1 < len(widths) and _span(widths, gap, left, right + 1) <= maxcol:
+        right += 1
+    return right
+
+
+def _naive_leftmost_for(widths, gap, right, maxcol):
+    left = right
+    while left > 0 and _span(widths, gap, left - 1, right) <= maxcol:
+        left -= 1
+    return left
+
+
+def _naive_column_at(widths, gap, left, x):
+    for idx in range(left, len(widths)):
+        x -= widths[idx] + gap
+        if x < 0:
+            return idx
+    return len(widths) - 1
+
+
+@pytest.mark.parametrize('gap', [0, 1, 3])
+def test_visible_ranges_match_walking_over_the_columns(gap):
+    rng = np.random.default_rng(7)
+    widths = [int(w) for w in rng.integers(1, 40, 60)]
+    widths[10] = 500 # wider than the screen on its own
+    index = ColumnWidthIndex(widths, gap)
+    assert len(index) == len(widths)
+    assert [index.width(i) for i in range(len(widths))] == widths
+    for maxcol in (1, 20, 80, 250, 10000):
+        for col in range(len(widths)):
+            assert index.rightmost_visible(col, maxcol) == _naive_rightmost_visible(widths, gap, col, maxcol)
+            assert index.leftmost_for(col, maxcol) == _naive_leftmost_for(widths, gap, col, maxcol)
+    for left in (0, 9, 10, 59):
+        for x in range(0, 700, 7):
+            assert index.column_at(left, x) == _naive_column_at(widths, gap, left, x)
+
+
+def test_changing_a_width_moves_every_later_column():
+    widths = [5, 8, 13, 2, 40]
+    index = ColumnWidthIndex(widths, 1)
+    for idx, width in [(1, 20), (4, 3), (0, 1), (2, 13)]:
+        index.set_width(idx, width)
+        widths[idx] = width
+        np.testing.assert_array_equal(index.starts, np.concatenate([[0], np.cumsum(np.array(widths) + 1)]))
+        for maxcol in (10, 30, 60):
+            assert index.rightmost_visible(0, maxcol) == _naive_rightmost_visible(widths, 1, 0, maxcol)